@@ -0,0 +1,73 @@
+"""
+Compare flow-generation throughput of the native reader, tshark field extraction and pyshark.
+
+Usage (from the "Basic Structure" directory):
+    python bench/compare_readers.py capture.pcap [--backends native tshark pyshark]
+
+Each backend parses the same file; speedups are relative to the last
+backend listed, and every backend's flows are checked against the first.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.flows import BACKENDS, generate_flows  # noqa: E402
+from core.pcap import UnsupportedCapture, iter_packets  # noqa: E402
+
+
+def snapshot(flows) -> set:
+    """
+    Flows as comparable tuples (timestamps to the microsecond, since
+    tshark prints them as text).
+    """
+    return {
+        (key, flow.packet_count, flow.byte_count,
+         round(flow.start_time, 6), round(flow.end_time, 6))
+        for key, flow in flows.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pcap")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["native", "tshark", "pyshark"],
+        choices=[b for b in BACKENDS if b != "auto"],
+    )
+    args = parser.parse_args()
+
+    try:
+        packets = sum(1 for _ in iter_packets(args.pcap))
+    except UnsupportedCapture:
+        packets = None
+    results = {}
+    reference = None
+
+    for backend in args.backends:
+        started = time.perf_counter()
+        flows = generate_flows(args.pcap, backend=backend)
+        elapsed = time.perf_counter() - started
+
+        flow_set = snapshot(flows)
+        if reference is None:
+            reference = flow_set
+        results[backend] = (elapsed, len(flows), flow_set == reference)
+
+    slowest = results[args.backends[-1]][0]
+    print(f"\n{packets if packets is not None else '?'} packets in {args.pcap}")
+    print(f"  {'backend':<8} {'seconds':>9} {'pkts/sec':>12} {'speedup':>8} {'flows':>8}  identical")
+    for backend, (elapsed, flow_count, identical) in results.items():
+        rate = f"{packets / max(elapsed, 1e-9):,.0f}" if packets is not None else "-"
+        print(
+            f"  {backend:<8} {elapsed:>8.3f}s {rate:>12} "
+            f"{slowest / max(elapsed, 1e-9):>7.1f}x {flow_count:>8}  {identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Measure flow-generation scaling across worker processes.
+
+Usage (from the "Basic Structure" directory):
+    python bench/scale_workers.py capture.pcap [--max-workers N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.flows import generate_flows  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pcap")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    counts = sorted({1, *[2 ** i for i in range(1, 8)], args.max_workers})
+    counts = [n for n in counts if n <= args.max_workers]
+
+    baseline = None
+    reference = None
+
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}  identical")
+    for workers in counts:
+        started = time.perf_counter()
+        flows = generate_flows(args.pcap, backend="native", workers=workers)
+        elapsed = time.perf_counter() - started
+
+        snapshot = [
+            (key, flow.packet_count, flow.byte_count, flow.start_time, flow.end_time)
+            for key, flow in flows.items()
+        ]
+        if reference is None:
+            baseline, reference = elapsed, snapshot
+
+        print(
+            f"{workers:>8} {elapsed:>9.3f} {baseline / elapsed:>7.2f}x  "
+            f"{snapshot == reference}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Benchmark flow generation, the rules and feature extraction on synthetic captures.
+
+Usage (from the "Basic Structure" directory):
+    python bench/suite.py [--scales 10k 100k 1M] [--save-baseline]
+
+Each stage (flows, rules, features, end_to_end) runs in a fresh process
+per scale so its peak RSS is its own. Results are compared with a saved
+baseline JSON: a stage that is slower or uses more memory than the
+baseline by more than the tolerance fails the run (exit status 1), as
+does an end-to-end run that misses or adds detections. Peak RSS is
+reported as n/a (and not compared) where the resource module is missing,
+e.g. on Windows.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from bench.synthetic import (  # noqa: E402
+    EXPECTED_ALERTS, GENERATOR_VERSION, cached_capture, parse_count
+)
+
+STAGES = ("flows", "rules", "features", "end_to_end")
+DEFAULT_SCALES = ("10k", "100k", "1M")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "ids-bench")
+
+# Slowdowns smaller than this are timer noise, whatever the percentage
+NOISE_SECONDS = 0.005
+
+
+# -----------------------------
+# Stages (run in a child process)
+# -----------------------------
+
+def _run_stage(stage: str, pcap: str, repeat: int) -> Dict:
+    """
+    Best-of-``repeat`` time of one stage. Rules and features time only
+    their own call; the flows they need are built first, untimed.
+    """
+    from core.anomaly import peak_memory_mb
+    from core.engine import run_detection
+    from core.features import extract_features
+    from core.flows import generate_flows
+    from core.ruleengine import run_rules
+    import core.rules  # noqa: F401  (registers the built-in rules)
+
+    result: Dict = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        flows = None if stage in ("flows", "end_to_end") else generate_flows(pcap, backend="native")
+
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            if stage == "flows":
+                flows = generate_flows(pcap, backend="native")
+            elif stage == "rules":
+                run_rules(flows)
+            elif stage == "features":
+                extract_features(flows)
+            else:
+                alerts = run_detection(pcap, use_cache=False)
+                result["alerts"] = dict(Counter(alert["type"] for alert in alerts))
+            best = min(best, time.perf_counter() - started)
+
+    result["seconds"] = best
+    result["peak_rss_mb"] = peak_memory_mb()
+    if flows is not None:
+        result["flows"] = len(flows)
+    return result
+
+
+# -----------------------------
+# Baseline comparison
+# -----------------------------
+
+def _regressions(results: Dict, baseline: Dict, tolerance: float, rss_tolerance: float) -> List[str]:
+    failures = []
+    for scale, stages in results.items():
+        for stage, now in stages.items():
+            before = baseline.get(scale, {}).get(stage)
+            if before is None:
+                continue
+            if now["seconds"] > before["seconds"] * (1 + tolerance) + NOISE_SECONDS:
+                failures.append(
+                    f"{scale} {stage}: {now['seconds']:.3f}s vs baseline "
+                    f"{before['seconds']:.3f}s (+{now['seconds'] / before['seconds'] - 1:.0%})"
+                )
+            if (
+                now["peak_rss_mb"] is not None
+                and before["peak_rss_mb"] is not None
+                and now["peak_rss_mb"] > before["peak_rss_mb"] * (1 + rss_tolerance)
+            ):
+                failures.append(
+                    f"{scale} {stage}: peak RSS {now['peak_rss_mb']:.0f} MB vs baseline "
+                    f"{before['peak_rss_mb']:.0f} MB"
+                )
+    return failures
+
+
+def _environment() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "generator_version": GENERATOR_VERSION,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=list(DEFAULT_SCALES),
+                        help="Capture sizes in packets, e.g. 10k 1M 10M")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Where generated captures are kept between runs")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown before a stage fails (0.25 = 25%%)")
+    parser.add_argument("--rss-tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="Also write the results JSON here")
+    args = parser.parse_args()
+
+    # Fresh interpreter per stage, so ru_maxrss starts from scratch
+    context = multiprocessing.get_context("spawn")
+    results: Dict[str, Dict] = {}
+    wrong_alerts: List[str] = []
+
+    print(
+        f"{'scale':>6} {'stage':<11} {'seconds':>9} {'pkts/sec':>12} "
+        f"{'flows/sec':>12} {'peak RSS':>9}"
+    )
+    for scale in args.scales:
+        packets = parse_count(scale)
+        pcap = cached_capture(args.data_dir, packets, args.seed)
+        results[scale] = {}
+
+        for stage in args.stages:
+            with context.Pool(1) as pool:
+                measured = pool.apply(_run_stage, (stage, pcap, args.repeat))
+
+            seconds = measured["seconds"]
+            measured["packets"] = packets
+            measured["packets_per_sec"] = packets / max(seconds, 1e-9)
+            if "flows" in measured:
+                measured["flows_per_sec"] = measured["flows"] / max(seconds, 1e-9)
+            results[scale][stage] = measured
+
+            if "alerts" in measured and measured["alerts"] != EXPECTED_ALERTS:
+                wrong_alerts.append(
+                    f"{scale}: alerts {measured['alerts']}, expected {EXPECTED_ALERTS}"
+                )
+
+            flows_per_sec = measured.get("flows_per_sec")
+            peak = measured["peak_rss_mb"]
+            print(
+                f"{scale:>6} {stage:<11} {seconds:>9.3f} "
+                f"{measured['packets_per_sec']:>12,.0f} "
+                f"{'-' if flows_per_sec is None else f'{flows_per_sec:,.0f}':>12} "
+                f"{'n/a' if peak is None else f'{peak:.0f} MB':>9}"
+            )
+
+    report = {"environment": _environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        failures = []
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as saved:
+            baseline = json.load(saved)
+        if baseline["environment"] != report["environment"]:
+            print("\nNote: baseline was recorded in a different environment")
+        failures = _regressions(results, baseline["results"], args.tolerance, args.rss_tolerance)
+    else:
+        print(f"\nNo baseline at {args.baseline} (record one with --save-baseline)")
+        failures = []
+
+    failures += wrong_alerts
+    if failures:
+        print("\nFAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
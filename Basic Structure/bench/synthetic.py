@@ -0,0 +1,222 @@
+"""
+Generate a deterministic synthetic capture for benchmarks.
+
+Usage (from the "Basic Structure" directory):
+    python bench/synthetic.py out.pcap [--packets 1M] [--seed 0]
+
+Benign client/server sessions are mixed with two port scans, an SSH and
+an RDP brute force and one SYN flood, sized so the built-in rules raise
+EXPECTED_ALERTS at every scale from 10k packets up. The same packet
+count and seed always produce the same bytes.
+
+``--labels`` also writes the injected attacks as JSON lines, for
+``ids tune --labels``.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+# Bump when the generated traffic changes, so cached captures are rebuilt
+GENERATOR_VERSION = 1
+
+EXPECTED_ALERTS: Dict[str, int] = {"PORT_SCAN": 2, "BRUTE_FORCE": 2, "FLOOD": 1}
+
+# Packets per second, lowered for small captures so they still span 2s
+RATE = 20_000
+START_TIME = 1_700_000_000
+CHUNK = 1 << 20
+
+# Ethernet + IPv4 + first 20 bytes of TCP / UDP; the rest is "payload"
+# that only shows up in orig_len
+SNAP = 54
+
+_RECORD = np.dtype([
+    ("ts_sec", "<u4"), ("ts_usec", "<u4"), ("incl_len", "<u4"), ("orig_len", "<u4"),
+    ("dst_mac", "V6"), ("src_mac", "V6"), ("ethertype", ">u2"),
+    ("ver_ihl", "u1"), ("tos", "u1"), ("ip_len", ">u2"), ("ip_id", ">u2"),
+    ("frag", ">u2"), ("ttl", "u1"), ("proto", "u1"), ("ip_sum", ">u2"),
+    ("src_ip", ">u4"), ("dst_ip", ">u4"),
+    ("src_port", ">u2"), ("dst_port", ">u2"), ("l4_rest", "V16"),
+])
+
+BENIGN, SCAN_A, SCAN_B, BRUTE_SSH, BRUTE_RDP, FLOOD = range(6)
+
+
+def _ip(text: str) -> int:
+    a, b, c, d = (int(part) for part in text.split("."))
+    return a << 24 | b << 16 | c << 8 | d
+
+
+def _text(address: int) -> str:
+    return ".".join(str(address >> shift & 0xFF) for shift in (24, 16, 8, 0))
+
+
+# kind: (src, dst, dst_port or None, share, window start, window length cap)
+# Shares are of all packets inside the window; window length is also
+# capped at 30% of the capture. The flood runs for the whole capture.
+_ATTACKS = {
+    SCAN_A: (_ip("198.51.100.7"), _ip("10.2.0.10"), None, 0.01, 0.10, 30.0),
+    SCAN_B: (_ip("198.51.100.8"), _ip("10.2.0.11"), None, 0.01, 0.40, 30.0),
+    BRUTE_SSH: (_ip("203.0.113.22"), _ip("10.2.0.22"), 22, 0.01, 0.20, 20.0),
+    BRUTE_RDP: (_ip("203.0.113.33"), _ip("10.2.0.33"), 3389, 0.01, 0.60, 20.0),
+    FLOOD: (_ip("203.0.113.66"), _ip("10.2.0.80"), 80, 0.15, 0.0, None),
+}
+
+_BENIGN_PORTS = np.array([80, 443, 53, 123], dtype=np.uint16)
+_BENIGN_PROTOS = np.array([6, 6, 17, 17], dtype=np.uint8)
+
+
+def parse_count(text: str) -> int:
+    """
+    "10k" / "1M" / "2500" -> packet count.
+    """
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _chunk(first: int, size: int, packets: int, seed: int) -> np.ndarray:
+    """
+    Records for packets [first, first + size) of a ``packets`` capture.
+    """
+    rng = np.random.default_rng([seed, first])
+    rate = min(RATE, packets / 2)
+    duration = packets / rate
+
+    index = np.arange(first, first + size, dtype=np.int64)
+    seconds = index / rate
+
+    kinds = np.full(size, BENIGN, dtype=np.uint8)
+    draw = rng.random(size)
+    for kind, (_, _, _, share, start, length) in _ATTACKS.items():
+        begin = start * duration
+        end = duration if length is None else begin + min(length, 0.3 * duration)
+        # Attack shares are disjoint slices of the same uniform draw
+        low = sum(_ATTACKS[k][3] for k in _ATTACKS if k < kind)
+        inside = (seconds >= begin) & (seconds < end)
+        kinds[inside & (draw >= low) & (draw < low + share)] = kind
+
+    records = np.zeros(size, dtype=_RECORD)
+    records["ts_sec"] = START_TIME + seconds.astype(np.int64)
+    records["ts_usec"] = np.round((seconds % 1) * 1e6).astype(np.uint32) % 1_000_000
+    records["incl_len"] = SNAP
+    records["ethertype"] = 0x0800
+    records["ver_ihl"] = 0x45
+    records["ttl"] = 64
+    records["ip_id"] = index & 0xFFFF
+
+    # Benign: sessions of ~20 packets, ~8 sessions per client, 40% replies
+    sessions = max(packets // 20, 1)
+    clients = max(sessions // 8, 1)
+    sid = rng.integers(0, sessions, size)
+    service = sid % len(_BENIGN_PORTS)
+    client = _ip("10.1.0.0") + (sid % clients) % 65536
+    server = _ip("10.2.1.0") + (sid * 7) % 254 + 1
+    client_port = 1024 + (sid * 40503) % 60000
+    server_port = _BENIGN_PORTS[service]
+    reply = rng.random(size) < 0.4
+
+    src = np.where(reply, server, client)
+    dst = np.where(reply, client, server)
+    sport = np.where(reply, server_port, client_port)
+    dport = np.where(reply, client_port, server_port)
+    proto = _BENIGN_PROTOS[service].copy()
+    payload = rng.integers(0, 1400, size)
+
+    for kind, (attacker, target, port, _, _, _) in _ATTACKS.items():
+        mask = kinds == kind
+        src[mask] = attacker
+        dst[mask] = target
+        proto[mask] = 6
+        payload[mask] = 0
+        sport[mask] = 40000 + index[mask] % 20000
+        if port is None:
+            # Scans sweep the low ports in a scrambled order
+            dport[mask] = 1 + (index[mask] * 7919) % 1024
+        else:
+            dport[mask] = port
+
+    records["src_ip"] = src
+    records["dst_ip"] = dst
+    records["src_port"] = sport
+    records["dst_port"] = dport
+    records["proto"] = proto
+    records["ip_len"] = 40 + payload
+    records["orig_len"] = SNAP + payload
+    return records
+
+
+def generate_capture(path: str, packets: int, seed: int = 0) -> str:
+    """
+    Write a ``packets``-long synthetic Ethernet pcap to ``path``.
+    """
+    header = np.array(
+        [(0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)],
+        dtype=[("magic", "<u4"), ("major", "<u2"), ("minor", "<u2"),
+               ("zone", "<i4"), ("sigfigs", "<u4"), ("snaplen", "<u4"),
+               ("network", "<u4")]
+    )
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as out:
+        header.tofile(out)
+        for first in range(0, packets, CHUNK):
+            _chunk(first, min(CHUNK, packets - first), packets, seed).tofile(out)
+    os.replace(tmp, path)
+    return path
+
+
+def attack_labels() -> List[Dict]:
+    """
+    The injected attacks, with the fields their alerts carry.
+    """
+    types = {
+        SCAN_A: "PORT_SCAN", SCAN_B: "PORT_SCAN",
+        BRUTE_SSH: "BRUTE_FORCE", BRUTE_RDP: "BRUTE_FORCE",
+        FLOOD: "FLOOD",
+    }
+    labels = []
+    for kind, (attacker, target, port, _, _, _) in _ATTACKS.items():
+        label = {"type": types[kind], "src_ip": _text(attacker)}
+        if kind != FLOOD:
+            label["dst_ip"] = _text(target)
+        if types[kind] == "BRUTE_FORCE":
+            label["dst_port"] = port
+        labels.append(label)
+    return labels
+
+
+def cached_capture(directory: str, packets: int, seed: int = 0) -> str:
+    """
+    Path of the synthetic capture for (packets, seed), generated on first use.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory, f"synthetic-v{GENERATOR_VERSION}-{packets}-s{seed}.pcap"
+    )
+    if not os.path.exists(path):
+        generate_capture(path, packets, seed)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--packets", type=parse_count, default=parse_count("1M"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--labels", help="Also write the injected attacks to this JSONL file")
+    args = parser.parse_args()
+
+    generate_capture(args.output, args.packets, args.seed)
+    print(f"Wrote {args.packets} packets to {args.output}", file=sys.stderr)
+    if args.labels:
+        with open(args.labels, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(label) + "\n" for label in attack_labels())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Fan live flow-rate snapshots out to many local WebSocket clients.
+
+Usage (from the "Basic Structure" directory):
+    python bench/ws_fanout.py capture.pcap [--clients 50] [--ticks 100] [--interval 0.05] [--churn 0.05]
+
+Starts a core.broadcast server on a free local port, connects ``--clients``
+snapshot clients and as many delta clients, plus one slow client of each
+kind that stalls between reads, and publishes ``--ticks`` windows of the
+capture's flows, ``--churn`` of which change every tick. Reports per-tick
+publish cost, messages and bytes received, and checks that every delta
+client's reconstructed row set equals the final snapshot (up to row Time
+stamps).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.broadcast import Broadcaster  # noqa: E402
+from core.flows import generate_flows  # noqa: E402
+from core.flowtable import FlowTable  # noqa: E402
+
+
+# -----------------------------
+# Minimal WebSocket client
+# -----------------------------
+
+async def connect(port: int, path: str, small_buffer: bool = False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if small_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    # A small reader limit makes a slow client stop reading from the socket
+    limit = 1 << 16 if small_buffer else 1 << 24
+    reader, writer = await asyncio.open_connection(sock=sock, limit=limit)
+
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+        f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode("ascii")
+    )
+    response = await reader.readuntil(b"\r\n\r\n")
+    if b" 101 " not in response.split(b"\r\n", 1)[0]:
+        raise ConnectionError(f"handshake refused: {response[:80]!r}")
+    return reader, writer
+
+
+async def receive(reader: asyncio.StreamReader):
+    first, second = await reader.readexactly(2)
+    size = second & 0x7F
+    if size == 126:
+        size = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif size == 127:
+        size = struct.unpack("!Q", await reader.readexactly(8))[0]
+    return first & 0x0F, await reader.readexactly(size)
+
+
+def untimed(rows):
+    # Deltas skip rows whose only change is the Time stamp
+    return {key: dict(row, Time=None) for key, row in rows.items()}
+
+
+def close_frame() -> bytes:
+    return b"\x88\x80" + os.urandom(4)
+
+
+class Subscriber:
+    def __init__(self, name: str, path: str, delay: float = 0.0):
+        self.name = name
+        self.path = path
+        self.delay = delay
+        self.messages = 0
+        self.bytes = 0
+        self.snapshots = 0
+        self.rows = {}
+        self.last_message = time.monotonic()
+
+    async def run(self, port: int) -> None:
+        reader, writer = await connect(port, self.path, small_buffer=self.delay > 0)
+        while True:
+            try:
+                opcode, payload = await receive(reader)
+            except asyncio.IncompleteReadError:
+                break
+            if opcode == 0x8:
+                writer.write(close_frame())
+                break
+            self.last_message = time.monotonic()
+            self.messages += 1
+            self.bytes += len(payload)
+            message = json.loads(payload)
+            if isinstance(message, dict):
+                if message["type"] == "snapshot":
+                    self.snapshots += 1
+                    self.rows = {row["Key"]: row for row in message["rows"]}
+                else:
+                    for key in message["remove"]:
+                        self.rows.pop(key, None)
+                    for row in message["upsert"]:
+                        self.rows[row["Key"]] = row
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        writer.close()
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+
+def windows(table: FlowTable, count: int, churn: float, seed: int = 1):
+    """
+    ``count`` tables over the capture's flows where, each tick, a
+    ``churn`` fraction of flows goes quiet or changes its byte count.
+    """
+    columns = table.to_columns()
+    base = columns["byte_count"]
+    rng = np.random.default_rng(seed)
+    byte_count = base.copy()
+    for _ in range(count):
+        changed = rng.random(len(base)) < churn
+        byte_count[changed] = base[changed] * rng.integers(0, 4, changed.sum())
+        active = byte_count > 0
+        subset = {name: values[active] for name, values in columns.items()}
+        subset["byte_count"] = byte_count[active]
+        yield FlowTable.from_columns(subset)
+
+
+async def bench(args, table: FlowTable) -> None:
+    broadcaster = Broadcaster(port=0).start()
+    slow = args.interval * 5
+
+    subscribers = (
+        [Subscriber(f"snapshot-{i}", "/") for i in range(args.clients)]
+        + [Subscriber(f"delta-{i}", "/delta") for i in range(args.clients)]
+        + [Subscriber("slow-snapshot", "/", delay=slow),
+           Subscriber("slow-delta", "/delta", delay=slow)]
+    )
+    tasks = [asyncio.ensure_future(s.run(broadcaster.port)) for s in subscribers]
+    await asyncio.sleep(0.5)
+
+    publish_seconds = []
+    for table_window in windows(table, args.ticks, args.churn):
+        started = time.perf_counter()
+        broadcaster.publish(table_window, args.interval)
+        publish_seconds.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval)
+
+    # Let every client, slow ones included, drain what it was sent
+    while time.monotonic() - max(s.last_message for s in subscribers) < slow * 4:
+        await asyncio.sleep(slow)
+
+    final = broadcaster._rows
+    broadcaster.close()
+    await asyncio.wait(tasks, timeout=10)
+
+    print(f"\n{len(table)} flows, {args.ticks} ticks every {args.interval * 1000:.0f} ms, "
+          f"{len(subscribers)} clients")
+    print(f"publish (rows + hand-off): avg {np.mean(publish_seconds) * 1000:.2f} ms, "
+          f"max {np.max(publish_seconds) * 1000:.2f} ms")
+
+    print(f"\n{'client':<16} {'messages':>9} {'KB':>9} {'snapshots':>10}  state")
+    groups = {}
+    for s in subscribers:
+        kind = s.name.rsplit("-", 1)[0] if not s.name.startswith("slow") else s.name
+        groups.setdefault(kind, []).append(s)
+
+    consistent = True
+    for kind, members in groups.items():
+        state = "-"
+        if members[0].path == "/delta":
+            ok = all(untimed(m.rows) == untimed(final) for m in members)
+            consistent &= ok
+            state = "matches" if ok else "DIVERGED"
+        print(
+            f"{kind:<16} {np.mean([m.messages for m in members]):>9.1f} "
+            f"{np.mean([m.bytes for m in members]) / 1024:>9.1f} "
+            f"{np.mean([m.snapshots for m in members]):>10.1f}  {state}"
+        )
+
+    if not consistent:
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pcap")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--churn", type=float, default=0.05, help="Flows changing per tick")
+    args = parser.parse_args()
+
+    table = generate_flows(args.pcap)
+    asyncio.run(bench(args, table))
+
+
+if __name__ == "__main__":
+    main()
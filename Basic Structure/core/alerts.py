@@ -0,0 +1,324 @@
+import json
+import queue
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from rich.console import Console
+
+from core.metrics import METRICS
+from ui.console import print_alert, print_rollup
+
+console = Console()
+
+
+# =====================================================
+# ASYNCHRONOUS ALERT OUTPUT
+# =====================================================
+#
+# Detection hands alerts to an AlertDispatcher, which only enqueues them.
+# A background thread drains the queue in batches and writes each batch
+# to the configured sinks, so a slow terminal can never stall the
+# detection loop.
+#
+# Per-type token buckets limit how many alerts reach the human-facing
+# sinks (console, syslog); the rest are counted per (type, source) and
+# reported as roll-ups ("+4,812 more PORT_SCAN from 10.0.0.5") every
+# ``rollup_interval`` seconds and on close. The JSONL sink is not rate
+# limited: it is the complete machine-readable record.
+
+Rollup = Dict[str, object]
+
+# Per alert type, per second (burst is twice the rate)
+DEFAULT_RATE = 5.0
+
+
+class AlertSink(ABC):
+    """
+    Destination for alert batches. ``rate_limited`` sinks receive only
+    the alerts that passed the rate limiter; the others receive all.
+    """
+
+    rate_limited = True
+
+    @abstractmethod
+    def write(self, alerts: List[Dict], rollups: List[Rollup]) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class ConsoleSink(AlertSink):
+    def write(self, alerts: List[Dict], rollups: List[Rollup]) -> None:
+        for alert in alerts:
+            print_alert(alert)
+        for rollup in rollups:
+            print_rollup(rollup)
+
+
+class JsonlSink(AlertSink):
+    """
+    Appends one JSON object per alert (and per roll-up) to a file.
+    """
+
+    rate_limited = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, alerts: List[Dict], rollups: List[Rollup]) -> None:
+        now = time.time()
+        lines = [
+            json.dumps(dict(alert, reported_at=now), default=str)
+            for alert in alerts
+        ]
+        lines.extend(
+            json.dumps(dict(rollup, type="ROLLUP", reported_at=now), default=str)
+            for rollup in rollups
+        )
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SyslogSink(AlertSink):
+    """
+    RFC 3164 messages over UDP, one datagram per alert, to a local
+    syslog daemon (rsyslog / syslog-ng listening on 127.0.0.1:514).
+    """
+
+    FACILITY_LOCAL0 = 16
+    SEVERITIES = {"CRITICAL": 2, "WARNING": 4}
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 514, tag: str = "ids"):
+        self.address = (host, port)
+        self.tag = tag
+        self.hostname = socket.gethostname()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, severity: int, payload: Dict) -> None:
+        priority = self.FACILITY_LOCAL0 * 8 + severity
+        stamp = time.strftime("%b %d %H:%M:%S")
+        message = (
+            f"<{priority}>{stamp} {self.hostname} {self.tag}: "
+            f"{json.dumps(payload, default=str)}"
+        )
+        try:
+            self._socket.sendto(message.encode("utf-8"), self.address)
+        except OSError:
+            pass  # nobody listening; syslog over UDP is best effort
+
+    def write(self, alerts: List[Dict], rollups: List[Rollup]) -> None:
+        for alert in alerts:
+            severity = str(alert.get("severity", "INFO")).upper()
+            self._send(self.SEVERITIES.get(severity, 6), alert)
+        for rollup in rollups:
+            self._send(6, dict(rollup, type="ROLLUP"))
+
+    def close(self) -> None:
+        self._socket.close()
+
+
+def build_sinks(
+    console_output: bool = True,
+    jsonl_path: Optional[str] = None,
+    syslog_port: Optional[int] = None
+) -> List[AlertSink]:
+    sinks: List[AlertSink] = []
+    if console_output:
+        sinks.append(ConsoleSink())
+    if jsonl_path:
+        sinks.append(JsonlSink(jsonl_path))
+    if syslog_port is not None:
+        sinks.append(SyslogSink(port=syslog_port))
+    return sinks
+
+
+# -----------------------------
+# Rate limiting
+# -----------------------------
+
+class RateLimiter:
+    """
+    Token bucket per alert type; suppressed alerts are counted per
+    (type, src_ip) until drained as roll-ups.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, rates: Optional[Dict[str, float]] = None):
+        self.rate = rate
+        self.rates = rates or {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._suppressed: Dict[Tuple[str, str], int] = {}
+
+    def allow(self, alert: Dict, now: float) -> bool:
+        alert_type = str(alert.get("type", "UNKNOWN"))
+        rate = self.rates.get(alert_type, self.rate)
+        if rate <= 0:
+            return True
+
+        tokens, last = self._buckets.get(alert_type, (2 * rate, now))
+        tokens = min(2 * rate, tokens + (now - last) * rate)
+        if tokens >= 1:
+            self._buckets[alert_type] = (tokens - 1, now)
+            return True
+
+        self._buckets[alert_type] = (tokens, now)
+        key = (alert_type, str(alert.get("src_ip", "-")))
+        self._suppressed[key] = self._suppressed.get(key, 0) + 1
+        return False
+
+    def drain(self) -> List[Rollup]:
+        rollups = [
+            {"alert_type": alert_type, "src_ip": src_ip, "suppressed": count}
+            for (alert_type, src_ip), count in sorted(
+                self._suppressed.items(), key=lambda item: -item[1]
+            )
+        ]
+        self._suppressed.clear()
+        return rollups
+
+
+# -----------------------------
+# Dispatcher
+# -----------------------------
+
+class AlertDispatcher:
+    """
+    Non-blocking alert delivery to ``sinks`` from a background thread.
+
+    submit() never blocks: when more than ``max_queue`` alerts are
+    waiting, new ones are dropped and counted. close() delivers
+    everything queued, flushes roll-ups and closes the sinks.
+    """
+
+    def __init__(
+        self,
+        sinks: Sequence[AlertSink],
+        rate: float = DEFAULT_RATE,
+        rates: Optional[Dict[str, float]] = None,
+        batch_size: int = 256,
+        rollup_interval: float = 5.0,
+        max_queue: int = 100_000
+    ):
+        self.sinks = list(sinks)
+        self.limiter = RateLimiter(rate, rates)
+        self.batch_size = batch_size
+        self.rollup_interval = rollup_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(max_queue)
+
+        self._metrics = {
+            "submitted": METRICS.counter(
+                "ids_alerts_submitted_total", "Alerts handed to the output queue"),
+            "dropped": METRICS.counter(
+                "ids_alerts_dropped_total", "Alerts dropped because the output queue was full"),
+            "output": METRICS.histogram(
+                "ids_stage_seconds", "Sampled per-packet / per-window stage time",
+                stage="alert_output"),
+        }
+
+        self._thread = threading.Thread(
+            target=self._run, name="alert-output", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, alert: Dict) -> bool:
+        """
+        Queue an alert for output. False if it was dropped.
+        """
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+            self._metrics["dropped"].inc()
+            return False
+        self._metrics["submitted"].inc()
+        return True
+
+    def _next_batch(self, timeout: float) -> Tuple[List[Dict], bool]:
+        """
+        Up to batch_size alerts, waiting at most ``timeout`` for the
+        first. Returns (batch, closing).
+        """
+        batch: List[Dict] = []
+        try:
+            item = self._queue.get(timeout=timeout)
+            while True:
+                if item is None:
+                    return batch, True
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return batch, False
+
+    def _deliver(self, alerts: List[Dict], rollups: List[Rollup]) -> None:
+        now = time.monotonic()
+        passed = [alert for alert in alerts if self.limiter.allow(alert, now)]
+
+        started = time.perf_counter()
+        for sink in self.sinks:
+            try:
+                if sink.rate_limited:
+                    sink.write(passed, rollups)
+                else:
+                    sink.write(alerts, rollups)
+            except Exception as e:
+                console.print(
+                    f"[WARN] Alert sink {type(sink).__name__} failed: {e}",
+                    style="yellow"
+                )
+        self._metrics["output"].observe(time.perf_counter() - started)
+
+        for rollup in rollups:
+            METRICS.counter(
+                "ids_alerts_suppressed_total",
+                "Alerts rate-limited into roll-ups, by type",
+                type=rollup["alert_type"]
+            ).inc(rollup["suppressed"])
+
+    def _run(self) -> None:
+        next_rollup = time.monotonic() + self.rollup_interval
+        closing = False
+
+        while not closing:
+            batch, closing = self._next_batch(
+                max(next_rollup - time.monotonic(), 0.0)
+            )
+
+            rollups: List[Rollup] = []
+            if closing or time.monotonic() >= next_rollup:
+                next_rollup = time.monotonic() + self.rollup_interval
+                # Roll-ups include anything suppressed from this batch
+                self._deliver(batch, [])
+                batch, rollups = [], self.limiter.drain()
+
+            if batch or rollups:
+                self._deliver(batch, rollups)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        for sink in self.sinks:
+            sink.close()
+
+        if self.dropped:
+            console.print(
+                f"[WARN] {self.dropped} alert(s) dropped: output queue full",
+                style="yellow"
+            )
+
+    def __enter__(self) -> "AlertDispatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
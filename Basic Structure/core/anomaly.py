@@ -0,0 +1,461 @@
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from rich.console import Console
+
+from core.features import CHUNK_SIZE, FEATURE_NAMES, extract_features, iter_feature_chunks
+from core.flows import generate_flows
+from core.flowtable import FlowTable
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+console = Console()
+
+DEFAULT_MODEL_PATH = "model.npz"
+# ANOMALY alerts reported per scoring call; the rest are only counted
+DEFAULT_MAX_ALERTS = 50
+MODEL_VERSION = 1
+
+# generate_flows limits the training flows were built with; scoring
+# builds its flows the same way
+FLOW_LIMITS = ("max_flows", "idle_timeout", "active_timeout")
+
+
+# =====================================================
+# STREAMING ANOMALY MODEL
+# =====================================================
+#
+# Features are log1p-compressed (counts and rates are heavy-tailed), then
+# standardised with robust per-feature statistics (median / IQR, read off
+# fixed-bin histograms so they can be built one mini-batch at a time).
+# The score is the Mahalanobis distance in that space, using a covariance
+# merged across mini-batches (Chan et al.) and shrunk towards its
+# diagonal. The alert threshold is a high quantile of the scores of a
+# reservoir sample of the training flows.
+
+# Histogram range in log1p space: e^32 covers any byte rate we will see
+_HIST_BINS = 2048
+_HIST_MAX = 32.0
+_RESERVOIR = 65536
+_SHRINKAGE = 0.05
+
+
+class AnomalyModel:
+    """
+    Mini-batch trained anomaly scorer over FEATURE_NAMES vectors.
+
+    partial_fit() any number of chunks, then finalize(). Memory is fixed:
+    histograms, running moments and a bounded reservoir sample.
+
+    ``flow_limits`` records the FLOW_LIMITS the training flows were built
+    with (None for unlimited) and is saved with the model.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.999,
+        seed: int = 0,
+        flow_limits: Optional[Dict[str, Optional[float]]] = None
+    ):
+        if not 0 < quantile < 1:
+            raise ValueError("Threshold quantile must be between 0 and 1")
+
+        width = len(FEATURE_NAMES)
+        self.quantile = quantile
+        self.samples = 0
+        self.flow_limits = {name: (flow_limits or {}).get(name) for name in FLOW_LIMITS}
+
+        self._hist = np.zeros((width, _HIST_BINS), dtype=np.int64)
+        self._mean = np.zeros(width)
+        self._m2 = np.zeros((width, width))
+        self._reservoir = np.empty((_RESERVOIR, width), dtype=np.float32)
+        self._rng = np.random.default_rng(seed)
+
+        # Fitted parameters
+        self.center: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.offset: Optional[np.ndarray] = None
+        self.precision: Optional[np.ndarray] = None
+        self.threshold: Optional[float] = None
+
+    # -----------------------------
+    # Training
+    # -----------------------------
+
+    @staticmethod
+    def _transform(features: np.ndarray) -> np.ndarray:
+        return np.log1p(np.maximum(features, 0, dtype=np.float64))
+
+    def partial_fit(self, features: np.ndarray) -> None:
+        """
+        Fold one mini-batch of feature rows into the running statistics.
+        """
+        if not len(features):
+            return
+
+        values = self._transform(features)
+        count = len(values)
+
+        # Per-feature histograms
+        bins = np.clip(
+            (values * (_HIST_BINS / _HIST_MAX)).astype(np.int64),
+            0, _HIST_BINS - 1
+        )
+        for column in range(values.shape[1]):
+            self._hist[column] += np.bincount(bins[:, column], minlength=_HIST_BINS)
+
+        # Mean / co-moment merge
+        batch_mean = values.mean(axis=0)
+        centred = values - batch_mean
+        delta = batch_mean - self._mean
+        total = self.samples + count
+        self._m2 += centred.T @ centred + np.outer(delta, delta) * (self.samples * count / total)
+        self._mean += delta * (count / total)
+
+        # Reservoir sample for the threshold
+        filled = min(self.samples, _RESERVOIR)
+        take = min(_RESERVOIR - filled, count)
+        self._reservoir[filled:filled + take] = values[:take]
+        if take < count:
+            seen = np.arange(self.samples + take + 1, total + 1)
+            keep = self._rng.random(count - take) < _RESERVOIR / seen
+            slots = self._rng.integers(0, _RESERVOIR, keep.sum())
+            self._reservoir[slots] = values[take:][keep]
+
+        self.samples = total
+
+    def _quantiles(self, q: float) -> np.ndarray:
+        cumulative = np.cumsum(self._hist, axis=1)
+        target = q * cumulative[:, -1:]
+        bins = (cumulative < target).sum(axis=1)
+        return (bins + 0.5) * (_HIST_MAX / _HIST_BINS)
+
+    def finalize(self) -> "AnomalyModel":
+        """
+        Turn the running statistics into scoring parameters.
+        """
+        if self.samples < 2:
+            raise ValueError("Not enough flows to train a model")
+
+        std = np.sqrt(np.diag(self._m2) / (self.samples - 1))
+        iqr = self._quantiles(0.75) - self._quantiles(0.25)
+        scale = np.where(iqr > 0, iqr / 1.349, std)
+
+        self.center = self._quantiles(0.5)
+        self.scale = np.maximum(scale, _HIST_MAX / _HIST_BINS)
+        self.offset = (self._mean - self.center) / self.scale
+
+        covariance = self._m2 / (self.samples - 1) / np.outer(self.scale, self.scale)
+        covariance = (
+            (1 - _SHRINKAGE) * covariance
+            + _SHRINKAGE * np.diag(np.diag(covariance))
+            + 1e-6 * np.eye(len(covariance))
+        )
+        self.precision = np.linalg.pinv(covariance)
+
+        sample = self._reservoir[:min(self.samples, _RESERVOIR)]
+        self.threshold = float(np.quantile(self._distance(sample), self.quantile))
+        return self
+
+    def fit_chunks(self, chunks: Iterable[np.ndarray]) -> "AnomalyModel":
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self.finalize()
+
+    # -----------------------------
+    # Scoring
+    # -----------------------------
+
+    def _distance(self, values: np.ndarray) -> np.ndarray:
+        z = (values - self.center) / self.scale - self.offset
+        return np.sqrt(np.maximum(np.einsum("ij,jk,ik->i", z, self.precision, z), 0))
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """
+        Anomaly score per feature row (higher is more unusual).
+        """
+        if self.precision is None:
+            raise ValueError("Model is not trained")
+        return self._distance(self._transform(features))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        True for rows scoring above the trained threshold.
+        """
+        return self.score(features) > self.threshold
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+
+    def save(self, path: str) -> None:
+        if self.precision is None:
+            raise ValueError("Model is not trained")
+
+        with open(path, "wb") as out:
+            np.savez(
+                out,
+                version=MODEL_VERSION,
+                features=np.array(FEATURE_NAMES),
+                quantile=self.quantile,
+                samples=self.samples,
+                center=self.center,
+                scale=self.scale,
+                offset=self.offset,
+                precision=self.precision,
+                threshold=self.threshold,
+                flow_limits=np.array([
+                    np.nan if self.flow_limits[name] is None else self.flow_limits[name]
+                    for name in FLOW_LIMITS
+                ]),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "AnomalyModel":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model file not found: {path}")
+
+        with np.load(path) as data:
+            if int(data["version"]) != MODEL_VERSION:
+                raise ValueError(f"Unsupported model version in {path}")
+            if tuple(data["features"]) != FEATURE_NAMES:
+                raise ValueError(f"Model {path} was trained on other features")
+
+            model = cls.__new__(cls)
+            model.quantile = float(data["quantile"])
+            model.samples = int(data["samples"])
+            model.center = data["center"]
+            model.scale = data["scale"]
+            model.offset = data["offset"]
+            model.precision = data["precision"]
+            model.threshold = float(data["threshold"])
+            model.flow_limits = {
+                name: None if np.isnan(value) else float(value)
+                for name, value in zip(FLOW_LIMITS, data["flow_limits"])
+            }
+            if model.flow_limits["max_flows"] is not None:
+                model.flow_limits["max_flows"] = int(model.flow_limits["max_flows"])
+        return model
+
+
+# =====================================================
+# TRAINING ENTRY POINT
+# =====================================================
+
+@dataclass
+class TrainingReport:
+    flows: int
+    seconds: float
+    peak_memory_mb: Optional[float]
+    threshold: float
+    model_path: str
+    model_bytes: int
+
+
+def peak_memory_mb() -> Optional[float]:
+    """
+    Peak RSS of this process in MB, or None where the resource module is
+    missing (Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def train_model(
+    pcap_file: str,
+    output: str = DEFAULT_MODEL_PATH,
+    chunk_size: int = CHUNK_SIZE,
+    quantile: float = 0.999,
+    max_flows: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    active_timeout: Optional[float] = None
+) -> TrainingReport:
+    """
+    Fit an AnomalyModel on a baseline capture, one feature chunk at a
+    time, and save it to ``output``.
+
+    Flows are built by generate_flows exactly as run_detection builds
+    them; ``max_flows`` / ``idle_timeout`` / ``active_timeout`` bound
+    that table for large baselines and are saved with the model.
+    """
+    if not os.path.exists(pcap_file):
+        raise FileNotFoundError(f"PCAP file not found: {pcap_file}")
+
+    console.print(f"[INFO] Training on baseline capture: {pcap_file}", style="cyan")
+
+    started = time.perf_counter()
+    limits = {
+        "max_flows": max_flows,
+        "idle_timeout": idle_timeout,
+        "active_timeout": active_timeout,
+    }
+    flows = generate_flows(pcap_file, **limits)
+
+    model = AnomalyModel(quantile=quantile, flow_limits=limits)
+    model.fit_chunks(iter_feature_chunks(flows, chunk_size))
+    model.save(output)
+    elapsed = time.perf_counter() - started
+
+    return TrainingReport(
+        flows=model.samples,
+        seconds=elapsed,
+        peak_memory_mb=peak_memory_mb(),
+        threshold=model.threshold,
+        model_path=output,
+        model_bytes=os.path.getsize(output),
+    )
+
+
+# =====================================================
+# SCORING STAGE
+# =====================================================
+
+_LOADED: Dict[str, AnomalyModel] = {}
+
+
+def load_model(path: str = DEFAULT_MODEL_PATH) -> AnomalyModel:
+    """
+    Load a model once per process; later calls reuse it.
+    """
+    key = os.path.abspath(path)
+    model = _LOADED.get(key)
+    if model is None:
+        model = _LOADED[key] = AnomalyModel.load(path)
+    return model
+
+
+@dataclass
+class ScoringResult:
+    alerts: List[Dict]
+    anomalies: int
+    scored: int
+    total: int
+    seconds: float
+    # Start time of each alert's flow, in step with alerts
+    first_seen: List[float] = field(default_factory=list)
+
+    @property
+    def flows_per_sec(self) -> float:
+        return self.scored / max(self.seconds, 1e-9)
+
+    @property
+    def sampled(self) -> bool:
+        return self.scored < self.total
+
+    @property
+    def suppressed(self) -> int:
+        return self.anomalies - len(self.alerts)
+
+
+class AnomalyScorer:
+    """
+    Scores every flow of a FlowTable in vectorized batches and turns the
+    ones above the model's threshold into ANOMALY alerts, highest score
+    first (at most ``max_alerts``, 0 for all; the rest are counted in
+    ScoringResult.suppressed).
+
+    With a ``budget`` (seconds per call, for live windows), the per-flow
+    cost and fixed overhead measured on earlier calls decide how many
+    flows fit; when a window has more, a uniform random sample of about
+    that size is scored instead.
+    """
+
+    BATCH_SIZE = 65536
+
+    def __init__(
+        self,
+        model: AnomalyModel,
+        budget: Optional[float] = None,
+        max_alerts: int = DEFAULT_MAX_ALERTS,
+        seed: int = 0
+    ):
+        self.model = model
+        self.budget = budget
+        self.max_alerts = max_alerts
+        # Exponentially smoothed flows/sec of feature extraction + scoring,
+        # and seconds of per-call overhead (sampling, alert records)
+        self.rate: Optional[float] = None
+        self.overhead = 0.0
+        self._rng = np.random.default_rng(seed)
+
+    def _sample(self, total: int) -> Optional[np.ndarray]:
+        if self.budget is None or self.rate is None:
+            return None
+        limit = max(int((self.budget - self.overhead) * self.rate), 1)
+        if total <= limit:
+            return None
+        return np.flatnonzero(self._rng.random(total) < limit / total)
+
+    def score_flows(self, flows: Dict) -> ScoringResult:
+        started = time.perf_counter()
+
+        table = FlowTable.from_flows(flows)
+        total = len(table)
+        rows = self._sample(total)
+
+        scoring_started = time.perf_counter()
+        features = extract_features(table, rows)
+
+        scores = np.empty(len(features))
+        for start in range(0, len(features), self.BATCH_SIZE):
+            batch = features[start:start + self.BATCH_SIZE]
+            scores[start:start + len(batch)] = self.model.score(batch)
+
+        scoring = time.perf_counter() - scoring_started
+
+        hits = np.flatnonzero(scores > self.model.threshold)
+        top = hits[np.argsort(-scores[hits], kind="stable")]
+        if self.max_alerts:
+            top = top[:self.max_alerts]
+
+        picked = rows[top] if rows is not None else top
+        alerts = [self._alert(table, int(row), score) for row, score in zip(picked, scores[top])]
+
+        elapsed = time.perf_counter() - started
+        if len(features):
+            rate = len(features) / max(scoring, 1e-9)
+            overhead = elapsed - scoring
+            if self.rate is None:
+                self.rate, self.overhead = rate, overhead
+            else:
+                self.rate = 0.7 * self.rate + 0.3 * rate
+                self.overhead = 0.7 * self.overhead + 0.3 * overhead
+
+        return ScoringResult(
+            alerts=alerts,
+            anomalies=len(hits),
+            scored=len(features),
+            total=total,
+            seconds=elapsed,
+            first_seen=table.column("start_time")[picked].tolist(),
+        )
+
+    def _alert(self, table: FlowTable, row: int, score: float) -> Dict:
+        flow = table.flow_at(row)
+        return {
+            "type": "ANOMALY",
+            "severity": "WARNING",
+            "src_ip": flow.src_ip,
+            "dst_ip": flow.dst_ip,
+            "dst_port": int(flow.dst_port),
+            "details": {
+                "score": round(float(score), 2),
+                "threshold": round(self.model.threshold, 2),
+                "protocol": flow.protocol,
+                "src_port": int(flow.src_port),
+                "packets": flow.packet_count,
+                "bytes": flow.byte_count,
+                "duration_sec": round(flow.duration, 2),
+                "description": "Flow deviates from the trained baseline"
+            }
+        }
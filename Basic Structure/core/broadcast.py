@@ -0,0 +1,465 @@
+import asyncio
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from rich.console import Console
+
+from core.flowtable import FlowTable
+from core.metrics import METRICS
+from core.ruleengine import FlowAggregates, group_by, group_sum
+
+console = Console()
+
+
+# =====================================================
+# WEBSOCKET BROADCAST (desktop frontend feed)
+# =====================================================
+#
+# Publishes live flow rates and alerts to any number of WebSocket
+# clients, in the FlowStat / Alert JSON schema the WPF IDS.Frontend
+# reads from ws://127.0.0.1:8181:
+#
+#   SourceIP, DestinationIP, SpeedKbps, Severity, Time,
+#   Summary, DetectionType ("Flow" | "Rule" | "AI")
+#
+# Two feeds, chosen by the client's request path:
+#
+#   /        the full row list as one JSON array per tick (what the
+#            existing frontend expects; capped to MAX_ROWS rows so a
+#            frame fits its 64 KB receive buffer)
+#   /delta   {"type": "snapshot", "seq", "rows"} once, then
+#            {"type": "delta", "seq", "upsert", "remove"} per tick;
+#            rows carry a "Key" to apply them by
+#
+# Each tick's messages are serialized and framed once and the same bytes
+# are shared by every client. Clients never queue more than one message:
+# a slow snapshot client gets the newest snapshot in place of the one it
+# had not read yet, and a slow delta client skips the missed deltas and
+# is resynchronised with a snapshot.
+#
+# The server is a minimal RFC 6455 implementation on asyncio streams
+# (text frames out; ping / close in), running on its own thread.
+
+MAX_ROWS = 200
+# How long an alert stays in the row list
+ALERT_TTL = 300.0
+# Clients that cannot take a frame for this long are disconnected
+SEND_TIMEOUT = 30.0
+# Kernel send buffer per client: small, so a stalled client pushes back
+# on its outbox instead of queueing megabytes of stale frames
+SEND_BUFFER = 64 * 1024
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_MAX_CLIENT_FRAME = 64 * 1024
+
+_SEVERITIES = {"CRITICAL": "High", "WARNING": "Medium"}
+
+Row = Dict[str, object]
+
+
+# -----------------------------
+# Rows
+# -----------------------------
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+def flow_rows(table: FlowTable, seconds: float, limit: int = MAX_ROWS) -> List[Row]:
+    """
+    Per (src, dst) throughput of a window, busiest first, as FlowStat rows
+    (KB/s, "High" above 5000, like the C# backend).
+    """
+    if not len(table):
+        return []
+
+    aggregates = FlowAggregates(table)
+    src = aggregates.address_ids("src_ip")
+    dst = aggregates.address_ids("dst_ip")
+    groups, rows = group_by(src * (int(dst.max()) + 1) + dst)
+    byte_count = group_sum(groups, aggregates.column("byte_count"), len(rows))
+
+    busiest = np.argsort(-byte_count, kind="stable")[:limit]
+    stamp = _now()
+    result = []
+    for group in busiest:
+        row = rows[group]
+        kbps = round(float(byte_count[group]) / 1024.0 / max(seconds, 1e-9), 1)
+        source = table.address_at(row, "src_ip")
+        destination = table.address_at(row, "dst_ip")
+        result.append({
+            "Key": f"flow|{source}|{destination}",
+            "SourceIP": source,
+            "DestinationIP": destination,
+            "SpeedKbps": kbps,
+            "Severity": "High" if kbps > 5000 else "Medium",
+            "Time": stamp,
+            "Summary": "",
+            "DetectionType": "Flow",
+        })
+    return result
+
+
+def alert_row(alert: Dict) -> Row:
+    alert_type = str(alert.get("type", "UNKNOWN"))
+    details = alert.get("details") or {}
+    description = details.get("description", "") if isinstance(details, dict) else ""
+    port = alert.get("dst_port")
+    return {
+        "Key": f"alert|{alert_type}|{alert.get('src_ip')}|{alert.get('dst_ip')}|{port}",
+        "SourceIP": str(alert.get("src_ip") or ""),
+        "DestinationIP": str(alert.get("dst_ip") or ""),
+        "SpeedKbps": 0.0,
+        "Severity": _SEVERITIES.get(str(alert.get("severity", "")).upper(), "Low"),
+        "Time": _now(),
+        "Summary": f"{alert_type}" + (f" on port {port}" if port else "")
+                   + (f": {description}" if description else ""),
+        "DetectionType": "AI" if alert_type == "ANOMALY" else "Rule",
+    }
+
+
+def _same(a: Row, b: Row) -> bool:
+    """
+    Row equality ignoring Time, which changes every tick.
+    """
+    return all(a[name] == b[name] for name in a if name != "Time")
+
+
+# -----------------------------
+# WebSocket framing
+# -----------------------------
+
+def text_frame(payload: bytes) -> bytes:
+    """
+    One unmasked, unfragmented text frame (server -> client).
+    """
+    size = len(payload)
+    if size < 126:
+        header = struct.pack("!BB", 0x81, size)
+    elif size < 1 << 16:
+        header = struct.pack("!BBH", 0x81, 126, size)
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, size)
+    return header + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """
+    Read one (masked) client frame. Returns (opcode, payload).
+    """
+    first, second = await reader.readexactly(2)
+    size = second & 0x7F
+    if size == 126:
+        size = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif size == 127:
+        size = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if size > _MAX_CLIENT_FRAME:
+        raise ConnectionError("client frame too large")
+
+    mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+    data = await reader.readexactly(size)
+    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(data))
+    return first & 0x0F, payload
+
+
+async def _handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[str]:
+    """
+    Complete the HTTP upgrade. Returns the request path, or None after
+    rejecting a non-WebSocket request.
+    """
+    request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=10)
+    lines = request.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    key = headers.get("sec-websocket-key")
+    if len(parts) < 2 or key is None or "websocket" not in headers.get("upgrade", "").lower():
+        writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        return None
+
+    accept = base64.b64encode(
+        hashlib.sha1((key + _WS_GUID).encode("ascii")).digest()
+    ).decode("ascii")
+    writer.write(
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("ascii")
+    )
+    await writer.drain()
+    return parts[1]
+
+
+# -----------------------------
+# Clients
+# -----------------------------
+
+class _Client:
+    """
+    One connection with a single-slot outbox.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, delta: bool):
+        self.writer = writer
+        self.delta = delta
+        self.pending: Optional[bytes] = None
+        self.needs_snapshot = delta
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def offer(self, frame: bytes) -> bool:
+        """
+        Replace any unsent frame with ``frame``. True if one was replaced.
+        """
+        replaced = self.pending is not None
+        self.pending = frame
+        self.ready.set()
+        return replaced
+
+    async def send_loop(self) -> None:
+        while not self.closed:
+            await self.ready.wait()
+            self.ready.clear()
+            frame, self.pending = self.pending, None
+            if frame is None:
+                continue
+            self.writer.write(frame)
+            await asyncio.wait_for(self.writer.drain(), timeout=SEND_TIMEOUT)
+
+
+class Broadcaster:
+    """
+    WebSocket server on its own thread, fed by publish() from any thread.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8181, max_rows: int = MAX_ROWS):
+        self.host = host
+        self.port = port
+        self.max_rows = max_rows
+        self.seq = 0
+        self._rows: Dict[str, Row] = {}
+        self._alerts: Dict[str, Tuple[Row, float]] = {}
+        self._clients: List[_Client] = []
+        self._sessions: set = set()
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self._metrics = {
+            "clients": METRICS.gauge("ids_ws_clients", "Connected WebSocket clients"),
+            "coalesced": METRICS.counter(
+                "ids_ws_coalesced_total", "Unsent WebSocket frames replaced by newer ones"),
+            "bytes": METRICS.counter(
+                "ids_ws_serialized_bytes_total", "Bytes serialized per tick (shared by all clients)"),
+            "tick": METRICS.histogram("ids_stage_seconds", stage="broadcast"),
+        }
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+
+    def start(self) -> "Broadcaster":
+        ready = threading.Event()
+        failure: List[BaseException] = []
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._serve, self.host, self.port)
+                )
+                # Port 0 picks a free port
+                self.port = self._server.sockets[0].getsockname()[1]
+            except BaseException as e:
+                failure.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="ws-broadcast", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if failure:
+            raise failure[0]
+        return self
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+
+        async def shutdown() -> None:
+            self._server.close()
+            for client in list(self._clients):
+                client.writer.close()
+            if self._sessions:
+                await asyncio.wait(self._sessions, timeout=2)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    # -----------------------------
+    # Publishing (any thread)
+    # -----------------------------
+
+    def add_alert(self, alert: Dict) -> None:
+        """
+        Show an alert from the next tick on, for ALERT_TTL seconds.
+        """
+        self._loop.call_soon_threadsafe(self._add_alert, alert_row(alert))
+
+    def publish(self, table: FlowTable, seconds: float) -> None:
+        """
+        Broadcast the flow rates of a finished window, plus current alerts.
+        """
+        rows = flow_rows(table, seconds, self.max_rows)
+        self._loop.call_soon_threadsafe(self._tick, rows)
+
+    # -----------------------------
+    # Event loop side
+    # -----------------------------
+
+    def _add_alert(self, row: Row) -> None:
+        # Kept in last-seen order, at most max_rows of them
+        self._alerts.pop(row["Key"], None)
+        self._alerts[row["Key"]] = (row, self._loop.time() + ALERT_TTL)
+        if len(self._alerts) > self.max_rows:
+            del self._alerts[next(iter(self._alerts))]
+
+    def _tick(self, flows: List[Row]) -> None:
+        started = self._loop.time()
+        now = started
+        self._alerts = {
+            key: entry for key, entry in self._alerts.items() if entry[1] > now
+        }
+
+        # Alerts take precedence over flow rows
+        alerts = [row for row, _ in reversed(self._alerts.values())]
+        current = {row["Key"]: row for row in alerts + flows[:max(self.max_rows - len(alerts), 0)]}
+        previous = self._rows
+        self._rows = current
+        self.seq += 1
+
+        upsert = [
+            row for key, row in current.items()
+            if key not in previous or not _same(row, previous[key])
+        ]
+        remove = [key for key in previous if key not in current]
+
+        frames: Dict[str, bytes] = {}
+
+        def frame(kind: str) -> bytes:
+            # Built at most once per tick, only if some client needs it
+            if kind not in frames:
+                if kind == "array":
+                    message = [
+                        {name: value for name, value in row.items() if name != "Key"}
+                        for row in current.values()
+                    ]
+                elif kind == "delta":
+                    message = {"type": "delta", "seq": self.seq, "upsert": upsert, "remove": remove}
+                else:
+                    message = {"type": "snapshot", "seq": self.seq, "rows": list(current.values())}
+                payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+                frames[kind] = text_frame(payload)
+                self._metrics["bytes"].inc(len(payload))
+            return frames[kind]
+
+        coalesced = 0
+        for client in self._clients:
+            if not client.delta:
+                coalesced += client.offer(frame("array"))
+            elif client.needs_snapshot or client.pending is not None:
+                # Missed a delta: resynchronise instead of queueing more
+                coalesced += client.pending is not None
+                client.needs_snapshot = False
+                client.offer(frame("snapshot"))
+            elif upsert or remove:
+                client.offer(frame("delta"))
+
+        self._metrics["coalesced"].inc(coalesced)
+        self._metrics["tick"].observe(self._loop.time() - started)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = asyncio.current_task()
+        self._sessions.add(session)
+        try:
+            await self._session(reader, writer)
+        finally:
+            self._sessions.discard(session)
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            path = await _handshake(reader, writer)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        if path is None:
+            writer.close()
+            return
+
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        writer.transport.set_write_buffer_limits(high=0)
+
+        url = urlsplit(path)
+        delta = url.path.rstrip("/") == "/delta" or parse_qs(url.query).get("mode") == ["delta"]
+        client = _Client(writer, delta)
+        self._clients.append(client)
+        self._metrics["clients"].set(len(self._clients))
+
+        # Late joiners see the current state straight away
+        if self._rows:
+            if delta:
+                client.needs_snapshot = False
+                message = {"type": "snapshot", "seq": self.seq, "rows": list(self._rows.values())}
+            else:
+                message = [
+                    {name: value for name, value in row.items() if name != "Key"}
+                    for row in self._rows.values()
+                ]
+            client.offer(text_frame(json.dumps(message, separators=(",", ":")).encode("utf-8")))
+
+        sender = asyncio.ensure_future(client.send_loop())
+        receive = sender
+        try:
+            while True:
+                receive = asyncio.ensure_future(_read_frame(reader))
+                done, _ = await asyncio.wait(
+                    {receive, sender}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if sender in done:
+                    break
+                opcode, payload = receive.result()
+                if opcode == 0x8:
+                    writer.write(b"\x88\x00")
+                    break
+                if opcode == 0x9:
+                    writer.write(struct.pack("!BB", 0x8A, len(payload)) + payload)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            client.closed = True
+            for task in (receive, sender):
+                task.cancel()
+                if task.done() and not task.cancelled():
+                    task.exception()  # a reset connection is not an error
+            self._clients.remove(client)
+            self._metrics["clients"].set(len(self._clients))
+            writer.close()
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from typing import Optional, Tuple
+
+import numpy as np
+from rich.console import Console
+
+console = Console()
+
+
+# =====================================================
+# PARSED-FLOW CACHE
+# =====================================================
+#
+# generate_flows() results are stored as uncompressed .npz files of the
+# FlowTable columns (~46 bytes per flow), named after a BLAKE2 digest of
+# the capture's content plus the options that change the result.
+#
+# Hashing a multi-GB capture still takes seconds, so the index remembers
+# the digest of each path for its last seen (size, mtime): an untouched
+# file is looked up without reading it, a touched one is re-hashed, and
+# an identical copy elsewhere hits the same entry. Each path has its own
+# index file (named after a hash of the path), so concurrent jobs never
+# rewrite each other's entries.
+#
+# The directory is bounded: entries are touched on every hit, and the
+# least recently used ones are deleted once the total exceeds max_bytes.
+# An unreadable entry (truncated, corrupt) counts as a miss and is
+# deleted.
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get(
+    "IDS_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ids", "flows")
+)
+DEFAULT_CACHE_MB = int(os.environ.get("IDS_CACHE_MB", "1024"))
+
+_INDEX_DIR = "index"
+_HASH_BLOCK = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """
+    BLAKE2b digest of a file's content.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as capture:
+        for block in iter(lambda: capture.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FlowCache:
+    """
+    Size-bounded LRU directory of parsed flow tables.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_CACHE_MB << 20
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    # -----------------------------
+    # Keys
+    # -----------------------------
+
+    def _index_dir(self) -> str:
+        return os.path.join(self.directory, _INDEX_DIR)
+
+    def _index_path(self, path: str) -> str:
+        name = hashlib.blake2b(path.encode("utf-8"), digest_size=12).hexdigest()
+        return os.path.join(self._index_dir(), f"{name}.json")
+
+    def digest(self, pcap_file: str) -> str:
+        """
+        Content digest of a capture, re-hashed only if size or mtime changed.
+        """
+        path = os.path.abspath(pcap_file)
+        stat = os.stat(path)
+        index_path = self._index_path(path)
+
+        try:
+            with open(index_path, "r", encoding="utf-8") as index:
+                known = json.load(index)
+            if (known["path"] == path and known["size"] == stat.st_size
+                    and known["mtime_ns"] == stat.st_mtime_ns):
+                return known["digest"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        digest = file_digest(path)
+        os.makedirs(self._index_dir(), exist_ok=True)
+        self._write_atomic(index_path, json.dumps({
+            "path": path,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest,
+        }).encode("utf-8"))
+        return digest
+
+    def entry_path(self, pcap_file: str, options: dict) -> str:
+        variant = hashlib.blake2b(
+            json.dumps([CACHE_VERSION, options], sort_keys=True).encode("utf-8"),
+            digest_size=6
+        ).hexdigest()
+        return os.path.join(self.directory, f"{self.digest(pcap_file)}-{variant}.npz")
+
+    # -----------------------------
+    # Load / store
+    # -----------------------------
+
+    def load(self, pcap_file: str, options: dict) -> Optional[Tuple[object, int]]:
+        """
+        Returns (FlowTable, packet_count), or None on a miss.
+        """
+        from core.flowtable import FlowTable
+
+        path = self.entry_path(pcap_file, options)
+        try:
+            with np.load(path) as data:
+                columns = {name: data[name] for name in data.files}
+            meta = json.loads(bytes(columns.pop("meta")).decode("utf-8"))
+            table = FlowTable.from_columns(columns)
+            table.evictions.update(meta["evictions"])
+            packet_count = meta["packet_count"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, EOFError, zipfile.BadZipFile) as e:
+            console.print(
+                f"[WARN] Discarding unreadable cache entry {path}: {e}", style="yellow"
+            )
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        # Mark as recently used (a concurrent evict() may have removed it)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return table, packet_count
+
+    def store(self, pcap_file: str, options: dict, table, packet_count: int) -> None:
+        meta = json.dumps({
+            "source": os.path.abspath(pcap_file),
+            "packet_count": packet_count,
+            "evictions": table.evictions,
+        }).encode("utf-8")
+
+        path = self.entry_path(pcap_file, options)
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as out:
+            np.savez(
+                out,
+                meta=np.frombuffer(meta, dtype=np.uint8),
+                **table.to_columns()
+            )
+        os.replace(out.name, path)
+
+        self.evict()
+
+    # -----------------------------
+    # Maintenance
+    # -----------------------------
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until within max_bytes, and
+        index files of captures that no longer exist. Returns the number
+        of entries deleted.
+        """
+        self._prune_index()
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        deleted = 0
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            deleted += 1
+
+        return deleted
+
+    def _prune_index(self) -> None:
+        try:
+            names = os.listdir(self._index_dir())
+        except OSError:
+            return
+        for name in names:
+            index_path = os.path.join(self._index_dir(), name)
+            try:
+                with open(index_path, "r", encoding="utf-8") as index:
+                    stale = not os.path.exists(json.load(index)["path"])
+            except (ValueError, KeyError, TypeError):
+                stale = True
+            except OSError:
+                continue
+            if stale:
+                try:
+                    os.remove(index_path)
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            os.remove(path)
+        try:
+            names = os.listdir(self._index_dir())
+        except OSError:
+            names = []
+        for name in names:
+            os.remove(os.path.join(self._index_dir(), name))
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as out:
+            out.write(data)
+        os.replace(out.name, path)
@@ -1,11 +1,148 @@
+import os
+import re
 import subprocess
 import shutil
+import tempfile
+from typing import Dict, Iterable, Optional, Sequence
 from rich.console import Console
+from rich.markup import escape
 from rich.panel import Panel
 
+from core.pcap import ICMP_ERROR_TYPES
+from core.ruleengine import RULES
+from core import rules  # noqa: F401  (registers the built-in rules)
+
 console = Console()
 
 
+# =====================================================
+# CAPTURE FILTERS
+# =====================================================
+#
+# tshark hands a BPF filter to the kernel, so packets the detectors
+# cannot use are dropped before they are copied into the pipe and
+# parsed in Python. The filter is the AND of:
+#
+#   - what core.pcap decodes: IPv4 TCP / UDP and the ICMP errors that
+#     quote them, minus non-first fragments (which carry no ports)
+#   - the enabled rules: a rule may declare the only traffic it needs
+#     (brute force: its monitored ports); if any enabled rule needs all
+#     traffic, nothing more is filtered
+#   - user expressions: traffic must match an include (if any) and no
+#     exclude, e.g. exclude "net 10.20.0.0/16" for a backup subnet
+#
+# The whole expression is repeated after "vlan" so single-tagged frames
+# are filtered the same way (BPF shifts every offset after "vlan", so it
+# must come last).
+
+DECODABLE_FILTER = (
+    "ip and ip[6:2] & 0x1fff = 0 and (tcp or udp or "
+    + " or ".join(f"icmp[icmptype] = {kind}" for kind in sorted(ICMP_ERROR_TYPES))
+    + ")"
+)
+
+# Interface flag (see <net/if.h>)
+IFF_LOOPBACK = 0x8
+
+
+def rule_filter(
+    enabled: Optional[Iterable[str]] = None,
+    params: Optional[Dict[str, Dict]] = None
+) -> Optional[str]:
+    """
+    BPF expression covering the traffic the ``enabled`` rules (default:
+    all) can use, or None when one of them needs all of it.
+    """
+    params = params or {}
+    names = list(enabled or RULES)
+    unknown = [name for name in names if name not in RULES]
+    if unknown:
+        raise ValueError(
+            f"Unknown rule(s): {', '.join(unknown)} "
+            f"(available: {', '.join(RULES)})"
+        )
+
+    expressions = []
+    for name in names:
+        capture = RULES[name].capture
+        if capture is None:
+            return None
+        expressions.append(f"({capture(**params.get(name, {}))})")
+    return " or ".join(expressions) or None
+
+
+def build_capture_filter(
+    enabled: Optional[Iterable[str]] = None,
+    params: Optional[Dict[str, Dict]] = None,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    derive: bool = True
+) -> Optional[str]:
+    """
+    Capture filter for tshark ``-f``, or None to capture everything.
+
+    :param enabled: rules that will run (default: all)
+    :param params: per-rule parameters, as for run_rules
+    :param include: BPF expressions; traffic must match at least one
+    :param exclude: BPF expressions; traffic matching any is dropped
+    :param derive: also keep only traffic the decoder and rules can use
+    """
+    terms = []
+    if derive:
+        terms.append(DECODABLE_FILTER)
+        narrowed = rule_filter(enabled, params)
+        if narrowed:
+            terms.append(narrowed)
+    if include:
+        terms.append(" or ".join(f"({expression})" for expression in include))
+    terms.extend(f"not ({expression})" for expression in exclude)
+
+    if not terms:
+        return None
+    term = " and ".join(f"({t})" for t in terms)
+    return f"({term}) or (vlan and {term})"
+
+
+def interface_packets(interface: str) -> Optional[int]:
+    """
+    Packets the OS has counted on ``interface`` so far, or None where
+    that is unknown (non-Linux, interface numbers, "any").
+    """
+    base = os.path.join("/sys/class/net", interface)
+    try:
+        with open(os.path.join(base, "statistics", "rx_packets")) as rx:
+            received = int(rx.read())
+        with open(os.path.join(base, "statistics", "tx_packets")) as tx:
+            sent = int(tx.read())
+        with open(os.path.join(base, "flags")) as flags:
+            loopback = int(flags.read(), 16) & IFF_LOOPBACK
+    except (OSError, ValueError):
+        return None
+
+    # Loopback counts every packet as both sent and received; it is
+    # captured once
+    return received if loopback else received + sent
+
+
+def interface_drops(interface: str) -> Optional[int]:
+    """
+    Packets the driver / NIC dropped on receive on ``interface`` so far,
+    or None where that is unknown.
+    """
+    try:
+        with open(os.path.join("/sys/class/net", interface, "statistics", "rx_dropped")) as rx:
+            return int(rx.read())
+    except (OSError, ValueError):
+        return None
+
+
+def capture_drops(stderr: str) -> int:
+    """
+    Packets tshark reported dropped (kernel buffer full) when it exited.
+    """
+    return sum(int(count) for count in re.findall(r"(\d+) packets? dropped", stderr or ""))
+
+
 def check_tshark() -> None:
     """
     Ensure tshark is installed and accessible.
@@ -22,13 +159,19 @@ def check_tshark() -> None:
         raise RuntimeError("tshark not found")
 
 
-def capture_traffic(interface: str, output_file: str, duration: int = 0) -> None:
+def capture_traffic(
+    interface: str,
+    output_file: str,
+    duration: int = 0,
+    capture_filter: Optional[str] = None
+) -> None:
     """
     Capture network traffic using tshark.
 
     :param interface: Network interface name (e.g., Ethernet, eth0)
     :param output_file: Output PCAP filename
     :param duration: Capture duration in seconds (0 = until manually stopped)
+    :param capture_filter: BPF filter applied by the kernel (see build_capture_filter)
     """
 
     if not interface.strip():
@@ -46,19 +189,24 @@ def capture_traffic(interface: str, output_file: str, duration: int = 0) -> None
 
     if duration > 0:
         command.extend(["-a", f"duration:{duration}"])
+    if capture_filter:
+        command.extend(["-f", capture_filter])
 
     console.print(
         Panel(
             f"📡 Interface : [bold]{interface}[/bold]\n"
             f"💾 Output    : [bold]{output_file}[/bold]\n"
-            f"⏱ Duration  : [bold]{'Unlimited' if duration == 0 else str(duration) + ' sec'}[/bold]",
+            f"⏱ Duration  : [bold]{'Unlimited' if duration == 0 else str(duration) + ' sec'}[/bold]\n"
+            f"🔍 Filter    : {escape(capture_filter or 'none (all traffic)')}",
             title="Starting Packet Capture",
             style="cyan"
         )
     )
 
+    seen_before = interface_packets(interface)
+
     try:
-        subprocess.run(
+        result = subprocess.run(
             command,
             check=True,
             stdout=subprocess.DEVNULL,
@@ -69,6 +217,7 @@ def capture_traffic(interface: str, output_file: str, duration: int = 0) -> None
             f"✅ Capture completed successfully: {output_file}",
             style="bold green"
         )
+        report_filtered(interface, seen_before, result.stderr)
 
     except subprocess.CalledProcessError as e:
         console.print(
@@ -84,3 +233,88 @@ def capture_traffic(interface: str, output_file: str, duration: int = 0) -> None
             )
         )
         raise RuntimeError("Packet capture failed") from e
+
+
+class LiveCapture(subprocess.Popen):
+    """
+    A running tshark capture. Its stderr goes to a temporary file rather
+    than a pipe, so status and warning lines can never fill a pipe buffer
+    and stall the capture; read them with error_output().
+    """
+
+    def __init__(self, command: Sequence[str]):
+        self.error_log = tempfile.TemporaryFile()
+        super().__init__(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=self.error_log,
+            bufsize=1024 * 1024,
+        )
+
+    # Only the end of stderr is kept for reports (totals come last)
+    ERROR_TAIL = 8192
+
+    def error_output(self, timeout: float = 5.0) -> str:
+        """
+        The last ERROR_TAIL bytes tshark wrote to stderr, from a line
+        start. Waits up to ``timeout`` for it to exit first, so the file
+        is complete (and no longer written).
+        """
+        try:
+            self.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            pass
+        size = self.error_log.seek(0, os.SEEK_END)
+        self.error_log.seek(max(size - self.ERROR_TAIL, 0))
+        text = self.error_log.read().decode(errors="replace")
+        if size > self.ERROR_TAIL:
+            text = text.partition("\n")[2]
+        return text
+
+
+def report_filtered(interface: str, seen_before: Optional[int], stderr: str) -> None:
+    """
+    Print how many packets the capture filter dropped, from the
+    interface counters and tshark's "N packets captured" line.
+    """
+    seen_after = interface_packets(interface)
+    captured = re.search(r"(\d+) packets? captured", stderr or "")
+    if seen_before is None or seen_after is None or captured is None:
+        return
+
+    seen = seen_after - seen_before
+    filtered = max(seen - int(captured.group(1)), 0)
+    console.print(
+        f"[INFO] {filtered:,} of {seen:,} packets on {interface} "
+        f"filtered out before parsing ({filtered / max(seen, 1):.0%})",
+        style="cyan"
+    )
+
+
+def start_live_capture(interface: str, capture_filter: Optional[str] = None) -> LiveCapture:
+    """
+    Start a single long-running tshark process that streams classic PCAP
+    to its stdout, one packet at a time.
+
+    :param interface: Network interface name (e.g., Ethernet, eth0)
+    :param capture_filter: BPF filter applied by the kernel (see build_capture_filter)
+    :return: The running process; read packets from ``process.stdout`` and
+             tshark's messages with ``process.error_output()``
+    """
+    if not interface.strip():
+        raise ValueError("Interface name cannot be empty")
+
+    check_tshark()
+
+    command = [
+        "tshark",
+        "-i", interface,
+        "-w", "-",
+        "-F", "pcap",
+        "-l",
+        "-q",
+    ]
+    if capture_filter:
+        command.extend(["-f", capture_filter])
+
+    return LiveCapture(command)
@@ -0,0 +1,85 @@
+import json
+import os
+import socket
+import tempfile
+from typing import Dict, Optional
+
+
+# =====================================================
+# DAEMON CLIENT
+# =====================================================
+#
+# Protocol spoken by `ids serve` (core.daemon): newline-delimited JSON
+# over a Unix domain socket. Each request is one object with an "op"
+# ("analyze", "alerts", "status") and its parameters; each reply is one
+# object with "ok" and either the result fields or "error". Several
+# requests may be sent over one connection.
+#
+# Standard library only, so integrations can import this module (or
+# reimplement the few lines below) without the cost of the analysis
+# stack. Unix domain sockets are POSIX-only: elsewhere (Windows) the
+# daemon and its client are unavailable, and say so.
+
+UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+
+def default_socket() -> str:
+    """
+    $IDS_SOCKET, else a per-user socket in the runtime / temp directory.
+    """
+    uid = getattr(os, "getuid", lambda: 0)()
+    return os.environ.get(
+        "IDS_SOCKET",
+        os.path.join(
+            os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+            f"ids-{uid}.sock"
+        )
+    )
+
+
+def require_unix_sockets() -> None:
+    if not UNIX_SOCKETS:
+        raise DaemonError(
+            "The IDS daemon talks over Unix domain sockets, which this platform "
+            "does not support; run `ids detect` / `ids live` directly instead"
+        )
+
+
+class DaemonError(Exception):
+    """
+    Raised when the daemon is unreachable or rejects a request.
+    """
+
+
+def request(
+    op: str,
+    socket_path: Optional[str] = None,
+    timeout: float = 300.0,
+    **params
+) -> Dict:
+    """
+    Send one request and return the daemon's reply.
+    """
+    require_unix_sockets()
+    socket_path = socket_path or default_socket()
+    message = json.dumps(dict(params, op=op)).encode("utf-8") + b"\n"
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(socket_path)
+            conn.sendall(message)
+            with conn.makefile("rb") as replies:
+                line = replies.readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        raise DaemonError(f"No IDS daemon listening on {socket_path} (start one with `ids serve`)")
+    except OSError as e:
+        raise DaemonError(f"Daemon connection failed: {e}")
+
+    if not line:
+        raise DaemonError("Daemon closed the connection without replying")
+
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise DaemonError(reply.get("error", "Unknown daemon error"))
+    return reply
@@ -0,0 +1,391 @@
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from rich.console import Console
+
+from core.client import default_socket, require_unix_sockets
+from core.dedup import DedupStore, alert_key
+from core.metrics import METRICS
+
+console = Console()
+
+
+# =====================================================
+# WARM-STATE DAEMON (`ids serve`)
+# =====================================================
+#
+# A long-running process that answers the core.client protocol on a
+# Unix domain socket. Analyses run in a pool of worker processes that
+# have already imported the analysis stack and loaded the default
+# model, so a job costs only the parse and the rules. Parsed flows go
+# through the shared flow cache as usual.
+#
+# Alerts from finished jobs, and from an optional live capture, are kept
+# in a bounded in-memory log that the "alerts" op returns.
+
+# Options an "analyze" request may set, and their types
+ANALYZE_OPTIONS = {
+    "sketch": bool,
+    "max_flows": int,
+    "idle_timeout": float,
+    "active_timeout": float,
+    "model": str,
+    "max_anomaly_alerts": int,
+    "cache": bool,
+    "store": bool,
+}
+
+
+# -----------------------------
+# Worker processes
+# -----------------------------
+
+# Seconds the warm-up waits for every worker to check in
+WARMUP_TIMEOUT = 60.0
+
+_warmup = None
+
+
+def _init_worker(model_path: Optional[str], warmup) -> None:
+    """
+    Import the analysis stack and load the model once per worker. Worker
+    console output is discarded; results go back over the socket.
+    """
+    global _warmup
+    _warmup = warmup
+    sys.stdout = open(os.devnull, "w")
+
+    from core import engine  # noqa: F401
+    from core.anomaly import load_model
+
+    if model_path:
+        load_model(model_path)
+
+
+def _ready() -> int:
+    """
+    Wait for the other workers' warm-up calls (so each worker takes
+    exactly one) and return this worker's pid.
+    """
+    try:
+        _warmup.wait(WARMUP_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+    return os.getpid()
+
+
+def _analyze(pcap: str, options: Dict, default_model: Optional[str]) -> Dict:
+    from core.anomaly import DEFAULT_MAX_ALERTS
+    from core.engine import run_detection
+
+    started = time.perf_counter()
+    alerts = run_detection(
+        pcap,
+        sketch=options.get("sketch", False),
+        max_flows=options.get("max_flows"),
+        idle_timeout=options.get("idle_timeout"),
+        active_timeout=options.get("active_timeout"),
+        model_path=options.get("model", default_model),
+        max_anomaly_alerts=options.get("max_anomaly_alerts", DEFAULT_MAX_ALERTS),
+        use_cache=options.get("cache", True),
+        store=options.get("store", False)
+    )
+    return {
+        "alerts": alerts,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# -----------------------------
+# Live feed
+# -----------------------------
+
+class LiveFeed:
+    """
+    Live capture on ``iface`` whose alerts go to ``on_alert``. Windows are
+    rotated and discarded; only the detectors' alerts are kept.
+    """
+
+    def __init__(self, iface: str, on_alert, window: float = 5.0, horizon: float = 600.0):
+        from core.capture import build_capture_filter, start_live_capture
+        from core.live import StreamingFlows
+        from core.pcap import iter_stream
+        from core.sliding import SlidingDetectors
+
+        self.iface = iface
+        self.window = window
+        self.on_alert = on_alert
+        self.process = start_live_capture(iface, build_capture_filter())
+        self.flows = StreamingFlows(SlidingDetectors(horizon=horizon))
+        self.reader = self.flows.start(iter_stream(self.process.stdout))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        next_rotate = time.monotonic() + self.window
+        while not self._stop.is_set():
+            try:
+                alert, _ = self.flows.alerts.get(timeout=0.5)
+                self.on_alert(alert, f"live:{self.iface}")
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_rotate:
+                next_rotate += self.window
+                self.flows.rotate()
+                if not self.reader.is_alive():
+                    if self._stop.is_set():
+                        return
+                    console.print(
+                        f"[WARN] Live capture on {self.iface} stopped: "
+                        f"{self.process.error_output().strip() or 'no output'}",
+                        style="yellow"
+                    )
+                    return
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# -----------------------------
+# Daemon
+# -----------------------------
+
+class IDSDaemon:
+    """
+    Job dispatch and shared state behind the socket server.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        model_path: Optional[str] = None,
+        max_alerts: int = 10_000,
+        dedup_ttl: float = 3600.0
+    ):
+        if workers < 1:
+            raise ValueError("Workers must be a positive integer")
+
+        self.model_path = model_path
+        self.started = time.time()
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(model_path, multiprocessing.Barrier(workers))
+        )
+        # Start and initialize every worker now, so the first jobs don't
+        # pay for it: each _ready() blocks at the barrier until all
+        # ``workers`` calls are held by distinct processes
+        pids = {future.result() for future in [self.pool.submit(_ready) for _ in range(workers)]}
+        if len(pids) < workers:
+            console.print(
+                f"[WARN] Only {len(pids)} of {workers} workers started within "
+                f"{WARMUP_TIMEOUT:g}s; the rest start with the first jobs",
+                style="yellow"
+            )
+        self.workers = workers
+
+        self.live: Optional[LiveFeed] = None
+        self._alerts: deque = deque(maxlen=max_alerts)
+        self._dedup = DedupStore(ttl=dedup_ttl, max_size=max_alerts * 10)
+        self._lock = threading.Lock()
+
+        self._jobs = METRICS.counter("ids_daemon_jobs_total", "Analysis jobs completed", status="ok")
+        self._failed = METRICS.counter("ids_daemon_jobs_total", status="error")
+        self._latency = METRICS.histogram("ids_daemon_job_seconds", "Analysis job wall time")
+
+    def record_alert(self, alert: Dict, source: str) -> None:
+        with self._lock:
+            if source.startswith("live:") and self._dedup.seen(alert_key(alert)):
+                return
+            self._alerts.append(dict(alert, source=source, received_at=time.time()))
+
+    # -----------------------------
+    # Ops
+    # -----------------------------
+
+    def op_analyze(self, request: Dict) -> Dict:
+        pcap = request.get("pcap")
+        if not isinstance(pcap, str) or not pcap:
+            raise ValueError("analyze needs a 'pcap' path")
+
+        options = {}
+        for name, kind in ANALYZE_OPTIONS.items():
+            if request.get(name) is not None:
+                options[name] = kind(request[name])
+
+        started = time.perf_counter()
+        try:
+            result = self.pool.submit(_analyze, pcap, options, self.model_path).result()
+        except Exception:
+            with self._lock:
+                self._failed.inc()
+            raise
+
+        seconds = time.perf_counter() - started
+        # Handlers run on concurrent threads; metric updates are not atomic
+        with self._lock:
+            self._jobs.inc()
+            self._latency.observe(seconds)
+
+        for alert in result["alerts"]:
+            self.record_alert(alert, pcap)
+
+        console.print(
+            f"[INFO] Analyzed {pcap} in {seconds * 1000:.0f} ms: "
+            f"{len(result['alerts'])} alert(s)",
+            style="cyan"
+        )
+        return {
+            "pcap": pcap,
+            "alerts": result["alerts"],
+            "summary": dict(Counter(alert.get("type") for alert in result["alerts"])),
+            "seconds": seconds,
+        }
+
+    def op_alerts(self, request: Dict) -> Dict:
+        since = float(request.get("since") or 0)
+        limit = int(request.get("limit", 100))
+        with self._lock:
+            alerts = [alert for alert in self._alerts if alert["received_at"] > since]
+        return {"alerts": alerts[-limit:] if limit > 0 else alerts}
+
+    def op_status(self, request: Dict) -> Dict:
+        with self._lock:
+            jobs, failed = self._jobs.value, self._failed.value
+            alerts_held = len(self._alerts)
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "model": self.model_path,
+            "live": self.live.iface if self.live else None,
+            "jobs": jobs,
+            "failed_jobs": failed,
+            "alerts_held": alerts_held,
+        }
+
+    def handle(self, request: Dict) -> Dict:
+        op = request.get("op")
+        handler = getattr(self, f"op_{op}", None) if isinstance(op, str) else None
+        if handler is None:
+            return {"ok": False, "error": f"Unknown op: {op!r}"}
+        try:
+            return dict(handler(request), ok=True)
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def close(self) -> None:
+        if self.live is not None:
+            self.live.stop()
+        self.pool.shutdown(cancel_futures=True)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon: IDSDaemon = self.server.daemon
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as e:
+                reply = {"ok": False, "error": f"Bad request: {e}"}
+            else:
+                reply = daemon.handle(request)
+
+            self.wfile.write(json.dumps(reply, default=str).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+# ThreadingUnixStreamServer only exists where AF_UNIX does
+class _Server(getattr(socketserver, "ThreadingUnixStreamServer", socketserver.ThreadingTCPServer)):
+    daemon_threads = True
+
+
+def _claim_socket(socket_path: str) -> None:
+    """
+    Remove a stale socket file, refusing if a daemon still answers on it.
+    """
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"Another IDS daemon is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+def _terminate(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+
+def serve(
+    socket_path: Optional[str] = None,
+    workers: int = 2,
+    model_path: Optional[str] = None,
+    iface: Optional[str] = None,
+    window: float = 5.0
+) -> None:
+    """
+    Run the daemon until interrupted (Ctrl+C or SIGTERM). The socket is
+    created owner-only.
+    """
+    require_unix_sockets()
+    socket_path = socket_path or default_socket()
+    _claim_socket(socket_path)
+
+    daemon = IDSDaemon(workers=workers, model_path=model_path)
+    signal.signal(signal.SIGTERM, _terminate)
+    if iface:
+        daemon.live = LiveFeed(iface, daemon.record_alert, window=window)
+
+    previous = os.umask(0o177)
+    try:
+        server = _Server(socket_path, _Handler)
+    finally:
+        os.umask(previous)
+    server.daemon = daemon
+
+    details: List[str] = [f"{daemon.workers} workers"]
+    if model_path:
+        details.append(f"model {model_path}")
+    if iface:
+        details.append(f"live on {iface}")
+    console.print(
+        f"[INFO] IDS daemon listening on {socket_path} ({', '.join(details)})",
+        style="bold cyan"
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        console.print("\n[INFO] IDS daemon stopped", style="yellow")
+    finally:
+        server.server_close()
+        daemon.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
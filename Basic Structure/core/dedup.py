@@ -0,0 +1,231 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from rich.console import Console
+
+from core.metrics import METRICS
+
+console = Console()
+
+
+# =====================================================
+# ALERT DEDUPLICATION STORE
+# =====================================================
+#
+# Remembers which alert keys were reported recently. A key is suppressed
+# while it keeps recurring and forgotten ``ttl`` seconds after it was
+# last seen, so an attacker who comes back later is reported again.
+#
+# Entries live in an OrderedDict in last-seen order. With one TTL for
+# all keys that is also expiry order, so expired keys are always at the
+# front: lookups are O(1), and sweep() pops from the front, at most
+# ``SWEEP_BATCH`` keys per call, so a large expiry wave is spread over
+# several calls instead of stalling the detection loop.
+#
+# Expiry times are wall-clock, so a store saved to disk and reloaded
+# after a restart keeps suppressing what was recently reported. Periodic
+# saves snapshot the keys and write them on a background thread, so a
+# large store does not hold up detection; a failed write is reported and
+# retried at the next interval.
+
+STATE_VERSION = 1
+
+
+class DedupStore:
+    """
+    TTL- and size-bounded set of alert keys, optionally persisted to ``path``.
+    """
+
+    SWEEP_BATCH = 1024
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_size: int = 100_000,
+        path: Optional[str] = None,
+        save_interval: float = 60.0
+    ):
+        if ttl <= 0:
+            raise ValueError("Dedup TTL must be a positive number of seconds")
+        if max_size < 1:
+            raise ValueError("Dedup size must be a positive integer")
+        if path and not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            raise ValueError(
+                f"Dedup state directory does not exist: "
+                f"{os.path.dirname(os.path.abspath(path))}"
+            )
+
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+        self.save_interval = save_interval
+        self._expiry: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._dirty = False
+        self._next_save = time.monotonic() + save_interval
+        self._writer: Optional[threading.Thread] = None
+
+        self._metrics = {
+            "keys": METRICS.gauge("ids_dedup_keys", "Alert keys held by the dedup store"),
+            "expired": METRICS.counter(
+                "ids_dedup_expired_total", "Dedup keys forgotten after their TTL"),
+            "evicted": METRICS.counter(
+                "ids_dedup_evicted_total", "Dedup keys evicted to stay within max size"),
+        }
+
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def __contains__(self, key: Hashable) -> bool:
+        expiry = self._expiry.get(key)
+        return expiry is not None and expiry > time.time()
+
+    def seen(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """
+        Record a sighting of ``key``. True if it was already known (the
+        alert should be suppressed); either way its TTL restarts.
+        """
+        now = time.time() if now is None else now
+        expiry = self._expiry.pop(key, None)
+        self._expiry[key] = now + self.ttl
+        self._dirty = True
+
+        if expiry is None and len(self._expiry) > self.max_size:
+            self._expiry.popitem(last=False)
+            self._metrics["evicted"].inc()
+
+        return expiry is not None and expiry > now
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drop up to SWEEP_BATCH expired keys. Returns the number dropped.
+        """
+        now = time.time() if now is None else now
+        expiry = self._expiry
+        dropped = 0
+
+        while expiry and dropped < self.SWEEP_BATCH:
+            key, expires = next(iter(expiry.items()))
+            if expires > now:
+                break
+            del expiry[key]
+            dropped += 1
+
+        if dropped:
+            self._dirty = True
+            self._metrics["expired"].inc(dropped)
+        self._metrics["keys"].set(len(expiry))
+        return dropped
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+
+    def load(self) -> int:
+        """
+        Restore unexpired keys from ``path``. Returns the number loaded.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as state:
+                data = json.load(state)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            console.print(f"[WARN] Ignoring dedup state {self.path}: {e}", style="yellow")
+            return 0
+
+        if data.get("version") != STATE_VERSION:
+            return 0
+
+        now = time.time()
+        entries = sorted(
+            (expires, _to_key(key)) for key, expires in data.get("entries", [])
+            if expires > now
+        )
+        for expires, key in entries[-self.max_size:]:
+            self._expiry[key] = min(expires, now + self.ttl)
+
+        self._metrics["keys"].set(len(self._expiry))
+        return len(self._expiry)
+
+    def save(self, force: bool = False) -> bool:
+        """
+        Write the store to ``path`` if it changed, at most once every
+        ``save_interval`` seconds unless ``force``. Periodic saves run on a
+        background thread (True if one was started); a forced save waits
+        for it and writes in place (True if written).
+        """
+        if not self.path or not self._dirty:
+            return False
+        if not force and time.monotonic() < self._next_save:
+            return False
+
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            if not force:
+                return False
+            writer.join()
+
+        data = {
+            "version": STATE_VERSION,
+            "entries": [[list(key) if isinstance(key, tuple) else key, expires]
+                        for key, expires in self._expiry.items()],
+        }
+        self._dirty = False
+        self._next_save = time.monotonic() + self.save_interval
+
+        if force:
+            return self._write(data)
+
+        self._writer = threading.Thread(
+            target=self._write, args=(data,), name="dedup-save", daemon=True
+        )
+        self._writer.start()
+        return True
+
+    def _write(self, data: dict) -> bool:
+        """
+        Atomically replace ``path`` with ``data``. On failure the store
+        stays dirty, so the next save retries.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        out = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w", dir=directory, suffix=".tmp", delete=False, encoding="utf-8"
+            ) as out:
+                json.dump(data, out)
+            os.replace(out.name, self.path)
+        except OSError as e:
+            console.print(f"[WARN] Could not save dedup state {self.path}: {e}", style="yellow")
+            if out is not None:
+                try:
+                    os.unlink(out.name)
+                except OSError:
+                    pass
+            self._dirty = True
+            return False
+        return True
+
+
+def _to_key(value) -> Hashable:
+    """
+    JSON turns tuple keys into lists; turn them back.
+    """
+    return tuple(value) if isinstance(value, list) else value
+
+
+def alert_key(alert: dict) -> Tuple:
+    return (
+        alert.get("type"),
+        alert.get("src_ip"),
+        alert.get("dst_ip"),
+        alert.get("dst_port")
+    )
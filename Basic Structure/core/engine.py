@@ -1,16 +1,28 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 import os
+import queue
+import subprocess
 import time
 from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
 
-from .flows import generate_flows
-from .rules import (
-    detect_port_scan,
-    detect_flood,
-    detect_bruteforce
-)
-from core.capture import capture_traffic
-from ui.console import print_alert
+from .alerts import DEFAULT_RATE, AlertDispatcher, build_sinks
+from .broadcast import Broadcaster
+from .anomaly import DEFAULT_MAX_ALERTS, AnomalyScorer, ScoringResult, load_model
+from .cache import FlowCache
+from .dedup import DedupStore, alert_key
+from .flows import FileStats, expand_inputs, generate_flows, generate_flows_many
+from .flowtable import FlowTable
+from .live import MultiStreamingFlows, StreamingFlows
+from .metrics import METRICS, serve_metrics
+from .pcap import first_timestamp, iter_packets, iter_stream
+from .sketches import SketchDetectors
+from .sliding import SlidingDetectors
+from .store import FlowStore
+from .ruleengine import RULES, run_rules
+from . import rules  # noqa: F401  (registers the built-in rules)
+from core.capture import build_capture_filter, interface_packets, start_live_capture
 
 console = Console()
 
@@ -19,20 +31,75 @@ console = Console()
 # OFFLINE DETECTION
 # =====================================================
 
-def run_detection(pcap_file: str, debug: bool = False) -> List[Dict]:
+def report_scoring(result: ScoringResult, style: str = "cyan") -> None:
+    sampled = (
+        f" (sampled from {result.total} to fit the latency budget)"
+        if result.sampled else ""
+    )
+    console.print(
+        f"[INFO] Anomaly scoring: {result.scored} flows{sampled} in "
+        f"{result.seconds * 1000:.1f} ms "
+        f"({result.flows_per_sec:,.0f} flows/sec), "
+        f"{result.anomalies} above threshold",
+        style=style
+    )
+    if result.suppressed:
+        console.print(
+            f"[WARN] Reported the top {len(result.alerts)} anomalies by score; "
+            f"{result.suppressed} more were suppressed (raise --max-anomaly-alerts, "
+            f"0 reports all)",
+            style="yellow"
+        )
+
+
+def report_files(stats: List[FileStats], seconds: float, limit: int = 20) -> None:
     """
-    Run rule-based intrusion detection on a PCAP file.
+    Per-file timing table (first ``limit`` files in merge order) and
+    overall throughput of a multi-file run.
     """
-    console.print("[INFO] Starting intrusion analysis", style="cyan")
+    table = Table(title="Input Files", title_style="bold cyan")
+    table.add_column("File")
+    table.add_column("Packets", justify="right")
+    table.add_column("Flows", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Packets/sec", justify="right")
+
+    for item in stats[:limit]:
+        table.add_row(
+            os.path.basename(item.path),
+            str(item.packets),
+            str(item.flows),
+            "cached" if item.cached else f"{item.seconds:.2f}s",
+            "-" if item.cached else f"{item.packets_per_sec:,.0f}"
+        )
+    if len(stats) > limit:
+        table.add_row(f"... {len(stats) - limit} more", "", "", "", "")
 
-    flows = generate_flows(pcap_file)
+    console.print(table)
 
+    packets = sum(item.packets for item in stats)
+    console.print(
+        f"[INFO] Processed {packets} packets from {len(stats)} files in "
+        f"{seconds:.2f}s ({packets / max(seconds, 1e-9):,.0f} packets/sec, "
+        f"{sum(item.cached for item in stats)} from cache)",
+        style="green"
+    )
+
+
+def analyze_flows(
+    flows: Dict,
+    debug: bool = False,
+    scorer: Optional[AnomalyScorer] = None
+) -> Tuple[List[Dict], List[float]]:
+    """
+    Run the rule detectors over an already built set of flows, then the
+    anomaly model when a scorer is given.
+
+    Returns the alerts and, in step with them, the start time of the
+    earliest flow behind each one.
+    """
     if not flows:
-        console.print(
-            "[INFO] No valid network flows found in PCAP",
-            style="yellow"
-        )
-        return []
+        return [], []
 
     console.print(
         f"[INFO] Total flows generated: {len(flows)}",
@@ -50,16 +117,91 @@ def run_detection(pcap_file: str, debug: bool = False) -> List[Dict]:
                 f"pkts={flow.packet_count} dur={flow.duration:.3f}s"
             )
 
-    alerts: List[Dict] = []
+    console.print(
+        f"[INFO] Running {len(RULES)} detection rules: {', '.join(RULES)}",
+        style="cyan"
+    )
 
-    console.print("[INFO] Running port scan detection", style="cyan")
-    alerts.extend(detect_port_scan(flows))
+    report = run_rules(flows)
+    alerts: List[Dict] = report.alerts
+    first_seen: List[float] = report.first_seen
 
-    console.print("[INFO] Running brute-force detection", style="cyan")
-    alerts.extend(detect_bruteforce(flows))
+    console.print(
+        "[INFO] Rule timings: "
+        + ", ".join(
+            f"{name} {seconds * 1000:.1f} ms"
+            for name, seconds in report.rule_times.items()
+        )
+        + " | shared aggregates: "
+        + ", ".join(
+            f"{name} {seconds * 1000:.1f} ms"
+            for name, seconds in report.aggregate_times.items()
+        ),
+        style="cyan"
+    )
 
-    console.print("[INFO] Running flood detection", style="cyan")
-    alerts.extend(detect_flood(flows))
+    if scorer is not None:
+        result = scorer.score_flows(flows)
+        report_scoring(result)
+        alerts = alerts + result.alerts
+        first_seen = first_seen + result.first_seen
+
+    if not alerts:
+        console.print(
+            "[INFO] Analysis complete — no threats detected",
+            style="green"
+        )
+    else:
+        console.print(
+            f"[WARN] Analysis complete — {len(alerts)} threat(s) detected",
+            style="bold red"
+        )
+
+    return alerts, first_seen
+
+
+def analyze_with_sketches(
+    pcap_file: Union[str, List[str]],
+    debug: bool = False
+) -> List[Dict]:
+    """
+    Stream a capture through fixed-memory sketches instead of building
+    flows. For captures with too many sources / pairs to hold exactly.
+
+    A list of captures is streamed one after another in order of their
+    first packet, through the same sketches.
+    """
+    pcap_files = [pcap_file] if isinstance(pcap_file, str) else pcap_file
+    for name in pcap_files:
+        if not os.path.exists(name):
+            raise FileNotFoundError(f"PCAP file not found: {name}")
+
+    if len(pcap_files) > 1:
+        pcap_files = sorted(pcap_files, key=lambda name: (first_timestamp(name), name))
+
+    detectors = SketchDetectors()
+    update = detectors.update
+    packet_count = 0
+
+    for name in pcap_files:
+        console.print(f"[INFO] Parsing PCAP file: {name}", style="cyan")
+        for timestamp, _, key in iter_packets(name):
+            packet_count += 1
+            if key is not None:
+                update(key, timestamp)
+
+    console.print(
+        f"[INFO] Processed {packet_count} packets into "
+        f"{detectors.nbytes / 2 ** 20:.1f} MB of sketches",
+        style="green"
+    )
+
+    if debug:
+        console.print("[DEBUG] Heaviest sources:", style="blue")
+        for address, packets in detectors.top_sources(10):
+            console.print(f"  {address} | ~{packets} pkts")
+
+    alerts = detectors.report()
 
     if not alerts:
         console.print(
@@ -75,68 +217,531 @@ def run_detection(pcap_file: str, debug: bool = False) -> List[Dict]:
     return alerts
 
 
+def load_flows(
+    pcap_files: List[str],
+    workers: int = 1,
+    max_flows: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    active_timeout: Optional[float] = None,
+    use_cache: bool = True,
+    jobs: int = 1
+) -> FlowTable:
+    """
+    Flows of one capture, or of several merged into one table.
+    """
+    cache = FlowCache() if use_cache else None
+
+    if len(pcap_files) == 1:
+        return generate_flows(
+            pcap_files[0],
+            workers=workers,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout,
+            active_timeout=active_timeout,
+            cache=cache
+        )
+
+    started = time.perf_counter()
+    flows, stats = generate_flows_many(
+        pcap_files,
+        jobs=jobs,
+        max_flows=max_flows,
+        idle_timeout=idle_timeout,
+        active_timeout=active_timeout,
+        cache=cache
+    )
+    report_files(stats, time.perf_counter() - started)
+    return flows
+
+
+def store_results(
+    source: str,
+    alerts: List[Tuple[Dict, float]],
+    flows: Optional[FlowTable] = None
+) -> None:
+    """
+    Append an offline analysis to the flow store: the flows, and
+    (alert, timestamp) pairs, each alert stored at its timestamp.
+    """
+    started = time.perf_counter()
+    with FlowStore() as store:
+        if flows is not None:
+            store.put_flows(flows, source)
+        store.put_alerts(alerts, source)
+    console.print(
+        f"[INFO] Stored {len(flows) if flows is not None else 0} flows and "
+        f"{len(alerts)} alert(s) in {store.directory} "
+        f"({time.perf_counter() - started:.2f}s)",
+        style="cyan"
+    )
+
+
+def run_detection(
+    pcap_file: str,
+    debug: bool = False,
+    workers: int = 1,
+    max_flows: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    active_timeout: Optional[float] = None,
+    sketch: bool = False,
+    model_path: Optional[str] = None,
+    max_anomaly_alerts: int = DEFAULT_MAX_ALERTS,
+    use_cache: bool = True,
+    jobs: int = 1,
+    store: bool = False
+) -> List[Dict]:
+    """
+    Run rule-based intrusion detection on a PCAP file, plus anomaly
+    scoring when a trained model is given (at most ``max_anomaly_alerts``
+    ANOMALY alerts, 0 for all). Parsed flows are cached unless
+    ``use_cache`` is False.
+
+    ``pcap_file`` may also be a directory or glob: its captures are
+    parsed ``jobs`` at a time and analyzed as one merged flow set.
+
+    Flow limits left unset are taken from the model, so the scored flows
+    are built the way its training flows were.
+
+    With ``store``, the flows and alerts are appended to the flow store
+    (see core.store), each alert at the start of its earliest flow.
+    Sketch mode stores only the alerts, at the start of the capture.
+    """
+    pcap_files = expand_inputs(pcap_file)
+    if not pcap_files:
+        raise FileNotFoundError(f"No PCAP files found: {pcap_file}")
+
+    console.print("[INFO] Starting intrusion analysis", style="cyan")
+
+    scorer = (
+        AnomalyScorer(load_model(model_path), max_alerts=max_anomaly_alerts)
+        if model_path else None
+    )
+
+    if scorer is not None:
+        trained = scorer.model.flow_limits
+        given = {
+            "max_flows": max_flows,
+            "idle_timeout": idle_timeout,
+            "active_timeout": active_timeout,
+        }
+        if any(value is not None and value != trained[name] for name, value in given.items()):
+            console.print(
+                "[WARN] Flow limits differ from the model's training flows; "
+                "anomaly scores may drift",
+                style="yellow"
+            )
+        max_flows, idle_timeout, active_timeout = (
+            trained[name] if value is None else value
+            for name, value in given.items()
+        )
+
+    if sketch:
+        if scorer is not None:
+            console.print(
+                "[WARN] Anomaly scoring needs flows, skipped in sketch mode",
+                style="yellow"
+            )
+        alerts = analyze_with_sketches(pcap_files, debug=debug)
+        if store:
+            # The sketches keep no flow times: stamp alerts with the capture start
+            start = min(first_timestamp(name) for name in pcap_files)
+            start = start if start != float("inf") else time.time()
+            store_results(pcap_file, [(alert, start) for alert in alerts])
+        return alerts
+
+    flows = load_flows(
+        pcap_files,
+        workers=workers,
+        max_flows=max_flows,
+        idle_timeout=idle_timeout,
+        active_timeout=active_timeout,
+        use_cache=use_cache,
+        jobs=jobs
+    )
+
+    if not flows:
+        console.print(
+            "[INFO] No valid network flows found in PCAP",
+            style="yellow"
+        )
+        return []
+
+    alerts, first_seen = analyze_flows(flows, debug=debug, scorer=scorer)
+    if store:
+        store_results(pcap_file, list(zip(alerts, first_seen)), flows)
+    return alerts
+
+
 # =====================================================
-# LIVE IDS (WINDOW-BASED)
+# LIVE IDS (STREAMING)
 # =====================================================
 
+def report_interfaces(interfaces: Dict[str, Dict], seconds: float, final: bool = False) -> None:
+    """
+    Per-interface throughput and drops, for the last window or, with
+    ``final``, the whole run.
+    """
+    for name, stats in interfaces.items():
+        counts = stats if final else stats["window"]
+        packets = counts.get("packets", 0)
+        drops = [
+            f"{counts.get(key, 0):,} {label}"
+            for key, label in (
+                ("queue_dropped", "behind detection"),
+                ("nic_dropped", "by the NIC"),
+                ("capture_dropped", "by the kernel"),
+            )
+            if counts.get(key)
+        ]
+        console.print(
+            f"  {name}: {packets:,} packets, {packets / max(seconds, 1e-9):,.0f} pkt/s, "
+            f"{counts.get('bytes', 0) * 8 / max(seconds, 1e-9) / 1e6:.1f} Mbit/s, "
+            f"dropped {', '.join(drops) if drops else 'none'}"
+            + ("" if stats["active"] else " (stopped)"),
+            style="cyan"
+        )
+
+
 def run_live(
-    iface: str,
+    iface: Union[str, Sequence[str]],
     window: int = 5,
-    debug: bool = False
+    debug: bool = False,
+    horizon: float = 600.0,
+    max_flows: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    sketch: bool = False,
+    model_path: Optional[str] = None,
+    budget_ms: float = 50.0,
+    max_anomaly_alerts: int = DEFAULT_MAX_ALERTS,
+    metrics_port: Optional[int] = None,
+    metrics_json: Optional[str] = None,
+    alerts_jsonl: Optional[str] = None,
+    syslog_port: Optional[int] = None,
+    alert_rate: float = DEFAULT_RATE,
+    dedup_ttl: float = 3600.0,
+    dedup_max: int = 100_000,
+    dedup_state: Optional[str] = None,
+    ws_port: Optional[int] = None,
+    rule_names: Optional[List[str]] = None,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    rule_filter: bool = True,
+    store: bool = False
 ):
     """
-    Run LIVE intrusion detection using sliding capture windows.
-    Storage-safe: guarantees PCAP cleanup.
+    Run LIVE intrusion detection over a continuous capture stream.
+
+    One tshark process streams packets through a pipe into in-memory flow
+    aggregation and the incremental detectors. Alerts are printed as soon
+    as a threshold is crossed; detector state spans ``horizon`` seconds,
+    so slow scans across many windows are caught. Every ``window`` seconds
+    the finished window is summarised. No temp files, no gaps.
+
+    ``max_flows`` / ``idle_timeout`` bound each window's flow table, so a
+    randomized-port flood cannot exhaust memory between rotations.
+    ``sketch`` swaps the exact detectors for fixed-memory sketches, reset
+    every ``horizon`` seconds.
+
+    With ``model_path``, each finished window is scored by the anomaly
+    model within ``budget_ms``; larger windows are sampled. At most
+    ``max_anomaly_alerts`` anomalies per window are alerted (0 for all).
+
+    Stage timings, packet / flow / alert counts and alert latency are
+    always recorded (see core.metrics); ``metrics_port`` serves them as
+    Prometheus text on 127.0.0.1 and ``metrics_json`` rewrites a JSON
+    snapshot after every window.
+
+    Alerts are printed (and written to ``alerts_jsonl`` / local syslog on
+    ``syslog_port``) by a background AlertDispatcher, at most
+    ``alert_rate`` per second per type on the console and syslog; the
+    excess is summarised in roll-ups.
+
+    An alert key (type, src, dst, port) is reported again once it has
+    been quiet for ``dedup_ttl`` seconds; at most ``dedup_max`` keys are
+    remembered, and ``dedup_state`` keeps them across restarts.
+
+    ``ws_port`` publishes each window's flow rates and the current alerts
+    to WebSocket clients on 127.0.0.1 (see core.broadcast); the desktop
+    frontend connects to port 8181.
+
+    ``rule_names`` limits detection to some of port_scan, bruteforce and
+    flood. tshark is given a capture filter (see core.capture) keeping
+    only traffic those rules can use (unless ``rule_filter`` is off),
+    matching an ``include`` expression if any and no ``exclude``; each
+    window reports how many packets it dropped before parsing.
+
+    ``iface`` may list several interfaces: each is captured and aggregated
+    in its own worker process, feeding one set of detectors (see
+    core.live.MultiStreamingFlows), and windows report per-interface
+    throughput and drops.
+
+    With ``store``, each window's flows and newly reported alerts are
+    handed to a background FlowStore writer (see core.store).
     """
+    if window <= 0:
+        raise ValueError("Window must be a positive number of seconds")
+    interfaces = [iface] if isinstance(iface, str) else list(iface)
+    if not interfaces:
+        raise ValueError("At least one interface is needed")
+
+    windows_total = METRICS.counter("ids_windows_total", "Live windows closed")
+    window_flows = METRICS.gauge("ids_window_flows", "Flows in the last closed window")
+    detector_keys = METRICS.gauge("ids_detector_keys", "Keys tracked by the live detectors")
+    duplicates = METRICS.counter(
+        "ids_alerts_duplicate_total", "Alerts suppressed as already reported")
+    alert_latency = METRICS.histogram(
+        "ids_alert_latency_seconds", "Packet timestamp to alert queued for output")
+    anomaly_stage = METRICS.histogram("ids_stage_seconds", stage="anomaly")
+
+    server = None
+    if metrics_port is not None:
+        server = serve_metrics(metrics_port)
+        console.print(
+            f"[INFO] Metrics on http://127.0.0.1:{metrics_port}/metrics",
+            style="cyan"
+        )
+
     console.print(
-        f"[INFO] Starting LIVE IDS (window = {window}s)",
+        f"[INFO] Starting LIVE IDS (window = {window}s, horizon = {horizon:g}s)",
         style="bold cyan"
     )
 
-    seen_alerts = set()
+    if sketch:
+        detectors = SketchDetectors(horizon=horizon, rules=rule_names)
+    else:
+        detectors = SlidingDetectors(horizon=horizon, rules=rule_names)
+
+    capture_filter = build_capture_filter(
+        detectors.rules,
+        {"bruteforce": {"monitored_ports": detectors.monitored_ports}},
+        include=include,
+        exclude=exclude,
+        derive=rule_filter
+    )
+    console.print(
+        f"[INFO] Capture filter: {escape(capture_filter or 'none (all traffic)')}",
+        style="cyan"
+    )
+    filtered_total = METRICS.counter(
+        "ids_packets_filtered_total", "Packets dropped by the capture filter before parsing")
+
+    def packets_seen() -> Optional[int]:
+        counts = [interface_packets(name) for name in interfaces]
+        return None if None in counts else sum(counts)
+
+    interface_seen = packets_seen()
+    captured_total = filtered_reported = 0
+
+    scorer = None
+    if model_path:
+        scorer = AnomalyScorer(
+            load_model(model_path),
+            budget=budget_ms / 1000,
+            max_alerts=max_anomaly_alerts
+        )
+
+    dedup = DedupStore(ttl=dedup_ttl, max_size=dedup_max, path=dedup_state)
+    if len(dedup):
+        console.print(
+            f"[INFO] Restored {len(dedup)} recently reported alert(s) from {dedup_state}",
+            style="cyan"
+        )
+
+    dispatcher = AlertDispatcher(
+        build_sinks(jsonl_path=alerts_jsonl, syslog_port=syslog_port),
+        rate=alert_rate
+    )
+
+    broadcaster = None
+    if ws_port is not None:
+        broadcaster = Broadcaster(port=ws_port).start()
+        console.print(
+            f"[INFO] WebSocket feed on ws://127.0.0.1:{broadcaster.port}/ "
+            f"(deltas on /delta)",
+            style="cyan"
+        )
+
+    flow_store = None
+    if store:
+        flow_store = FlowStore()
+        console.print(f"[INFO] Storing flows and alerts in {flow_store.directory}", style="cyan")
+    source = f"live:{','.join(interfaces)}"
+
+    if len(interfaces) == 1:
+        process = start_live_capture(interfaces[0], capture_filter)
+        live_flows = StreamingFlows(
+            detectors,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout
+        )
+        reader = live_flows.start(iter_stream(process.stdout))
+    else:
+        process = None
+        live_flows = MultiStreamingFlows(
+            interfaces,
+            detectors,
+            capture_filter,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout
+        )
+        reader = live_flows.start()
+        console.print(
+            f"[INFO] Capturing on {', '.join(interfaces)} (one worker process each)",
+            style="cyan"
+        )
+    started_at = time.monotonic()
+
     iteration = 0
+    next_boundary = time.monotonic() + window
+
+    stored: List[Tuple[Dict, float]] = []
+
+    def emit(alert: Dict, timestamp: float) -> bool:
+        """
+        Queue an alert unless it was reported recently. True if queued.
+        """
+        # Recurring alerts stay on the dashboard while they recur
+        if broadcaster is not None:
+            broadcaster.add_alert(alert)
+
+        # Print only NEW alerts (avoid spam)
+        if dedup.seen(alert_key(alert)):
+            duplicates.inc()
+            return False
+
+        dispatcher.submit(alert)
+        if flow_store is not None:
+            stored.append((alert, timestamp))
+        METRICS.counter(
+            "ids_alerts_total", "Alerts reported, by type", type=alert.get("type")
+        ).inc()
+        return True
 
     try:
         while True:
             iteration += 1
-            pcap_file = f"live_window_{iteration}.pcap"
+            new_alerts = 0
+            latencies: List[float] = []
 
-            try:
-                console.print(
-                    f"\n[INFO] Capturing traffic window #{iteration}",
-                    style="cyan"
+            # Print alerts as they arrive until the window closes
+            while True:
+                remaining = next_boundary - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert, packet_time = live_flows.alerts.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+                if emit(alert, packet_time):
+                    new_alerts += 1
+                    latencies.append(time.time() - packet_time)
+                    alert_latency.observe(latencies[-1])
+
+            next_boundary += window
+            flows, packets = live_flows.rotate()
+
+            if live_flows.error is not None:
+                raise RuntimeError(
+                    f"Live capture stream failed: {live_flows.error}"
                 )
+            if process is not None and not reader.is_alive() and not packets:
+                raise RuntimeError(f"Live capture stopped:\n{process.error_output()}")
+
+            scoring = None
+            if scorer is not None and flows:
+                started = time.perf_counter()
+                scoring = scorer.score_flows(flows)
+                anomaly_stage.observe(time.perf_counter() - started)
+                now = time.time()
+                new_alerts += sum(emit(alert, now) for alert in scoring.alerts)
+
+            if broadcaster is not None:
+                broadcaster.publish(flows, window)
+            if flow_store is not None:
+                flow_store.put_flows(flows, source)
+                flow_store.put_alerts(stored, source)
+                stored.clear()
 
-                # Capture traffic
-                capture_traffic(iface, pcap_file, duration=window)
-
-                # Analyze traffic
-                alerts = run_detection(pcap_file, debug=debug)
-
-                # Print only NEW alerts (avoid spam)
-                for alert in alerts:
-                    key = (
-                        alert.get("type"),
-                        alert.get("src_ip"),
-                        alert.get("dst_ip"),
-                        alert.get("dst_port")
-                    )
-                    if key not in seen_alerts:
-                        seen_alerts.add(key)
-                        print_alert(alert)
-
-            finally:
-                # 🔒 GUARANTEED CLEANUP
-                if os.path.exists(pcap_file):
-                    try:
-                        os.remove(pcap_file)
-                    except Exception:
-                        pass
-
-            time.sleep(0.5)
+            windows_total.inc()
+            window_flows.set(len(flows))
+            detector_keys.set(live_flows.detectors.tracked_keys)
+            for reason, count in flows.evictions.items():
+                if count:
+                    METRICS.counter(
+                        "ids_flow_evictions_total",
+                        "Flows evicted from live window tables",
+                        reason=reason
+                    ).inc(count)
+            dedup.sweep()
+            dedup.save()
+            if metrics_json:
+                METRICS.dump_json(metrics_json)
+
+            summary = (
+                f"[INFO] Window #{iteration}: {packets} packets, "
+                f"{len(flows)} flows, {new_alerts} new alert(s)"
+            )
+            captured_total += packets
+            seen = packets_seen()
+            if capture_filter and seen is not None and interface_seen is not None:
+                # Cumulative, as the interface counters run slightly
+                # ahead of the packets that made it through the pipe
+                filtered = max(seen - interface_seen - captured_total - filtered_reported, 0)
+                filtered_reported += filtered
+                filtered_total.inc(filtered)
+                summary += f", {filtered} filtered out before parsing"
+            evicted = sum(flows.evictions.values())
+            if evicted:
+                summary += f", {evicted} flows evicted"
+            if latencies:
+                summary += (
+                    f", alert latency avg {sum(latencies) / len(latencies) * 1000:.1f} ms"
+                    f" / max {max(latencies) * 1000:.1f} ms"
+                )
+            console.print(summary, style="cyan")
+            if process is None:
+                report_interfaces(live_flows.interfaces, window)
+            if scoring is not None:
+                report_scoring(scoring)
+
+            if debug:
+                console.print(
+                    f"[DEBUG] Detector state: "
+                    f"{live_flows.detectors.tracked_keys} tracked keys",
+                    style="blue"
+                )
 
     except KeyboardInterrupt:
         console.print(
             "\n[INFO] Live IDS stopped by user",
             style="yellow"
         )
+        if capture_filter and interface_seen is not None:
+            seen = captured_total + filtered_reported
+            console.print(
+                f"[INFO] Capture filter dropped {filtered_reported:,} of {seen:,} "
+                f"packets before parsing ({filtered_reported / max(seen, 1):.0%})",
+                style="cyan"
+            )
+
+    finally:
+        dedup.save(force=True)
+        dispatcher.close()
+        if broadcaster is not None:
+            broadcaster.close()
+        if flow_store is not None:
+            flow_store.put_alerts(stored, source)
+            flow_store.close()
+        if server is not None:
+            server.shutdown()
+        if process is None:
+            live_flows.close()
+            console.print("[INFO] Capture totals:", style="cyan")
+            report_interfaces(live_flows.interfaces, time.monotonic() - started_at, final=True)
+        else:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
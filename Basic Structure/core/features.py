@@ -1,5 +1,9 @@
-from typing import Dict, List
-from core.flows import Flow
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from core.flowtable import FlowTable
+from core.pcap import iter_packets
 
 
 PROTOCOL_MAP = {
@@ -8,6 +12,27 @@ PROTOCOL_MAP = {
     "ICMP": 3
 }
 
+# Feature vector layout (columns of the arrays below)
+FEATURE_NAMES = (
+    "duration",          # flow duration
+    "packet_count",      # total packets
+    "byte_count",        # total bytes
+    "packets_per_sec",   # packet rate
+    "bytes_per_sec",     # byte rate
+    "protocol_id",
+    "src_port",
+    "dst_port",
+)
+
+# Rows per chunk for the streaming variants (~2 MB of float32 features)
+CHUNK_SIZE = 65536
+
+# IP protocol number -> PROTOCOL_MAP id, as a lookup table
+_PROTOCOL_IDS = np.zeros(256, dtype=np.float32)
+_PROTOCOL_IDS[6] = PROTOCOL_MAP["TCP"]
+_PROTOCOL_IDS[17] = PROTOCOL_MAP["UDP"]
+_PROTOCOL_IDS[1] = PROTOCOL_MAP["ICMP"]
+
 
 def protocol_to_id(protocol: str) -> int:
     """
@@ -29,30 +54,151 @@ def safe_port(port: str) -> int:
         return 0
 
 
-def extract_features(flows: Dict) -> List[List[float]]:
+# -----------------------------
+# In-memory extraction
+# -----------------------------
+
+def extract_features(flows: Dict, rows: Optional[np.ndarray] = None) -> np.ndarray:
     """
-    Convert flows into numerical feature vectors.
+    Convert flows into a (flows, len(FEATURE_NAMES)) float32 array.
     Safe for offline ML / statistical analysis.
+
+    Computed column-wise on the FlowTable; plain flow dicts are converted
+    first. ``rows`` restricts the output to those table rows.
     """
-    feature_vectors: List[List[float]] = []
+    table = FlowTable.from_flows(flows)
+
+    def column(name: str) -> np.ndarray:
+        values = table.column(name)
+        return values if rows is None else values[rows]
+
+    duration = np.maximum(column("end_time") - column("start_time"), 0.001)
+    packets = column("packet_count")
+    byte_count = column("byte_count")
+    features = np.empty((len(packets), len(FEATURE_NAMES)), dtype=np.float32)
+
+    features[:, 0] = duration
+    features[:, 1] = packets
+    features[:, 2] = byte_count
+    features[:, 3] = packets / duration
+    features[:, 4] = byte_count / duration
+    features[:, 5] = _PROTOCOL_IDS[column("protocol")]
+    features[:, 6] = column("src_port")
+    features[:, 7] = column("dst_port")
+
+    return features
+
+
+# -----------------------------
+# Streaming extraction
+# -----------------------------
+
+def _rechunk(blocks: Iterable[np.ndarray], chunk_size: int) -> Iterator[np.ndarray]:
+    """
+    Regroup feature blocks of any size into chunks of ``chunk_size`` rows
+    (the last one may be shorter).
+    """
+    pending: List[np.ndarray] = []
+    rows = 0
+
+    for block in blocks:
+        pending.append(block)
+        rows += len(block)
+        if rows < chunk_size:
+            continue
+
+        merged = np.concatenate(pending)
+        full = rows - rows % chunk_size
+        for start in range(0, full, chunk_size):
+            yield merged[start:start + chunk_size]
+        pending, rows = [merged[full:]], rows - full
+
+    if rows:
+        yield np.concatenate(pending)
 
-    for flow in flows.values():
-        duration = max(flow.duration, 1e-6)
 
-        packets_per_sec = flow.packet_count / duration
-        bytes_per_sec = flow.byte_count / duration
+def iter_feature_chunks(
+    flows: Dict,
+    chunk_size: int = CHUNK_SIZE
+) -> Iterator[np.ndarray]:
+    """
+    Features of an in-memory flow set, ``chunk_size`` rows at a time.
+    """
+    features = extract_features(flows)
+    for start in range(0, len(features), chunk_size):
+        yield features[start:start + chunk_size]
+
+
+def stream_features(
+    pcap_file: str,
+    chunk_size: int = CHUNK_SIZE,
+    idle_timeout: float = 60.0,
+    active_timeout: float = 300.0,
+    max_flows: Optional[int] = 1_000_000
+) -> Iterator[np.ndarray]:
+    """
+    Features for a capture too large to hold as flows.
+
+    Packets go through a bounded FlowTable; every flow it expires (idle,
+    active or capacity) becomes a feature row, and rows are yielded in
+    chunks of ``chunk_size``. Long flows are cut at ``active_timeout``,
+    NetFlow-style.
+    """
+    expired: List[np.ndarray] = []
+
+    def on_expire(batch: FlowTable, reason: str) -> None:
+        expired.append(extract_features(batch))
+
+    table = FlowTable(
+        max_flows=max_flows,
+        idle_timeout=idle_timeout,
+        active_timeout=active_timeout,
+        on_expire=on_expire
+    )
+
+    def blocks() -> Iterator[np.ndarray]:
+        add_packet = table.add_packet
+        for timestamp, length, key in iter_packets(pcap_file):
+            if key is None:
+                continue
+            add_packet(key, timestamp, length)
+            if expired:
+                yield from expired
+                expired.clear()
+
+        yield from expired
+        yield extract_features(table)
+
+    return _rechunk(blocks(), chunk_size)
+
+
+def save_features(chunks: Iterable[np.ndarray], path: str) -> np.ndarray:
+    """
+    Write feature chunks to a .npy file without holding them all in
+    memory, and return it memory-mapped read-only.
+
+    The header is written first with 0 rows and rewritten with the final
+    count; NumPy pads .npy headers so the row count can grow in place.
+    """
+    header = {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+        "fortran_order": False,
+        "shape": (0, len(FEATURE_NAMES)),
+    }
+    rows = 0
+
+    with open(path, "wb") as out:
+        np.lib.format.write_array_header_1_0(out, header)
+        data_start = out.tell()
 
-        vector = [
-            duration,                    # flow duration
-            flow.packet_count,           # total packets
-            flow.byte_count,             # total bytes
-            packets_per_sec,             # packet rate
-            bytes_per_sec,               # byte rate
-            protocol_to_id(flow.protocol),
-            safe_port(flow.src_port),    # SAFE port encoding
-            safe_port(flow.dst_port),
-        ]
+        for chunk in chunks:
+            np.ascontiguousarray(chunk, dtype=np.float32).tofile(out)
+            rows += len(chunk)
 
-        feature_vectors.append(vector)
+        out.seek(0)
+        header["shape"] = (rows, len(FEATURE_NAMES))
+        np.lib.format.write_array_header_1_0(out, header)
+        if out.tell() != data_start:
+            raise RuntimeError(f"Could not finalise .npy header of {path}")
 
-    return feature_vectors
+    return np.load(path, mmap_mode="r")
@@ -1,9 +1,19 @@
+import glob
 import os
-import pyshark
+import socket
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from functools import partial
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
 from rich.console import Console
 
+from core.cache import FlowCache
+from core.pcap import iter_packets, split_capture, ByteRange, UnsupportedCapture
+
 console = Console()
 
 
@@ -27,13 +37,171 @@ class Flow:
 FlowKey = Tuple[str, str, str, str, str]
 
 
-def generate_flows(pcap_file: str) -> Dict[FlowKey, Flow]:
-    if not os.path.exists(pcap_file):
-        raise FileNotFoundError(f"PCAP file not found: {pcap_file}")
+BACKENDS = ("auto", "native", "tshark", "pyshark")
 
-    flows: Dict[FlowKey, Flow] = {}
+# Fields the tshark backend extracts, one tab-separated line per packet.
+# Only first occurrences are printed: for an ICMP error that is the outer
+# IP header and the quoted TCP / UDP ports, as pyshark reports them.
+TSHARK_FIELDS = (
+    "frame.time_epoch",
+    "frame.len",
+    "ip.src",
+    "ip.dst",
+    "tcp.srcport",
+    "tcp.dstport",
+    "udp.srcport",
+    "udp.dstport",
+)
+# Bytes of tshark output parsed per chunk
+TSHARK_CHUNK = 4 * 1024 * 1024
+# Most distinct address / port lines remembered by the tshark backend
+TSHARK_KEY_CACHE = 1 << 20
 
-    console.print(f"[INFO] Parsing PCAP file: {pcap_file}", style="cyan")
+
+# -----------------------------
+# Bounded flow tables
+# -----------------------------
+
+def _new_tables(limits: dict):
+    """
+    Returns (active, result, overflow) tables.
+
+    Without limits, active and result are the same unbounded table and
+    there is no overflow. With limits, the active table evicts flows
+    into ``result``, rolled up to (src, dst, dst_port, protocol) so
+    random source ports cannot grow it. With max_flows, ``result`` is
+    capped too: its least recently seen flows roll up further into
+    ``overflow``, as per-(src, protocol) totals, and ``overflow``'s own
+    least recently seen are dropped (counted in evictions["dropped"]).
+    Each table holds at most max_flows, whatever the traffic.
+
+    Roll-ups keep what the rules group by (port scans and brute force
+    see every flow until rolled up per source; floods keep per-source
+    totals) but zero the source port, so a limited run's src_port
+    features and anomaly scores differ from an unlimited one.
+    """
+    from core.flowtable import FlowTable
+
+    if not any(value is not None for value in limits.values()):
+        table = FlowTable()
+        return table, table, None
+
+    max_flows = limits.get("max_flows")
+    overflow = FlowTable(max_flows=max_flows)
+
+    def spill(batch, reason):
+        overflow.merge(batch, ordered=False, per_source=True)
+
+    result = FlowTable(max_flows=max_flows, on_expire=spill)
+
+    def on_expire(batch, reason):
+        result.merge(batch, ordered=False, drop_src_port=True)
+
+    return FlowTable(on_expire=on_expire, **limits), result, overflow
+
+
+def _finish_tables(active, result, overflow):
+    """
+    Fold the flows still active, and the rolled-up overflow, into one
+    (uncapped) result table.
+    """
+    if active is result:
+        return result
+
+    rolled_up = result.evictions["capacity"]
+    dropped = overflow.evictions["capacity"]
+    result.max_flows = None
+    result.on_expire = None
+    result.evictions = {reason: 0 for reason in result.evictions}
+    overflow.evictions = {}
+
+    result.merge(active, ordered=False)
+    result.merge(overflow, ordered=False)
+    result.evictions["rolled_up"] = rolled_up
+    result.evictions["dropped"] = dropped
+    return result
+
+
+def _flows_native(
+    pcap_file: str,
+    table,
+    byte_range: Optional[ByteRange] = None
+) -> int:
+    """
+    Fill a FlowTable with the built-in memory-mapped reader.
+    Returns the number of packets read.
+    """
+    packet_count = 0
+    add_packet = table.add_packet
+
+    for timestamp, length, key in iter_packets(pcap_file, byte_range):
+        packet_count += 1
+        if key is not None:
+            add_packet(key, timestamp, length)
+
+    return packet_count
+
+
+def _flows_shard(pcap_file: str, byte_range: ByteRange, limits: dict):
+    """
+    Worker entry point: build a partial FlowTable for one byte range.
+    """
+    active, table, overflow = _new_tables(limits)
+    packet_count = _flows_native(pcap_file, active, byte_range)
+    table = _finish_tables(active, table, overflow)
+    table.compact()
+    return table, packet_count
+
+
+def _flows_parallel(pcap_file: str, workers: int, limits: dict):
+    """
+    Parse record-aligned shards of the capture in a process pool and merge
+    the partial tables in file order. Returns (table, packet_count).
+    """
+    ranges = split_capture(pcap_file, workers)
+    if len(ranges) < 2:
+        return _flows_shard(pcap_file, ranges[0], limits)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        shards = list(pool.map(
+            _flows_shard, repeat(pcap_file), ranges, repeat(limits)
+        ))
+
+    flows, packet_count = shards[0]
+    for table, count in shards[1:]:
+        flows.merge(table)
+        packet_count += count
+
+    return flows, packet_count
+
+
+def _flows_sharded(pcap_file: str, workers: int, limits: dict):
+    """
+    Native parse, sharded across worker processes when workers > 1.
+    A shard that cannot be read independently falls back to one process.
+    """
+    if workers > 1:
+        try:
+            return _flows_parallel(pcap_file, workers, limits)
+        except UnsupportedCapture as e:
+            console.print(
+                f"[INFO] Parallel parsing unavailable ({e}), "
+                f"using a single process",
+                style="yellow"
+            )
+
+    active, table, overflow = _new_tables(limits)
+    packet_count = _flows_native(pcap_file, active)
+    return _finish_tables(active, table, overflow), packet_count
+
+
+def _flows_pyshark(pcap_file: str, table) -> int:
+    """
+    Fill a FlowTable through pyshark / tshark dissection.
+    Slow, but understands every format and link type tshark does.
+    """
+    import pyshark
+    from core.flowtable import PROTOCOL_NUMBERS, encode_key
 
     capture = pyshark.FileCapture(
         pcap_file,
@@ -41,6 +209,7 @@ def generate_flows(pcap_file: str) -> Dict[FlowKey, Flow]:
     )
 
     packet_count = 0
+    unsupported = 0
 
     for packet in capture:
         try:
@@ -52,6 +221,9 @@ def generate_flows(pcap_file: str) -> Dict[FlowKey, Flow]:
             protocol = packet.transport_layer
             if protocol is None:
                 continue
+            if protocol.upper() not in PROTOCOL_NUMBERS:
+                unsupported += 1
+                continue
 
             layer = packet[protocol.lower()]
 
@@ -70,23 +242,7 @@ def generate_flows(pcap_file: str) -> Dict[FlowKey, Flow]:
                 protocol,
             )
 
-            if key not in flows:
-                flows[key] = Flow(
-                    src_ip=key[0],
-                    dst_ip=key[1],
-                    src_port=key[2],
-                    dst_port=key[3],
-                    protocol=key[4],
-                    start_time=timestamp,
-                    end_time=timestamp,
-                    packet_count=1,
-                    byte_count=length,
-                )
-            else:
-                flow = flows[key]
-                flow.packet_count += 1
-                flow.byte_count += length
-                flow.end_time = timestamp
+            table.add_packet(encode_key(key), timestamp, length)
 
         except AttributeError:
             # Known pyshark parsing issue — safe to ignore
@@ -100,10 +256,393 @@ def generate_flows(pcap_file: str) -> Dict[FlowKey, Flow]:
 
     capture.close()
 
+    if unsupported:
+        console.print(
+            f"[WARN] Skipped {unsupported} packet(s) with an unsupported transport protocol",
+            style="yellow"
+        )
+
+    return packet_count
+
+
+def _tshark_key(fields: bytes) -> int:
+    """
+    Packed flow key for the address / port fields of one tshark line, or
+    -1 when the packet has no IPv4 TCP / UDP layer.
+    """
+    from core.flowtable import pack_key
+
+    src, dst, tcp_src, tcp_dst, udp_src, udp_dst = fields.split(b"\t")
+    if not src or not dst:
+        return -1
+    if tcp_src or tcp_dst:
+        protocol, src_port, dst_port = 6, tcp_src, tcp_dst
+    elif udp_src or udp_dst:
+        protocol, src_port, dst_port = 17, udp_src, udp_dst
+    else:
+        return -1
+
+    return pack_key(
+        int.from_bytes(socket.inet_aton(src.decode("ascii")), "big"),
+        int.from_bytes(socket.inet_aton(dst.decode("ascii")), "big"),
+        int(src_port or 0),
+        int(dst_port or 0),
+        protocol,
+    )
+
+
+def _flows_tshark(pcap_file: str, table) -> int:
+    """
+    Fill a FlowTable from a single tshark run in field-extraction mode.
+
+    tshark still dissects every format and encapsulation it knows (pcapng,
+    VLAN / MPLS, tunnels, odd link types), but only TSHARK_FIELDS cross
+    the pipe. The text is read in large chunks and each line's flow key is
+    cached by its address / port text, so most packets cost one split and
+    a dict lookup.
+    """
+    from core.capture import check_tshark
+
+    check_tshark()
+    command = [
+        "tshark", "-r", pcap_file, "-n",
+        "-T", "fields", "-E", "separator=/t", "-E", "occurrence=f",
+    ]
+    for field in TSHARK_FIELDS:
+        command.extend(["-e", field])
+
+    keys: Dict[bytes, int] = {}
+    add_packet = table.add_packet
+    packet_count = 0
+    malformed = 0
+
+    def consume(lines: List[bytes]) -> None:
+        nonlocal malformed
+        for line in lines:
+            try:
+                timestamp, length, fields = line.split(b"\t", 2)
+                key = keys.get(fields)
+                if key is None:
+                    if len(keys) >= TSHARK_KEY_CACHE:
+                        keys.clear()
+                    key = keys[fields] = _tshark_key(fields)
+                if key >= 0:
+                    add_packet(key, float(timestamp), int(length))
+            except (ValueError, OSError):
+                malformed += 1
+
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        tail = b""
+        for chunk in iter(partial(process.stdout.read, TSHARK_CHUNK), b""):
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            packet_count += len(lines)
+            consume(lines)
+        if tail:
+            packet_count += 1
+            consume([tail])
+        process.stdout.close()
+        process.wait()
+
+        errors.seek(0)
+        message = errors.read().decode(errors="replace").strip()
+
+    if process.returncode != 0:
+        if not packet_count:
+            raise RuntimeError(f"tshark could not read {pcap_file}:\n{message}")
+        # e.g. a capture cut short mid-packet: keep what was read
+        console.print(f"[WARN] tshark: {message}", style="yellow")
+    if malformed:
+        console.print(
+            f"[WARN] Skipped {malformed} malformed packet(s)",
+            style="yellow"
+        )
+
+    return packet_count
+
+
+def generate_flows(
+    pcap_file: str,
+    backend: str = "auto",
+    workers: int = 1,
+    max_flows: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    active_timeout: Optional[float] = None,
+    cache: Optional[FlowCache] = None
+) -> Dict[FlowKey, Flow]:
+    """
+    Build flows from a PCAP / PCAPNG file.
+
+    Returns a columnar FlowTable, which reads like Dict[FlowKey, Flow].
+
+    backend:
+      - auto    : native reader, tshark fallback for unsupported captures
+      - native  : native reader only
+      - tshark  : always dissect through tshark (field extraction)
+      - pyshark : always dissect through pyshark (slowest; for comparison)
+
+    workers > 1 splits the capture into record-aligned byte ranges parsed
+    by a process pool (native reader only). The result is identical to a
+    single-process run.
+
+    max_flows / idle_timeout / active_timeout bound the active flow table
+    (per worker). Evicted flows are rolled up by (src, dst, dst_port,
+    protocol), and with max_flows further to per-source totals and then
+    dropped (see _new_tables), so memory stays bounded; src_port
+    features then differ from an unlimited run. Eviction counts are in
+    the result's ``evictions``.
+
+    With a ``cache``, the parsed table is saved keyed by the capture's
+    content and options, and later calls load it instead of re-parsing.
+    """
+    if not os.path.exists(pcap_file):
+        raise FileNotFoundError(f"PCAP file not found: {pcap_file}")
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown flow backend: {backend}")
+
+    if workers < 1:
+        raise ValueError("Workers must be a positive integer")
+
+    limits = {
+        "max_flows": max_flows,
+        "idle_timeout": idle_timeout,
+        "active_timeout": active_timeout,
+    }
+
+    flows, _, _ = _load_or_parse(pcap_file, backend, workers, limits, cache)
+    return flows
+
+
+def _load_or_parse(
+    pcap_file: str,
+    backend: str,
+    workers: int,
+    limits: dict,
+    cache: Optional[FlowCache]
+):
+    """
+    Body of generate_flows(). Returns (table, packet_count, from_cache).
+    """
+    options = dict(limits, backend=backend if backend in ("tshark", "pyshark") else "native")
+    if cache is not None:
+        try:
+            cached = cache.load(pcap_file, options)
+        except OSError as e:
+            console.print(f"[WARN] Flow cache unavailable: {e}", style="yellow")
+            cache, cached = None, None
+
+        if cached is not None:
+            flows, packet_count = cached
+            console.print(
+                f"[INFO] Loaded {len(flows)} flows ({packet_count} packets) "
+                f"from cache for {pcap_file}",
+                style="green"
+            )
+            return flows, packet_count, True
+
+    console.print(f"[INFO] Parsing PCAP file: {pcap_file}", style="cyan")
+
+    if backend in ("tshark", "pyshark"):
+        active, flows, overflow = _new_tables(limits)
+        if backend == "tshark":
+            packet_count = _flows_tshark(pcap_file, active)
+        else:
+            packet_count = _flows_pyshark(pcap_file, active)
+        flows = _finish_tables(active, flows, overflow)
+    else:
+        try:
+            flows, packet_count = _flows_sharded(pcap_file, workers, limits)
+        except UnsupportedCapture as e:
+            if backend == "native":
+                raise
+            console.print(
+                f"[INFO] Native reader cannot decode capture ({e}), "
+                f"falling back to tshark",
+                style="yellow"
+            )
+            active, flows, overflow = _new_tables(limits)
+            packet_count = _flows_tshark(pcap_file, active)
+            flows = _finish_tables(active, flows, overflow)
+
+    flows.compact()
+
+    evictions = flows.evictions
+    evicted = sum(evictions.get(reason, 0) for reason in ("idle", "active", "capacity"))
+    if evicted:
+        summary = (
+            f"[INFO] Evicted {evicted} flows "
+            f"(idle={evictions.get('idle', 0)}, "
+            f"active={evictions.get('active', 0)}, "
+            f"capacity={evictions.get('capacity', 0)})"
+        )
+        if evictions.get("rolled_up") or evictions.get("dropped"):
+            summary += (
+                f"; {evictions.get('rolled_up', 0)} rolled up per source, "
+                f"{evictions.get('dropped', 0)} dropped"
+            )
+        console.print(summary, style="cyan")
+        if evictions.get("rolled_up"):
+            console.print(
+                "[WARN] Flows rolled up per source lose their destination ports; "
+                "raise --max-flows if port scans or brute force go undetected",
+                style="yellow"
+            )
+        console.print(
+            "[WARN] Evicted flows are rolled up without source ports: src_port "
+            "features and anomaly scores differ from an unlimited run",
+            style="yellow"
+        )
+
     console.print(
         f"[INFO] Processed {packet_count} packets, "
         f"generated {len(flows)} flows",
         style="green"
     )
 
-    return flows
+    if cache is not None:
+        try:
+            cache.store(pcap_file, options, flows, packet_count)
+        except OSError as e:
+            console.print(f"[WARN] Could not cache flows: {e}", style="yellow")
+
+    return flows, packet_count, False
+
+
+# -----------------------------
+# Multi-file analysis
+# -----------------------------
+
+CAPTURE_EXTENSIONS = (".pcap", ".pcapng", ".cap")
+
+
+@dataclass
+class FileStats:
+    path: str
+    packets: int
+    flows: int
+    seconds: float
+    first_seen: float
+    cached: bool = False
+
+    @property
+    def packets_per_sec(self) -> float:
+        return self.packets / max(self.seconds, 1e-9)
+
+
+def expand_inputs(path: str) -> List[str]:
+    """
+    Captures named by a file, a directory (its *.pcap / *.pcapng / *.cap
+    files) or a glob pattern, sorted by name. Empty if nothing matches.
+    """
+    if os.path.isdir(path):
+        candidates = [
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(CAPTURE_EXTENSIONS)
+        ]
+    elif any(char in path for char in "*?["):
+        candidates = glob.glob(path)
+    else:
+        candidates = [path]
+
+    return sorted(name for name in candidates if os.path.isfile(name))
+
+
+def _quiet_worker() -> None:
+    """
+    Pool initializer: per-file progress is reported by the parent.
+    """
+    console.quiet = True
+
+
+def _flows_file(pcap_file: str, backend: str, limits: dict, cache: Optional[FlowCache]):
+    """
+    Worker entry point: flows of one whole capture. Returns (table, FileStats).
+    """
+    started = time.perf_counter()
+    table, packet_count, cached = _load_or_parse(pcap_file, backend, 1, limits, cache)
+
+    starts = table.column("start_time")
+    stats = FileStats(
+        path=pcap_file,
+        packets=packet_count,
+        flows=len(table),
+        seconds=time.perf_counter() - started,
+        first_seen=float(starts.min()) if len(starts) else float("inf"),
+        cached=cached
+    )
+    return table, stats
+
+
+def generate_flows_many(
+    pcap_files: List[str],
+    jobs: int = 1,
+    backend: str = "auto",
+    max_flows: Optional[int] = None,
+    idle_timeout: Optional[float] = None,
+    active_timeout: Optional[float] = None,
+    cache: Optional[FlowCache] = None
+):
+    """
+    Build one flow table from many captures (e.g. a rotated capture set).
+
+    Files are parsed ``jobs`` at a time in a process pool, each as a
+    whole (limits and cache apply per file), then merged in order of
+    their first packet. Flows that cross a file boundary are joined with
+    min(start) / max(end), so a scan or brute force split over several
+    files is seen as one.
+
+    Returns (table, per-file FileStats in merge order).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown flow backend: {backend}")
+
+    if jobs < 1:
+        raise ValueError("Jobs must be a positive integer")
+
+    for pcap_file in pcap_files:
+        if not os.path.exists(pcap_file):
+            raise FileNotFoundError(f"PCAP file not found: {pcap_file}")
+
+    limits = {
+        "max_flows": max_flows,
+        "idle_timeout": idle_timeout,
+        "active_timeout": active_timeout,
+    }
+
+    console.print(
+        f"[INFO] Parsing {len(pcap_files)} PCAP files "
+        f"({min(jobs, len(pcap_files))} at a time)",
+        style="cyan"
+    )
+
+    if jobs > 1 and len(pcap_files) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(pcap_files)),
+            initializer=_quiet_worker
+        ) as pool:
+            results = list(pool.map(
+                _flows_file, pcap_files,
+                repeat(backend), repeat(limits), repeat(cache)
+            ))
+    else:
+        quiet, console.quiet = console.quiet, True
+        try:
+            results = [
+                _flows_file(pcap_file, backend, limits, cache)
+                for pcap_file in pcap_files
+            ]
+        finally:
+            console.quiet = quiet
+
+    results.sort(key=lambda result: (result[1].first_seen, result[1].path))
+
+    from core.flowtable import FlowTable
+
+    flows = FlowTable()
+    for table, _ in results:
+        flows.merge(table, ordered=False)
+    flows.compact()
+
+    return flows, [stats for _, stats in results]
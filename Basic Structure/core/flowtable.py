@@ -0,0 +1,695 @@
+import socket
+import struct
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.flows import Flow, FlowKey
+
+
+# =====================================================
+# COLUMNAR FLOW TABLE
+# =====================================================
+#
+# Flows are stored struct-of-arrays: one NumPy column per field, with
+# addresses, ports and protocols integer-encoded. A dict maps a packed
+# integer flow key to its row.
+#
+# Packed key layout (a single Python int):
+#   IPv4: src(32) | dst(32) | src_port(16) | dst_port(16) | protocol(8)
+#   IPv6: V6_FLAG | src(128) | dst(128) | src_port(16) | dst_port(16) | protocol(8)
+
+# Transport protocols a flow key can name; encode_key rejects others
+PROTOCOL_NUMBERS = {"ICMP": 1, "TCP": 6, "UDP": 17, "DCCP": 33, "SCTP": 132}
+PROTOCOL_NAMES = {number: name for name, number in PROTOCOL_NUMBERS.items()}
+
+V6_FLAG = 1 << 296
+# Packed-key bits below the source address (destination and ports)
+_V4_ROLLUP = ((1 << 64) - 1) << 8
+_V6_ROLLUP = ((1 << 160) - 1) << 8
+
+PORT_NAMES = tuple(str(p) for p in range(65536))
+
+_MASK32 = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+_MASK128 = (1 << 128) - 1
+
+COLUMNS = {
+    "family": np.uint8,
+    "src_ip": np.uint32,
+    "dst_ip": np.uint32,
+    "src_port": np.uint16,
+    "dst_port": np.uint16,
+    "protocol": np.uint8,
+    "start_time": np.float64,
+    "end_time": np.float64,
+    "packet_count": np.int64,
+    "byte_count": np.int64,
+}
+
+# (rows, 2) uint64 columns holding high / low halves of IPv6 addresses.
+# Only allocated once the first IPv6 flow is added.
+IPV6_COLUMNS = ("src_ip6", "dst_ip6")
+
+
+def pack_key(
+    src_ip: int,
+    dst_ip: int,
+    src_port: int,
+    dst_port: int,
+    protocol: int,
+    family: int = 4
+) -> int:
+    """
+    Pack integer-encoded flow fields into a single hashable key.
+    """
+    if family == 6:
+        return V6_FLAG | (src_ip << 168) | (dst_ip << 40) | (src_port << 24) | (dst_port << 8) | protocol
+    return (src_ip << 72) | (dst_ip << 40) | (src_port << 24) | (dst_port << 8) | protocol
+
+
+def unpack_key(key: int) -> Tuple[int, int, int, int, int, int]:
+    """
+    Inverse of pack_key: (family, src_ip, dst_ip, src_port, dst_port, protocol).
+    """
+    protocol = key & 0xFF
+    dst_port = (key >> 8) & 0xFFFF
+    src_port = (key >> 24) & 0xFFFF
+    if key & V6_FLAG:
+        return 6, (key >> 168) & _MASK128, (key >> 40) & _MASK128, src_port, dst_port, protocol
+    return 4, key >> 72, (key >> 40) & _MASK32, src_port, dst_port, protocol
+
+
+def encode_key(key: FlowKey) -> int:
+    """
+    Pack a string FlowKey (as built by the pyshark path) into an integer key.
+    """
+    src_ip, dst_ip, src_port, dst_port, protocol = key
+
+    number = PROTOCOL_NUMBERS.get(protocol.upper())
+    if number is None:
+        raise ValueError(f"Unknown transport protocol: {protocol!r}")
+
+    if ":" in src_ip or ":" in dst_ip:
+        family = 6
+        src = int.from_bytes(socket.inet_pton(socket.AF_INET6, src_ip), "big")
+        dst = int.from_bytes(socket.inet_pton(socket.AF_INET6, dst_ip), "big")
+    else:
+        family = 4
+        src = struct.unpack("!I", socket.inet_aton(src_ip))[0]
+        dst = struct.unpack("!I", socket.inet_aton(dst_ip))[0]
+
+    return pack_key(
+        src,
+        dst,
+        int(src_port or 0),
+        int(dst_port or 0),
+        number,
+        family,
+    )
+
+
+def ip_to_string(address: int, family: int = 4) -> str:
+    if family == 6:
+        return socket.inet_ntop(socket.AF_INET6, address.to_bytes(16, "big"))
+    return socket.inet_ntoa(struct.pack("!I", address))
+
+
+class FlowTable(Mapping):
+    """
+    Struct-of-arrays flow storage.
+
+    Behaves as a read-only ``Dict[FlowKey, Flow]`` so run_detection and the
+    rule detectors keep working unchanged; ``values()`` materialises Flow
+    objects on demand. Integer columns are available through ``column()``.
+
+    Packets are buffered and applied to the columns in batches, so the
+    per-packet cost is one dict lookup and three list appends. Once
+    ingestion is done, compact() drops the key index and spare capacity,
+    leaving ~46 bytes per IPv4 flow.
+
+    Memory can be bounded NetFlow-style:
+      - idle_timeout  : flows silent for this long are expired
+      - active_timeout: flows older than this are expired (a later packet
+                        starts a new record)
+      - max_flows     : hard cap; when reached, the least recently seen
+                        flows are evicted down to 90% of the cap
+    Expired flows are removed from the table and handed to
+    ``on_expire(batch, reason)`` as a FlowTable. ``evictions`` counts them
+    per reason.
+    """
+
+    BATCH_SIZE = 65536
+    # Seconds of capture time between timeout sweeps
+    SWEEP_INTERVAL = 1.0
+    # Capacity evictions free this fraction of max_flows at once
+    LOW_WATER = 0.9
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        max_flows: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        active_timeout: Optional[float] = None,
+        on_expire: Optional[Callable[["FlowTable", str], None]] = None
+    ):
+        if max_flows is not None and max_flows < 1:
+            raise ValueError("max_flows must be a positive integer")
+
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.on_expire = on_expire
+        self.evictions = {"idle": 0, "active": 0, "capacity": 0}
+        self._next_sweep = (
+            float("-inf") if idle_timeout or active_timeout else float("inf")
+        )
+
+        self._capacity = max(int(capacity), 16)
+        self._size = 0
+        self._index: Optional[Dict[int, int]] = {}
+        self._cols = {
+            name: np.zeros(self._capacity, dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        self._cols6: Optional[Dict[str, np.ndarray]] = None
+        self._ip_names: Dict[Tuple[int, int], str] = {}
+
+        self._pending_rows: List[int] = []
+        self._pending_times: List[float] = []
+        self._pending_lengths: List[int] = []
+
+    # -----------------------------
+    # Ingestion
+    # -----------------------------
+
+    def add_packet(self, key: int, timestamp: float, length: int) -> int:
+        """
+        Account one packet to the flow identified by a packed key.
+        Returns the flow's row.
+        """
+        index = self._index
+        if index is None:
+            index = self._rebuild_index()
+
+        if timestamp >= self._next_sweep:
+            self.expire(timestamp)
+
+        row = index.get(key)
+        if row is None:
+            if self.max_flows is not None and self._size >= self.max_flows:
+                self._make_room(timestamp)
+            row = self._new_row(key, timestamp)
+
+        self._pending_rows.append(row)
+        self._pending_times.append(timestamp)
+        self._pending_lengths.append(length)
+
+        if len(self._pending_rows) >= self.BATCH_SIZE:
+            self._flush()
+
+        return row
+
+    def _new_row(self, key: int, timestamp: float) -> int:
+        if self._size == self._capacity:
+            self._grow()
+
+        row = self._size
+        self._size += 1
+        self._index[key] = row
+
+        family, src, dst, src_port, dst_port, protocol = unpack_key(key)
+        cols = self._cols
+        cols["family"][row] = family
+        cols["src_port"][row] = src_port
+        cols["dst_port"][row] = dst_port
+        cols["protocol"][row] = protocol
+        cols["start_time"][row] = timestamp
+        cols["end_time"][row] = timestamp
+
+        if family == 6:
+            if self._cols6 is None:
+                self._cols6 = {
+                    name: np.zeros((self._capacity, 2), dtype=np.uint64)
+                    for name in IPV6_COLUMNS
+                }
+            self._cols6["src_ip6"][row] = (src >> 64, src & _MASK64)
+            self._cols6["dst_ip6"][row] = (dst >> 64, dst & _MASK64)
+        else:
+            cols["src_ip"][row] = src
+            cols["dst_ip"][row] = dst
+
+        return row
+
+    def _grow(self) -> None:
+        capacity = max(self._capacity * 2, 16)
+
+        for name, values in self._cols.items():
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._cols[name] = grown
+
+        if self._cols6 is not None:
+            for name, values in self._cols6.items():
+                grown = np.zeros((capacity, 2), dtype=np.uint64)
+                grown[:self._size] = values[:self._size]
+                self._cols6[name] = grown
+
+        self._capacity = capacity
+
+    def _flush(self) -> None:
+        if not self._pending_rows:
+            return
+
+        rows = np.asarray(self._pending_rows, dtype=np.int64)
+        times = np.asarray(self._pending_times, dtype=np.float64)
+        lengths = np.asarray(self._pending_lengths, dtype=np.int64)
+
+        self._pending_rows.clear()
+        self._pending_times.clear()
+        self._pending_lengths.clear()
+
+        cols = self._cols
+        np.add.at(cols["packet_count"], rows, 1)
+        np.add.at(cols["byte_count"], rows, lengths)
+
+        # end_time follows the last packet in capture order
+        last = len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]
+        cols["end_time"][rows[last]] = times[last]
+
+    # -----------------------------
+    # Expiry / eviction
+    # -----------------------------
+
+    def expire(self, now: float) -> None:
+        """
+        Evict flows past their idle or active timeout as of ``now``
+        (capture time).
+        """
+        self._next_sweep = now + self.SWEEP_INTERVAL
+
+        if self.idle_timeout:
+            self._flush()
+            stale = self._cols["end_time"][:self._size] <= now - self.idle_timeout
+            self._evict(np.flatnonzero(stale), "idle")
+
+        if self.active_timeout:
+            self._flush()
+            old = self._cols["start_time"][:self._size] <= now - self.active_timeout
+            self._evict(np.flatnonzero(old), "active")
+
+    def _make_room(self, now: float) -> None:
+        if self.idle_timeout or self.active_timeout:
+            self.expire(now)
+        self._trim()
+
+    def _trim(self) -> None:
+        """
+        At or over max_flows, evict the least recently seen flows down
+        to LOW_WATER of it.
+        """
+        if self._size < self.max_flows:
+            return
+
+        self._flush()
+        excess = self._size - int(self.max_flows * self.LOW_WATER)
+        end_times = self._cols["end_time"][:self._size]
+        oldest = np.argpartition(end_times, excess - 1)[:excess]
+        self._evict(oldest, "capacity")
+
+    def _evict(self, rows: np.ndarray, reason: str) -> None:
+        """
+        Remove rows from the table, keeping it dense: rows from the tail
+        are moved into the holes, so only moved keys are re-indexed.
+        """
+        if not len(rows):
+            return
+
+        self._flush()
+        rows = np.unique(rows)
+        size = self._size
+        new_size = size - len(rows)
+
+        if self.on_expire is not None:
+            self.on_expire(self._subset(rows), reason)
+
+        index = self._index
+        if index is not None:
+            for key in self._packed_keys(rows):
+                del index[key]
+
+        holes = rows[rows < new_size]
+        if len(holes):
+            tail = np.arange(new_size, size)
+            movers = tail[~np.isin(tail, rows, assume_unique=True)]
+            moved_keys = self._packed_keys(movers) if index is not None else ()
+
+            for values in self._cols.values():
+                values[holes] = values[movers]
+            if self._cols6 is not None:
+                for values in self._cols6.values():
+                    values[holes] = values[movers]
+
+            for key, row in zip(moved_keys, holes.tolist()):
+                index[key] = row
+
+        # Freed rows are reused by _new_row, which expects zeroed counters
+        self._cols["packet_count"][new_size:size] = 0
+        self._cols["byte_count"][new_size:size] = 0
+        self._size = new_size
+        self.evictions[reason] += len(rows)
+
+    def _subset(self, rows: np.ndarray) -> "FlowTable":
+        """
+        Copy the given rows into a new, compact table.
+        """
+        table = FlowTable(capacity=len(rows))
+        for name, values in self._cols.items():
+            table._cols[name] = values[rows]
+        if self._cols6 is not None:
+            table._cols6 = {name: values[rows] for name, values in self._cols6.items()}
+        table._size = table._capacity = len(rows)
+        table._index = None
+        return table
+
+    # -----------------------------
+    # Key index
+    # -----------------------------
+
+    def compact(self) -> None:
+        """
+        Release the key index and trim spare capacity once ingestion is done.
+        Keyed lookups fall back to a vectorised column match, and the index
+        is rebuilt automatically if more packets arrive.
+        """
+        self._flush()
+
+        size = self._size
+        for name, values in self._cols.items():
+            self._cols[name] = values[:size].copy()
+        if self._cols6 is not None:
+            for name, values in self._cols6.items():
+                self._cols6[name] = values[:size].copy()
+
+        self._capacity = size
+        self._index = None
+
+    def _packed_key(self, row: int) -> int:
+        cols = self._cols
+        family = int(cols["family"][row])
+        if family == 6:
+            src = self._cols6["src_ip6"][row]
+            dst = self._cols6["dst_ip6"][row]
+            src_ip = (int(src[0]) << 64) | int(src[1])
+            dst_ip = (int(dst[0]) << 64) | int(dst[1])
+        else:
+            src_ip = int(cols["src_ip"][row])
+            dst_ip = int(cols["dst_ip"][row])
+        return pack_key(
+            src_ip,
+            dst_ip,
+            int(cols["src_port"][row]),
+            int(cols["dst_port"][row]),
+            int(cols["protocol"][row]),
+            family,
+        )
+
+    def _packed_keys(self, rows: Optional[np.ndarray] = None) -> List[int]:
+        """
+        Packed keys of the given rows (default: every row), in order.
+        """
+        if rows is None:
+            rows = np.arange(self._size)
+
+        if self._cols6 is not None:
+            return [self._packed_key(row) for row in rows.tolist()]
+
+        cols = self._cols
+        return [
+            (src << 72) | (dst << 40) | (src_port << 24) | (dst_port << 8) | protocol
+            for src, dst, src_port, dst_port, protocol in zip(
+                cols["src_ip"][rows].tolist(),
+                cols["dst_ip"][rows].tolist(),
+                cols["src_port"][rows].tolist(),
+                cols["dst_port"][rows].tolist(),
+                cols["protocol"][rows].tolist(),
+            )
+        ]
+
+    def _rebuild_index(self) -> Dict[int, int]:
+        self._index = {key: row for row, key in enumerate(self._packed_keys())}
+        return self._index
+
+    def _find(self, key: int) -> Optional[int]:
+        if self._index is not None:
+            return self._index.get(key)
+
+        family, src, dst, src_port, dst_port, protocol = unpack_key(key)
+        size = self._size
+        cols = self._cols
+        match = (
+            (cols["family"][:size] == family)
+            & (cols["src_port"][:size] == src_port)
+            & (cols["dst_port"][:size] == dst_port)
+            & (cols["protocol"][:size] == protocol)
+        )
+        if family == 6:
+            if self._cols6 is None:
+                return None
+            for name, address in (("src_ip6", src), ("dst_ip6", dst)):
+                halves = self._cols6[name][:size]
+                match &= (halves[:, 0] == address >> 64) & (halves[:, 1] == address & _MASK64)
+        else:
+            match &= (cols["src_ip"][:size] == src) & (cols["dst_ip"][:size] == dst)
+
+        rows = np.flatnonzero(match)
+        return int(rows[0]) if len(rows) else None
+
+    def merge(
+        self,
+        other: "FlowTable",
+        ordered: bool = True,
+        drop_src_port: bool = False,
+        per_source: bool = False
+    ) -> None:
+        """
+        Fold another table into this one.
+
+        With ``ordered`` (default), ``other`` must hold packets that come
+        later in capture order (the next shard or file). Flows present in
+        both keep this table's start_time, take ``other``'s end_time and sum
+        their counters, and new flows are appended in ``other``'s order, so
+        merging shards in order reproduces a single sequential pass exactly.
+        For time-ordered captures this is min(start) / max(end); pass
+        ``ordered=False`` to always use min / max.
+
+        ``drop_src_port`` rolls flows up to (src, dst, dst_port, protocol),
+        which is all the rules group by; ``per_source`` further, to
+        (src, protocol) totals with a zero destination and ports.
+
+        A table with ``max_flows`` evicts its least recently seen flows
+        (to ``on_expire``) when a merge takes it over the cap.
+        """
+        self._flush()
+        other._flush()
+
+        index = self._index
+        if index is None:
+            index = self._rebuild_index()
+
+        size = len(other)
+        theirs = other._cols
+        starts = theirs["start_time"][:size].tolist()
+        keys = other._packed_keys()
+        if per_source:
+            keys = [key & ~(_V6_ROLLUP if key & V6_FLAG else _V4_ROLLUP) for key in keys]
+        elif drop_src_port:
+            keys = [key & ~(0xFFFF << 24) for key in keys]
+
+        rows = np.empty(size, dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = index.get(key)
+            if row is None:
+                row = self._new_row(key, starts[i])
+            rows[i] = row
+
+        cols = self._cols
+        np.add.at(cols["packet_count"], rows, theirs["packet_count"][:size])
+        np.add.at(cols["byte_count"], rows, theirs["byte_count"][:size])
+        if ordered:
+            cols["end_time"][rows] = theirs["end_time"][:size]
+        else:
+            np.minimum.at(cols["start_time"], rows, theirs["start_time"][:size])
+            np.maximum.at(cols["end_time"], rows, theirs["end_time"][:size])
+
+        for reason, count in other.evictions.items():
+            self.evictions[reason] = self.evictions.get(reason, 0) + count
+
+        if self.max_flows is not None and self._size > self.max_flows:
+            self._trim()
+
+    # -----------------------------
+    # Columnar access
+    # -----------------------------
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Return a view of one column, trimmed to the number of flows.
+        """
+        self._flush()
+        if name in IPV6_COLUMNS:
+            if self._cols6 is None:
+                return np.zeros((self._size, 2), dtype=np.uint64)
+            return self._cols6[name][:self._size]
+        return self._cols[name][:self._size]
+
+    def row_of(self, key: FlowKey) -> Optional[int]:
+        return self._find(encode_key(key))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the table (columns + key index).
+        """
+        total = sum(values.nbytes for values in self._cols.values())
+        if self._cols6 is not None:
+            total += sum(values.nbytes for values in self._cols6.values())
+        if self._index is not None:
+            # dict slot + packed int key object per flow
+            total += len(self._index) * (40 + 48)
+        return total
+
+    # -----------------------------
+    # Dict[FlowKey, Flow] compatibility view
+    # -----------------------------
+
+    def address_at(self, row: int, which: str) -> str:
+        """
+        String form of the "src_ip" or "dst_ip" address of a row.
+        """
+        family = int(self._cols["family"][row])
+        if family == 6:
+            high, low = self._cols6[which + "6"][row]
+            address = (int(high) << 64) | int(low)
+        else:
+            address = int(self._cols[which][row])
+
+        name = self._ip_names.get((family, address))
+        if name is None:
+            name = self._ip_names[(family, address)] = ip_to_string(address, family)
+        return name
+
+    def key_at(self, row: int) -> FlowKey:
+        cols = self._cols
+        protocol = int(cols["protocol"][row])
+        return (
+            self.address_at(row, "src_ip"),
+            self.address_at(row, "dst_ip"),
+            PORT_NAMES[cols["src_port"][row]],
+            PORT_NAMES[cols["dst_port"][row]],
+            PROTOCOL_NAMES.get(protocol, str(protocol)),
+        )
+
+    def flow_at(self, row: int) -> Flow:
+        self._flush()
+        key = self.key_at(row)
+        cols = self._cols
+        return Flow(
+            src_ip=key[0],
+            dst_ip=key[1],
+            src_port=key[2],
+            dst_port=key[3],
+            protocol=key[4],
+            start_time=float(cols["start_time"][row]),
+            end_time=float(cols["end_time"][row]),
+            packet_count=int(cols["packet_count"][row]),
+            byte_count=int(cols["byte_count"][row]),
+        )
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[FlowKey]:
+        for row in range(self._size):
+            yield self.key_at(row)
+
+    def __contains__(self, key) -> bool:
+        try:
+            return self._find(encode_key(key)) is not None
+        except (TypeError, ValueError, OSError, AttributeError):
+            return False
+
+    def __getitem__(self, key: FlowKey) -> Flow:
+        row = self._find(encode_key(key))
+        if row is None:
+            raise KeyError(key)
+        return self.flow_at(row)
+
+    def values(self) -> Iterator[Flow]:
+        self._flush()
+        for row in range(self._size):
+            yield self.flow_at(row)
+
+    def items(self) -> Iterator[Tuple[FlowKey, Flow]]:
+        self._flush()
+        for row in range(self._size):
+            flow = self.flow_at(row)
+            yield (
+                flow.src_ip,
+                flow.dst_ip,
+                flow.src_port,
+                flow.dst_port,
+                flow.protocol,
+            ), flow
+
+    def to_dict(self) -> Dict[FlowKey, Flow]:
+        return dict(self.items())
+
+    @classmethod
+    def from_flows(cls, flows: Dict[FlowKey, Flow]) -> "FlowTable":
+        """
+        Build a table from a plain flow dict.
+        """
+        if isinstance(flows, cls):
+            return flows
+
+        table = cls(capacity=len(flows))
+        for key, flow in flows.items():
+            row = table._new_row(encode_key(key), flow.start_time)
+            table._cols["end_time"][row] = flow.end_time
+            table._cols["packet_count"][row] = flow.packet_count
+            table._cols["byte_count"][row] = flow.byte_count
+        return table
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Trimmed column arrays (IPv6 columns only when present), e.g. for
+        saving with np.savez. Inverse of from_columns.
+        """
+        self._flush()
+        columns = {name: values[:self._size] for name, values in self._cols.items()}
+        if self._cols6 is not None:
+            for name, values in self._cols6.items():
+                columns[name] = values[:self._size]
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns: Mapping) -> "FlowTable":
+        """
+        Build a compact table around saved column arrays.
+        """
+        size = len(columns["family"])
+        table = cls(capacity=0)
+        table._cols = {
+            name: np.ascontiguousarray(columns[name], dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        if IPV6_COLUMNS[0] in columns:
+            table._cols6 = {
+                name: np.ascontiguousarray(columns[name], dtype=np.uint64)
+                for name in IPV6_COLUMNS
+            }
+        table._size = table._capacity = size
+        table._index = None
+        return table
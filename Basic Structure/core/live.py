@@ -0,0 +1,529 @@
+import multiprocessing
+import queue
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from rich.console import Console
+
+from core.capture import capture_drops, interface_drops, start_live_capture
+from core.flowtable import COLUMNS, IPV6_COLUMNS, FlowTable
+from core.metrics import METRICS, MetricsRegistry
+from core.pcap import PacketRecord, iter_stream
+from core.sketches import SketchDetectors
+from core.sliding import SlidingDetectors
+
+console = Console()
+
+
+class StreamingFlows:
+    """
+    In-memory flow aggregation for live capture.
+
+    A reader thread feeds packets from the capture pipe into the current
+    FlowTable; rotate() swaps in an empty table and hands back the
+    finished window. The swap happens under a lock, so every packet lands
+    in exactly one window and nothing is lost between windows.
+
+    When ``detectors`` are given, every packet is also fed to them and
+    their alerts are put on ``alerts`` as (alert, packet_timestamp) the
+    moment a threshold is crossed.
+
+    ``max_flows`` / ``idle_timeout`` bound each window's FlowTable. Evicted
+    flows are dropped: the detectors have already seen their packets.
+
+    Packet, byte and undecodable-packet counts go to ``metrics`` at each
+    rotate(); one packet in SAMPLE_EVERY is timed through capture (waiting
+    for and decoding it), flow aggregation and the detectors.
+    """
+
+    SAMPLE_EVERY = 64
+
+    def __init__(
+        self,
+        detectors: Optional[Union[SlidingDetectors, SketchDetectors]] = None,
+        max_flows: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self._lock = threading.Lock()
+        self._limits = {"max_flows": max_flows, "idle_timeout": idle_timeout}
+        self._table = FlowTable(**self._limits)
+        self._packets = 0
+        self._bytes = 0
+        self._undecoded = 0
+        self.detectors = detectors
+        self.alerts: "queue.Queue[Tuple[dict, float]]" = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self.window_stats: Dict[str, int] = {}
+
+        metrics = metrics or METRICS
+        detector_name = "sketch" if isinstance(detectors, SketchDetectors) else "sliding"
+        self._metrics = {
+            "packets": metrics.counter(
+                "ids_packets_total", "Packets read from the capture"),
+            "bytes": metrics.counter(
+                "ids_bytes_total", "Frame bytes read from the capture"),
+            "undecoded": metrics.counter(
+                "ids_packets_undecoded_total",
+                "Packets without an IPv4 TCP/UDP flow key (non-IP, fragments, malformed)"),
+            "capture": metrics.histogram(
+                "ids_stage_seconds", "Sampled per-packet / per-window stage time",
+                stage="capture"),
+            "flows": metrics.histogram(
+                "ids_stage_seconds", stage="flows"),
+            "detect": metrics.histogram(
+                "ids_stage_seconds", stage=f"detect_{detector_name}"),
+            "rotate": metrics.histogram(
+                "ids_stage_seconds", stage="rotate"),
+        }
+
+    def consume(self, packets: Iterator[PacketRecord]) -> None:
+        """
+        Reader-thread entry point: aggregate packets until the stream ends.
+        """
+        lock = self._lock
+        detectors = self.detectors
+        clock = time.perf_counter
+        capture = self._metrics["capture"].observe
+        flows = self._metrics["flows"].observe
+        detect = self._metrics["detect"].observe
+        countdown, mark = self.SAMPLE_EVERY, None
+
+        try:
+            for timestamp, length, key in packets:
+                timed = mark is not None
+                if timed:
+                    started = clock()
+                    capture(started - mark)
+
+                with lock:
+                    self._packets += 1
+                    self._bytes += length
+                    if key is None:
+                        self._undecoded += 1
+                    else:
+                        self._table.add_packet(key, timestamp, length)
+
+                if timed:
+                    aggregated = clock()
+                    flows(aggregated - started)
+
+                if key is not None and detectors is not None:
+                    for alert in detectors.update(key, timestamp):
+                        self.alerts.put((alert, timestamp))
+                    if timed:
+                        detect(clock() - aggregated)
+
+                countdown -= 1
+                if countdown:
+                    mark = None
+                else:
+                    countdown, mark = self.SAMPLE_EVERY, clock()
+        except Exception as e:
+            self.error = e
+
+    def start(self, packets: Iterator[PacketRecord]) -> threading.Thread:
+        reader = threading.Thread(
+            target=self.consume,
+            args=(packets,),
+            name="live-capture-reader",
+            daemon=True,
+        )
+        reader.start()
+        return reader
+
+    def rotate(self) -> Tuple[FlowTable, int]:
+        """
+        Close the current window. Returns (flows, packets seen).
+        """
+        started = time.perf_counter()
+        with self._lock:
+            table, packets = self._table, self._packets
+            byte_count, undecoded = self._bytes, self._undecoded
+            self._table = FlowTable(**self._limits)
+            self._packets = self._bytes = self._undecoded = 0
+
+        table.compact()
+        self.window_stats = {"packets": packets, "bytes": byte_count, "undecoded": undecoded}
+
+        metrics = self._metrics
+        metrics["packets"].inc(packets)
+        metrics["bytes"].inc(byte_count)
+        metrics["undecoded"].inc(undecoded)
+        metrics["rotate"].observe(time.perf_counter() - started)
+        return table, packets
+
+
+# =====================================================
+# MULTI-INTERFACE CAPTURE
+# =====================================================
+#
+# With several interfaces, each gets a worker process running its own
+# tshark, packet decoding and window FlowTable (a StreamingFlows). The
+# worker folds its packets into flow updates, (key, packets, last
+# timestamp) per key, and every UPDATE_INTERVAL puts them on one queue
+# shared by all workers. In the parent a single set of detectors reads
+# that queue, so alerts, their deduplication and the detectors' horizon
+# span every interface. rotate() collects each worker's window and
+# merges them into one table.
+#
+# Detectors see a key's packets a batch at a time, so thresholds are
+# crossed up to UPDATE_INTERVAL later than on a single interface. When
+# the parent falls behind, the queue fills and workers drop batches
+# rather than stall their capture; those packets are counted per
+# interface, next to the driver's and tshark's own drop counts.
+
+UPDATE_INTERVAL = 0.05
+# Update batches waiting for the detectors, across all interfaces
+UPDATE_QUEUE = 1024
+REPLY_TIMEOUT = 10.0
+
+
+def merge_windows(tables: Sequence[FlowTable]) -> FlowTable:
+    """
+    One table from windows captured on different interfaces. A flow seen
+    on several becomes one row (min start, max end, summed counts), as
+    with FlowTable.merge(ordered=False), but grouped column-wise.
+    """
+    parts = [table.to_columns() for table in tables if len(table)]
+    merged = FlowTable()
+    if parts:
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+        fields = [columns[name] for name in ("family", "src_ip", "dst_ip", "src_port", "dst_port", "protocol")]
+        if any(IPV6_COLUMNS[0] in part for part in parts):
+            for name in IPV6_COLUMNS:
+                columns[name] = np.concatenate([
+                    part.get(name, np.zeros((len(part["family"]), 2), dtype=np.uint64))
+                    for part in parts
+                ])
+                fields.extend([columns[name][:, 0], columns[name][:, 1]])
+
+        # Rows sorted by flow key; a group starts wherever any field changes
+        order = np.lexsort(fields[::-1])
+        change = np.zeros(len(order), dtype=bool)
+        change[0] = True
+        for values in fields:
+            ordered = values[order]
+            change[1:] |= ordered[1:] != ordered[:-1]
+        first = order[change]
+        if len(first) < len(order):
+            size = len(first)
+            groups = np.empty(len(order), dtype=np.int64)
+            groups[order] = np.cumsum(change) - 1
+            merged_columns = {name: values[first] for name, values in columns.items()}
+            start = np.full(size, np.inf)
+            np.minimum.at(start, groups, columns["start_time"])
+            end = np.full(size, -np.inf)
+            np.maximum.at(end, groups, columns["end_time"])
+            merged_columns["start_time"], merged_columns["end_time"] = start, end
+            for name in ("packet_count", "byte_count"):
+                merged_columns[name] = np.bincount(
+                    groups, weights=columns[name], minlength=size
+                ).astype(np.int64)
+            columns = merged_columns
+        merged = FlowTable.from_columns(columns)
+
+    for table in tables:
+        for reason, count in table.evictions.items():
+            merged.evictions[reason] = merged.evictions.get(reason, 0) + count
+    return merged
+
+
+class FlowUpdates:
+    """
+    Stands in for the detectors in a worker's StreamingFlows, folding
+    packets into per-key (packets, last timestamp) until drained.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, list] = {}
+
+    def update(self, key: int, timestamp: float) -> tuple:
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [1, timestamp]
+            else:
+                entry[0] += 1
+                entry[1] = timestamp
+        return ()
+
+    def drain(self) -> List[Tuple[int, int, float]]:
+        """
+        Pending (key, packets, timestamp) updates in time order.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        updates = [(key, count, timestamp) for key, (count, timestamp) in pending.items()]
+        updates.sort(key=lambda update: update[2])
+        return updates
+
+
+def _capture_worker(
+    iface: str,
+    capture_filter: Optional[str],
+    limits: Dict,
+    updates,
+    control
+) -> None:
+    """
+    Worker process: capture and aggregate ``iface`` until told to stop.
+    Answers "rotate" with the finished window and "stop" with tshark's
+    final drop count.
+    """
+    # Ctrl+C reaches the whole process group; the parent stops us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        process = start_live_capture(iface, capture_filter)
+    except Exception as e:
+        control.send({"error": f"{type(e).__name__}: {e}"})
+        return
+
+    batcher = FlowUpdates()
+    flows = StreamingFlows(batcher, **limits)
+    reader = flows.start(iter_stream(process.stdout))
+    control.send({"ready": True})
+    queue_dropped = 0
+
+    def send_updates() -> None:
+        nonlocal queue_dropped
+        batch = batcher.drain()
+        if not batch:
+            return
+        try:
+            updates.put_nowait((iface, batch))
+        except queue.Full:
+            queue_dropped += sum(count for _, count, _ in batch)
+
+    try:
+        while True:
+            command = control.recv() if control.poll(UPDATE_INTERVAL) else None
+            send_updates()
+            if command == "stop":
+                break
+            if command != "rotate":
+                continue
+
+            table, packets = flows.rotate()
+            reply = dict(
+                flows.window_stats,
+                columns=table.to_columns(),
+                evictions=dict(table.evictions),
+                queue_dropped=queue_dropped,
+                alive=reader.is_alive(),
+                error=str(flows.error) if flows.error is not None else None,
+            )
+            queue_dropped = 0
+            if not reader.is_alive() and not packets:
+                reply["stderr"] = process.error_output()
+            control.send(reply)
+    except (EOFError, OSError):
+        pass  # the parent went away
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        try:
+            control.send({"capture_dropped": capture_drops(process.error_output())})
+        except (EOFError, OSError):
+            pass
+
+
+class MultiStreamingFlows:
+    """
+    StreamingFlows over several interfaces, one worker process each,
+    feeding one set of ``detectors``. start(), rotate(), ``alerts`` and
+    ``error`` behave as for StreamingFlows; ``interfaces`` holds running
+    per-interface totals (packets, bytes, drops) and the last window's.
+    """
+
+    def __init__(
+        self,
+        interfaces: Sequence[str],
+        detectors: Union[SlidingDetectors, SketchDetectors],
+        capture_filter: Optional[str] = None,
+        max_flows: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        if len(set(interfaces)) != len(interfaces):
+            raise ValueError("Each interface can only be captured once")
+
+        self.detectors = detectors
+        self.capture_filter = capture_filter
+        self.alerts: "queue.Queue[Tuple[dict, float]]" = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self._limits = {"max_flows": max_flows, "idle_timeout": idle_timeout}
+        self._context = multiprocessing.get_context("spawn")
+        self._updates = self._context.Queue(UPDATE_QUEUE)
+        self._workers: Dict[str, Tuple] = {}
+        self._merger: Optional[threading.Thread] = None
+
+        self.interfaces: Dict[str, Dict] = {
+            iface: {
+                "packets": 0, "bytes": 0, "undecoded": 0,
+                "queue_dropped": 0, "nic_dropped": 0, "capture_dropped": 0,
+                "window": {}, "active": True,
+            }
+            for iface in interfaces
+        }
+        self._nic_base = {iface: interface_drops(iface) for iface in interfaces}
+
+        metrics = metrics or METRICS
+        self._metrics = metrics
+        self._merge_stage = metrics.histogram("ids_stage_seconds", stage="merge")
+
+    def start(self) -> threading.Thread:
+        """
+        Start a worker per interface and the thread feeding the
+        detectors. Raises if any interface fails to start.
+        """
+        for iface in self.interfaces:
+            parent, child = self._context.Pipe()
+            process = self._context.Process(
+                target=_capture_worker,
+                args=(iface, self.capture_filter, self._limits, self._updates, child),
+                name=f"capture-{iface}",
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self._workers[iface] = (process, parent)
+
+        for iface, (process, connection) in self._workers.items():
+            reply = self._receive(connection, timeout=60.0)
+            if reply is None or "error" in reply:
+                self.close()
+                reason = reply["error"] if reply else "no reply"
+                raise RuntimeError(f"Capture on {iface} failed to start: {reason}")
+
+        self._merger = threading.Thread(target=self._merge, name="live-merge", daemon=True)
+        self._merger.start()
+        return self._merger
+
+    def _receive(self, connection, timeout: float = REPLY_TIMEOUT) -> Optional[Dict]:
+        try:
+            if connection.poll(timeout):
+                return connection.recv()
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def _merge(self) -> None:
+        """
+        Feed every worker's flow updates to the detectors, in arrival order.
+        """
+        update = self.detectors.update
+        clock = time.perf_counter
+        try:
+            while True:
+                item = self._updates.get()
+                if item is None:
+                    return
+                started = clock()
+                for key, packets, timestamp in item[1]:
+                    for alert in update(key, timestamp, packets):
+                        self.alerts.put((alert, timestamp))
+                self._merge_stage.observe(clock() - started)
+        except Exception as e:
+            self.error = e
+
+    def _stopped(self, iface: str, reason: str) -> None:
+        self.interfaces[iface]["active"] = False
+        console.print(f"[WARN] Capture on {iface} stopped: {reason.strip()}", style="yellow")
+        if not any(stats["active"] for stats in self.interfaces.values()):
+            self.error = RuntimeError("Capture stopped on every interface")
+
+    def rotate(self) -> Tuple[FlowTable, int]:
+        """
+        Close the current window on every interface. Returns (merged
+        flows, packets seen).
+        """
+        active = [iface for iface, stats in self.interfaces.items() if stats["active"]]
+        for iface in active:
+            try:
+                self._workers[iface][1].send("rotate")
+            except (EOFError, OSError):
+                pass
+
+        windows: List[FlowTable] = []
+        total = 0
+        for iface in active:
+            stats = self.interfaces[iface]
+            reply = self._receive(self._workers[iface][1])
+            if reply is None:
+                self._stopped(iface, "worker is not responding")
+                continue
+
+            window = {
+                name: reply.get(name, 0)
+                for name in ("packets", "bytes", "undecoded", "queue_dropped")
+            }
+            dropped = interface_drops(iface)
+            base = self._nic_base[iface]
+            if dropped is not None and base is not None:
+                window["nic_dropped"] = max(dropped - base - stats["nic_dropped"], 0)
+            for name, value in window.items():
+                stats[name] += value
+            stats["window"] = window
+            total += window["packets"]
+
+            for name in ("packets", "bytes"):
+                self._metrics.counter(
+                    f"ids_interface_{name}_total", f"{name.capitalize()} captured, by interface",
+                    iface=iface
+                ).inc(window[name])
+            for reason in ("queue", "nic"):
+                self._metrics.counter(
+                    "ids_interface_dropped_total", "Packets lost, by interface and where",
+                    iface=iface, reason=reason
+                ).inc(window.get(f"{reason}_dropped", 0))
+
+            table = FlowTable.from_columns(reply["columns"])
+            table.evictions = reply["evictions"]
+            windows.append(table)
+
+            if reply.get("error"):
+                self._stopped(iface, reply["error"])
+            elif not reply["alive"] and not window["packets"]:
+                self._stopped(iface, reply.get("stderr") or "capture ended")
+
+        return merge_windows(windows), total
+
+    def close(self) -> None:
+        """
+        Stop every worker and the detector feed; fills in tshark's drop
+        counts.
+        """
+        for iface, (process, connection) in self._workers.items():
+            try:
+                connection.send("stop")
+            except (EOFError, OSError):
+                pass
+
+        for iface, (process, connection) in self._workers.items():
+            # Anything still in flight for a rotate() that timed out
+            while True:
+                reply = self._receive(connection)
+                if reply is None or "capture_dropped" in reply:
+                    break
+            if reply is not None:
+                self.interfaces[iface]["capture_dropped"] = reply["capture_dropped"]
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+        self._workers.clear()
+
+        if self._merger is not None:
+            self._updates.put(None)
+            self._merger.join(timeout=5)
+            self._merger = None
@@ -0,0 +1,484 @@
+import mmap
+import os
+import struct
+from typing import Iterator, List, Optional, Tuple
+
+
+# =====================================================
+# NATIVE PCAP / PCAPNG READER
+# =====================================================
+#
+# Decodes Ethernet / IPv4 / TCP / UDP / ICMP headers straight from a
+# memory-mapped capture file. Only the fields needed to build flows are
+# read, and they are emitted as packed integer flow keys (see
+# core.flowtable.pack_key) describing the same flows the pyshark path
+# builds: (src_ip, dst_ip, src_port, dst_port, TCP | UDP).
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+
+SUPPORTED_LINKTYPES = {
+    LINKTYPE_NULL,
+    LINKTYPE_ETHERNET,
+    LINKTYPE_RAW,
+    LINKTYPE_LINUX_SLL,
+    LINKTYPE_IPV4,
+}
+
+PCAP_MAGIC_LE = {b"\xd4\xc3\xb2\xa1": 1_000_000, b"\x4d\x3c\xb2\xa1": 1_000_000_000}
+PCAP_MAGIC_BE = {b"\xa1\xb2\xc3\xd4": 1_000_000, b"\xa1\xb2\x3c\x4d": 1_000_000_000}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+
+ETHERTYPE_IPV4 = 0x0800
+VLAN_ETHERTYPES = {0x8100, 0x88A8, 0x9100}
+
+# ICMP messages that quote the offending IP header (unreachable, source
+# quench, redirect, time exceeded, parameter problem). tshark dissects the
+# quoted TCP/UDP header, so pyshark reports it as the transport layer.
+ICMP_ERROR_TYPES = {3, 4, 5, 11, 12}
+
+TRANSPORT_PROTOCOLS = {6, 17}
+
+PacketRecord = Tuple[float, int, Optional[int]]
+ByteRange = Tuple[int, int]
+
+# Number of consecutive well-formed records required before a guessed
+# split offset is accepted as a record boundary.
+RESYNC_CHAIN = 8
+# How far past a split target to search for a record boundary.
+RESYNC_WINDOW = 4 * 1024 * 1024
+
+_U16 = struct.Struct("!H")
+# src_ip << 32 | dst_ip, and src_port << 16 | dst_port, in one unpack each
+_ADDR_PAIR = struct.Struct("!Q")
+_PORT_PAIR = struct.Struct("!I")
+
+
+class UnsupportedCapture(Exception):
+    """
+    Raised when a capture cannot be decoded natively
+    (unknown file format, compressed file or unsupported link type).
+    """
+
+
+def _network_offset(buf, off: int, end: int, linktype: int) -> int:
+    """
+    Return the offset of the IPv4 header inside a frame, or -1.
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        if off + 14 > end:
+            return -1
+        ethertype = _U16.unpack_from(buf, off + 12)[0]
+        pos = off + 14
+        while ethertype in VLAN_ETHERTYPES and pos + 4 <= end:
+            ethertype = _U16.unpack_from(buf, pos + 2)[0]
+            pos += 4
+        return pos if ethertype == ETHERTYPE_IPV4 else -1
+
+    if linktype == LINKTYPE_LINUX_SLL:
+        if off + 16 > end:
+            return -1
+        ethertype = _U16.unpack_from(buf, off + 14)[0]
+        return off + 16 if ethertype == ETHERTYPE_IPV4 else -1
+
+    if linktype == LINKTYPE_NULL:
+        if off + 4 > end:
+            return -1
+        # AF_INET is 2 everywhere, stored in the capturing host's byte order
+        family = buf[off:off + 4]
+        return off + 4 if family in (b"\x02\x00\x00\x00", b"\x00\x00\x00\x02") else -1
+
+    # LINKTYPE_RAW / LINKTYPE_IPV4
+    if off < end and buf[off] >> 4 == 4:
+        return off
+    return -1
+
+
+def _transport(buf, pos: int, end: int) -> int:
+    """
+    Decode the transport layer of the IPv4 packet starting at ``pos``.
+    Returns src_port << 24 | dst_port << 8 | protocol, or -1.
+    """
+    if pos + 20 > end:
+        return -1
+
+    ihl = (buf[pos] & 0x0F) * 4
+    if ihl < 20:
+        return -1
+
+    # Non-first fragments carry no transport header
+    if _U16.unpack_from(buf, pos + 6)[0] & 0x1FFF:
+        return -1
+
+    proto = buf[pos + 9]
+    l4 = pos + ihl
+
+    if proto in TRANSPORT_PROTOCOLS:
+        if l4 + 4 > end:
+            return -1
+        return (_PORT_PAIR.unpack_from(buf, l4)[0] << 8) | proto
+
+    if proto == 1 and l4 + 8 < end and buf[l4] in ICMP_ERROR_TYPES:
+        return _transport(buf, l4 + 8, end)
+
+    return -1
+
+
+def decode_packet(buf, off: int, end: int, linktype: int) -> Optional[int]:
+    """
+    Decode one captured frame into a packed flow key, or None when the
+    frame has no IPv4 transport layer (ARP, IPv6, plain ICMP, fragments ...).
+    """
+    pos = _network_offset(buf, off, end, linktype)
+    if pos < 0 or pos + 20 > end or buf[pos] >> 4 != 4:
+        return None
+
+    transport = _transport(buf, pos, end)
+    if transport < 0:
+        return None
+
+    return (_ADDR_PAIR.unpack_from(buf, pos + 12)[0] << 40) | transport
+
+
+# -----------------------------
+# Classic PCAP
+# -----------------------------
+
+def _pcap_header(buf) -> Tuple[str, int, int, int]:
+    """
+    Parse the global header: (endian, ticks per second, linktype, snaplen).
+    """
+    magic = bytes(buf[:4])
+
+    if magic in PCAP_MAGIC_LE:
+        endian, units = "<", PCAP_MAGIC_LE[magic]
+    elif magic in PCAP_MAGIC_BE:
+        endian, units = ">", PCAP_MAGIC_BE[magic]
+    else:
+        raise UnsupportedCapture("unrecognised capture file format")
+
+    if len(buf) < 24:
+        raise UnsupportedCapture("truncated pcap header")
+
+    snaplen, network = struct.unpack_from(endian + "II", buf, 16)
+
+    # Upper 16 bits may carry FCS information
+    linktype = network & 0xFFFF
+    if linktype not in SUPPORTED_LINKTYPES:
+        raise UnsupportedCapture(f"unsupported link type {linktype}")
+
+    return endian, units, linktype, snaplen or 262144
+
+
+def _iter_pcap(buf, byte_range: Optional[ByteRange] = None) -> Iterator[PacketRecord]:
+    endian, units, linktype, _ = _pcap_header(buf)
+
+    record = struct.Struct(endian + "IIII")
+    off, stop = byte_range if byte_range else (24, len(buf))
+
+    while off + 16 <= stop:
+        sec, frac, incl_len, orig_len = record.unpack_from(buf, off)
+        end = off + 16 + incl_len
+        if end > stop:
+            break  # truncated final record
+
+        key = decode_packet(buf, off + 16, end, linktype)
+        off = end
+
+        yield sec + frac / units, orig_len, key
+
+    if byte_range and off != stop:
+        raise UnsupportedCapture("byte range is not record-aligned")
+
+
+def _split_pcap(buf, targets: List[int]) -> List[int]:
+    endian, units, _, snaplen = _pcap_header(buf)
+    record = struct.Struct(endian + "IIII")
+    size = len(buf)
+    first_sec = record.unpack_from(buf, 24)[0] if size >= 40 else 0
+
+    def plausible(off: int) -> bool:
+        for _ in range(RESYNC_CHAIN):
+            if off == size:
+                return True
+            if off + 16 > size:
+                return False
+            sec, frac, incl_len, orig_len = record.unpack_from(buf, off)
+            if (
+                frac >= units
+                or incl_len > snaplen
+                or incl_len > orig_len
+                or abs(sec - first_sec) > 366 * 86400
+            ):
+                return False
+            off += 16 + incl_len
+        return off <= size
+
+    bounds = []
+    for target in targets:
+        for off in range(max(target, 24), min(target + RESYNC_WINDOW, size)):
+            if plausible(off):
+                bounds.append(off)
+                break
+    return bounds
+
+
+# -----------------------------
+# PCAPNG
+# -----------------------------
+
+def _ts_units(options, endian: str) -> int:
+    """
+    Read if_tsresol from Interface Description Block options.
+    Returns the number of timestamp ticks per second.
+    """
+    pos = 0
+    while pos + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            resol = options[pos + 4]
+            if resol & 0x80:
+                return 2 ** (resol & 0x7F)
+            return 10 ** resol
+        pos += 4 + ((length + 3) & ~3)
+    return 1_000_000
+
+
+def _pcapng_head(buf) -> Tuple[str, list, int]:
+    """
+    Read the section and interface blocks at the start of a pcapng file.
+    Returns (endian, interfaces, offset of the first other block).
+    """
+    endian = "<"
+    interfaces = []
+    size = len(buf)
+    off = 0
+
+    while off + 12 <= size:
+        block_type = struct.unpack_from(endian + "I", buf, off)[0]
+        if block_type not in (0x0A0D0D0A, 1):
+            break
+        endian, interfaces = _pcapng_state(buf, off, block_type, endian, interfaces)
+        off += struct.unpack_from(endian + "I", buf, off + 4)[0]
+
+    return endian, interfaces, off
+
+
+def _pcapng_state(buf, off: int, block_type: int, endian: str, interfaces: list):
+    """
+    Apply a Section Header or Interface Description Block to the
+    reader state (byte order, interface list).
+    """
+    if block_type == 0x0A0D0D0A:
+        byte_order = bytes(buf[off + 8:off + 12])
+        if byte_order == b"\x4d\x3c\x2b\x1a":
+            return "<", []
+        if byte_order == b"\x1a\x2b\x3c\x4d":
+            return ">", []
+        raise UnsupportedCapture("corrupt pcapng section header")
+
+    block_len = struct.unpack_from(endian + "I", buf, off + 4)[0]
+    linktype = struct.unpack_from(endian + "H", buf, off + 8)[0]
+    if linktype not in SUPPORTED_LINKTYPES:
+        raise UnsupportedCapture(f"unsupported link type {linktype}")
+    options = buf[off + 16:off + block_len - 4]
+    return endian, interfaces + [(linktype, _ts_units(options, endian))]
+
+
+def _iter_pcapng(buf, byte_range: Optional[ByteRange] = None) -> Iterator[PacketRecord]:
+    if byte_range:
+        # Ranges after the head reuse its byte order and interfaces
+        endian, interfaces, _ = _pcapng_head(buf)
+        off, stop = byte_range
+    else:
+        endian, interfaces = "<", []
+        off, stop = 0, len(buf)
+
+    while off + 12 <= stop:
+        block_type = struct.unpack_from(endian + "I", buf, off)[0]
+
+        if block_type in (0x0A0D0D0A, 1):
+            if byte_range:
+                raise UnsupportedCapture("pcapng section changes inside byte range")
+            endian, interfaces = _pcapng_state(buf, off, block_type, endian, interfaces)
+
+        block_len = struct.unpack_from(endian + "I", buf, off + 4)[0]
+        if block_len < 12 or off + block_len > stop:
+            break
+
+        if block_type in (2, 6):
+            if block_type == 6:
+                iface, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(
+                    endian + "IIIII", buf, off + 8
+                )
+            else:
+                iface, _, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(
+                    endian + "HHIIII", buf, off + 8
+                )
+
+            if iface >= len(interfaces):
+                raise UnsupportedCapture("packet references unknown interface")
+
+            linktype, units = interfaces[iface]
+            data = off + 28
+            end = min(data + cap_len, off + block_len - 4)
+            sec, frac = divmod((ts_high << 32) | ts_low, units)
+
+            yield (
+                sec + frac / units,
+                orig_len,
+                decode_packet(buf, data, end, linktype),
+            )
+
+        elif block_type == 3:
+            # Simple Packet Blocks carry no timestamps
+            raise UnsupportedCapture("simple packet blocks are not supported")
+
+        off += block_len
+
+    if byte_range and off != stop:
+        raise UnsupportedCapture("byte range is not block-aligned")
+
+
+def _split_pcapng(buf, targets: List[int]) -> List[int]:
+    endian, _, head_end = _pcapng_head(buf)
+    size = len(buf)
+    u32 = struct.Struct(endian + "I")
+
+    def plausible(off: int) -> bool:
+        for _ in range(RESYNC_CHAIN):
+            if off == size:
+                return True
+            if off + 12 > size:
+                return False
+            block_type, block_len = struct.unpack_from(endian + "II", buf, off)
+            if (
+                block_type not in (2, 3, 4, 5, 6)
+                or block_len < 12
+                or block_len % 4
+                or off + block_len > size
+                or u32.unpack_from(buf, off + block_len - 4)[0] != block_len
+            ):
+                return False
+            off += block_len
+        return True
+
+    bounds = []
+    for target in targets:
+        start = max(target, head_end)
+        start += -start % 4  # blocks are 32-bit aligned
+        for off in range(start, min(target + RESYNC_WINDOW, size), 4):
+            if plausible(off):
+                bounds.append(off)
+                break
+    return bounds
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+
+def split_capture(pcap_file: str, parts: int) -> List[ByteRange]:
+    """
+    Split a capture into up to ``parts`` byte ranges that each start on a
+    record (PCAP) or block (PCAPNG) boundary.
+
+    Boundaries are found by probing for a chain of well-formed record
+    headers near each split target. A wrong guess is caught when the
+    preceding range does not end exactly on it: iter_packets then raises
+    UnsupportedCapture and callers fall back to a sequential read.
+    """
+    size = os.path.getsize(pcap_file)
+    if size == 0 or parts < 2:
+        return [(0, size)]
+
+    with open(pcap_file, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            targets = [size * i // parts for i in range(1, parts)]
+            if buf[:4] == PCAPNG_MAGIC:
+                first = _pcapng_head(buf)[2]
+                bounds = _split_pcapng(buf, targets)
+            else:
+                first = 24
+                bounds = _split_pcap(buf, targets)
+
+    edges = sorted({first, *bounds, size})
+    return [
+        (start, stop)
+        for start, stop in zip(edges, edges[1:])
+        if start < stop
+    ]
+
+
+def _read_exact(stream, size: int) -> Optional[bytes]:
+    data = stream.read(size)
+    if data is None or len(data) < size:
+        return None
+    return data
+
+
+def iter_stream(stream) -> Iterator[PacketRecord]:
+    """
+    Iterate over (timestamp, frame_length, packed_key) from a classic PCAP
+    byte stream, such as ``tshark -w - -F pcap`` writing to a pipe.
+    Stops cleanly at end of stream or on a truncated record.
+    """
+    header = _read_exact(stream, 24)
+    if header is None:
+        return
+
+    endian, units, linktype, _ = _pcap_header(header)
+    record = struct.Struct(endian + "IIII")
+
+    while True:
+        head = _read_exact(stream, 16)
+        if head is None:
+            return
+
+        sec, frac, incl_len, orig_len = record.unpack(head)
+        data = _read_exact(stream, incl_len)
+        if data is None:
+            return
+
+        yield sec + frac / units, orig_len, decode_packet(data, 0, incl_len, linktype)
+
+
+def iter_packets(
+    pcap_file: str,
+    byte_range: Optional[ByteRange] = None
+) -> Iterator[PacketRecord]:
+    """
+    Iterate over (timestamp, frame_length, packed_key) for every packet
+    in a PCAP or PCAPNG file, or only those inside ``byte_range`` (as
+    returned by split_capture). ``packed_key`` is None for packets that
+    cannot form a flow.
+
+    Raises UnsupportedCapture if the file needs a full dissector.
+    """
+    if os.path.getsize(pcap_file) == 0:
+        return
+
+    with open(pcap_file, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:4] == PCAPNG_MAGIC:
+                yield from _iter_pcapng(buf, byte_range)
+            else:
+                yield from _iter_pcap(buf, byte_range)
+
+
+def first_timestamp(pcap_file: str) -> float:
+    """
+    Timestamp of the first packet, or +inf for an empty capture.
+    """
+    packets = iter_packets(pcap_file)
+    try:
+        for timestamp, _, _ in packets:
+            return timestamp
+    finally:
+        packets.close()
+    return float("inf")
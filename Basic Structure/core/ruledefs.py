@@ -0,0 +1,521 @@
+import inspect
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from core.flowtable import PROTOCOL_NAMES, PROTOCOL_NUMBERS
+from core.ruleengine import AGGREGATES, FlowAggregates, register_rule
+
+
+# =====================================================
+# DECLARATIVE RULES
+# =====================================================
+#
+# Rules can be written as data instead of Python, one table per rule in
+# a TOML file (or a mapping per rule in YAML, with PyYAML installed):
+#
+#   [bruteforce]
+#   type = "BRUTE_FORCE"
+#   severity = "CRITICAL"
+#   group_by = ["src_ip", "dst_ip", "dst_port"]
+#   where = ["dst_port in monitored_ports"]
+#   when = ["attempts >= attempt_threshold", "duration_sec <= max_duration"]
+#
+#   [bruteforce.aggregate]
+#   attempts = "sum(packet_count)"
+#   duration_sec = "duration"
+#
+#   [bruteforce.params]
+#   attempt_threshold = 10
+#   max_duration = 60.0
+#   monitored_ports = [22, 21, 3389]
+#
+# Aggregates are count, duration (last end - first start, at least 1 ms)
+# and sum / min / max / rate (sum per second of duration) of a numeric
+# column, or distinct(column). They cover every flow being analyzed.
+#
+# Each definition is compiled once into a registered rule. Its group_by
+# keys and literal ``where`` filters become a shared aggregate: rows are
+# filtered, sorted by key once, and every aggregate any rule asks of that
+# grouping is a single reduceat over the sorted rows. Filters on a group
+# key that name a param, and the ``when`` thresholds, are vectorized
+# masks over the groups, which also serve as the rule's `ids tune` sweep.
+# Group-by keys become alert fields, aggregates and [rule.details]
+# entries (naming a param or aggregate) its details.
+
+KEYS = ("src_ip", "dst_ip", "src_port", "dst_port", "protocol")
+NUMERIC = ("packet_count", "byte_count", "start_time", "end_time", "src_port", "dst_port")
+FILTERABLE = NUMERIC + ("protocol",)
+
+OPERATORS: Dict[str, Callable[[np.ndarray, object], np.ndarray]] = {
+    ">=": np.greater_equal,
+    ">": np.greater,
+    "<=": np.less_equal,
+    "<": np.less,
+    "==": np.equal,
+    "!=": np.not_equal,
+    "in": lambda values, members: np.isin(values, list(members)),
+    "not in": lambda values, members: ~np.isin(values, list(members)),
+}
+
+CONDITION = re.compile(r"^\s*(\w+)\s*(>=|<=|==|!=|>|<|not\s+in\b|in\b)\s*(.+?)\s*$")
+EXPRESSION = re.compile(r"^\s*(?:(count|duration)|(sum|min|max|rate|distinct)\(\s*(\w+)\s*\))\s*$")
+
+# Expressions each shared grouping computes, for every rule using it
+_GROUP_EXPRESSIONS: Dict[str, List[str]] = {}
+
+# Protocols BPF knows by name; others are matched as "ip proto N"
+BPF_PROTOCOLS = {1, 6, 17, 132}
+
+# Every grouping also computes when each group's traffic started
+FIRST_SEEN = "min(start_time)"
+
+DECLARED: Dict[str, "DeclaredRule"] = {}
+
+
+@dataclass
+class Condition:
+    column: str
+    op: str
+    value: object
+    param: Optional[str] = None
+
+    def resolve(self, params: Dict) -> object:
+        return params[self.param] if self.param else self.value
+
+    def test(self, values: np.ndarray, params: Dict) -> np.ndarray:
+        value = self.resolve(params)
+        if self.column == "protocol" and self.op.endswith("in"):
+            value = [_protocol(member) for member in value]
+        elif self.column == "protocol":
+            value = _protocol(value)
+        return OPERATORS[self.op](values, value)
+
+    def __str__(self) -> str:
+        return f"{self.column} {self.op} {self.param or json.dumps(self.value)}"
+
+
+def _protocol(value) -> int:
+    if isinstance(value, str):
+        number = PROTOCOL_NUMBERS.get(value.upper())
+        if number is None:
+            raise ValueError(f"Unknown protocol {value!r}")
+        return number
+    return int(value)
+
+
+def _condition(text: str, params: Dict, columns) -> Condition:
+    match = CONDITION.match(text) if isinstance(text, str) else None
+    if not match:
+        raise ValueError(f"Bad condition {text!r} (use e.g. \"packets >= 100\")")
+    column, op, value = match.groups()
+    op = " ".join(op.split())
+    if column not in columns:
+        raise ValueError(f"Unknown name {column!r} in {text!r} (use one of: {', '.join(columns)})")
+
+    if value in params:
+        return Condition(column, op, None, param=value)
+    try:
+        literal = json.loads(value)
+    except ValueError:
+        raise ValueError(f"{value!r} in {text!r} is neither a param nor a literal")
+    if op.endswith("in") != isinstance(literal, list):
+        raise ValueError(f"{text!r}: 'in' takes a list, comparisons a single value")
+    return Condition(column, op, literal)
+
+
+# -----------------------------
+# Grouping
+# -----------------------------
+
+def _key_ids(aggregates: FlowAggregates, column: str) -> np.ndarray:
+    if column in ("src_ip", "dst_ip"):
+        return aggregates.address_ids(column)
+    return aggregates.column(column).astype(np.int64)
+
+
+def _combine(parts: List[np.ndarray]) -> np.ndarray:
+    """
+    One int64 key per row from several non-negative int64 key columns.
+    """
+    key = parts[0]
+    for part in parts[1:]:
+        span = int(part.max()) + 1
+        if int(key.max()) >= (1 << 62) // span:
+            key = np.unique(key, return_inverse=True)[1].ravel().astype(np.int64)
+        key = key * span + part
+    return key
+
+
+def _reduce(
+    expression: str,
+    sorted_column: Callable[[str], np.ndarray],
+    starts: np.ndarray,
+    counts: np.ndarray
+) -> np.ndarray:
+    """
+    ``expression`` per group, in key order. ``sorted_column`` gives a
+    column's values with each group's rows in one run.
+    """
+    kind, function, column = EXPRESSION.match(expression).groups()
+    if kind == "count":
+        return counts
+    if kind == "duration":
+        first = np.minimum.reduceat(sorted_column("start_time"), starts)
+        last = np.maximum.reduceat(sorted_column("end_time"), starts)
+        return np.maximum(last - first, 0.001)
+
+    values = sorted_column(column)
+    if function == "distinct":
+        span = int(values.max()) + 1
+        pairs = np.sort(np.repeat(np.arange(len(starts)), counts) * span + values)
+        distinct = np.ones(len(pairs), dtype=bool)
+        distinct[1:] = pairs[1:] != pairs[:-1]
+        return np.bincount(pairs[distinct] // span, minlength=len(starts))
+
+    if values.dtype.kind in "ui":
+        values = values.astype(np.int64)
+    if function == "min":
+        return np.minimum.reduceat(values, starts)
+    if function == "max":
+        return np.maximum.reduceat(values, starts)
+    total = np.add.reduceat(values, starts)
+    if function == "sum":
+        return total
+    return total / _reduce("duration", sorted_column, starts, counts)
+
+
+def _grouping(name: str, keys: Tuple[str, ...], filters: List[Condition]):
+    """
+    Aggregate grouping the (filtered) flows by ``keys``. Groups are in
+    order of first appearance; "row" is each group's first flow.
+    """
+    def aggregate(aggregates: FlowAggregates) -> Dict[str, np.ndarray]:
+        index = None
+        if filters:
+            mask = np.ones(len(aggregates.table), dtype=bool)
+            for condition in filters:
+                mask &= condition.test(aggregates.column(condition.column), {})
+            index = np.flatnonzero(mask)
+
+        def rows(values: np.ndarray) -> np.ndarray:
+            return values if index is None else values[index]
+
+        expressions = _GROUP_EXPRESSIONS.get(name, [])
+        if not len(rows(aggregates.column("packet_count"))):
+            empty = np.zeros(0, dtype=np.int64)
+            return {name: empty for name in ("row",) + keys + tuple(expressions)}
+
+        ids = {key: rows(_key_ids(aggregates, key)) for key in keys}
+        combined = _combine(list(ids.values()))
+        order = np.argsort(combined)
+        sorted_keys = combined[order]
+        boundary = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        starts = np.concatenate(([0], boundary))
+        counts = np.diff(np.append(starts, len(order)))
+
+        # Runs are unordered inside; a group's first row is its lowest
+        first = np.minimum.reduceat(order, starts)
+        appearance = np.argsort(first)
+        result = {"row": first[appearance] if index is None else index[first][appearance]}
+        for key in keys:
+            result[key] = ids[key][first][appearance]
+
+        gathered: Dict[str, np.ndarray] = {}
+
+        def sorted_column(column: str) -> np.ndarray:
+            if column not in gathered:
+                if column in ids:
+                    gathered[column] = ids[column][order]
+                elif column in ("src_ip", "dst_ip", "protocol"):
+                    gathered[column] = rows(_key_ids(aggregates, column))[order]
+                else:
+                    gathered[column] = rows(aggregates.column(column))[order]
+            return gathered[column]
+
+        for expression in expressions:
+            result[expression] = _reduce(expression, sorted_column, starts, counts)[appearance]
+        return result
+
+    return aggregate
+
+
+# -----------------------------
+# Compiled rules
+# -----------------------------
+
+@dataclass
+class DeclaredRule:
+    name: str
+    alert_type: str
+    severity: str
+    group_by: Tuple[str, ...]
+    aggregate: str
+    params: Dict[str, object]
+    expressions: Dict[str, str]
+    row_filters: List[Condition] = field(default_factory=list)
+    group_filters: List[Condition] = field(default_factory=list)
+    when: List[Condition] = field(default_factory=list)
+    details: Dict[str, str] = field(default_factory=dict)
+    description: str = ""
+
+    def values(self, params: Dict) -> Dict:
+        unknown = [name for name in params if name not in self.params]
+        if unknown:
+            raise TypeError(f"Rule {self.name} has no param(s): {', '.join(unknown)}")
+        return dict(self.params, **params)
+
+    def hits(self, aggregates: FlowAggregates, **params) -> np.ndarray:
+        """
+        Which groups alert; (configs, groups) when params are (configs, 1).
+        """
+        values = self.values(params)
+        groups = aggregates[self.aggregate]
+        mask = np.ones(len(groups["row"]), dtype=bool)
+        for condition in self.group_filters:
+            mask = mask & condition.test(groups[condition.column], values)
+        for condition in self.when:
+            mask = mask & condition.test(groups[self.expressions[condition.column]], values)
+        return mask
+
+    def alerts(self, aggregates: FlowAggregates, **params) -> List[Tuple[Dict, float]]:
+        """
+        (alert, first_seen) pairs for the groups that alert, in order of
+        each group's first flow.
+        """
+        values = self.values(params)
+        groups = aggregates[self.aggregate]
+        table = aggregates.table
+        alerts: List[Tuple[Dict, float]] = []
+
+        for group in np.flatnonzero(self.hits(aggregates, **values)):
+            row = int(groups["row"][group])
+            alert: Dict = {"type": self.alert_type, "severity": self.severity}
+            for key in self.group_by:
+                if key in ("src_ip", "dst_ip"):
+                    alert[key] = table.address_at(row, key)
+                elif key == "protocol":
+                    number = int(groups[key][group])
+                    alert[key] = PROTOCOL_NAMES.get(number, str(number))
+                else:
+                    alert[key] = int(groups[key][group])
+
+            details = {
+                name: _plain(groups[expression][group])
+                for name, expression in self.expressions.items()
+            }
+            for name, source in self.details.items():
+                if source in values:
+                    details[name] = values[source]
+                else:
+                    details[name] = _plain(groups[self.expressions[source]][group])
+            if self.description:
+                details["description"] = self.description
+            alert["details"] = details
+            alerts.append((alert, float(groups[FIRST_SEEN][group])))
+
+        return alerts
+
+    def capture(self, **params) -> Optional[str]:
+        """
+        BPF for the ports / protocols the ``where`` filters allow, if any.
+        """
+        values = self.values(params)
+        terms = []
+        for condition in self.row_filters + self.group_filters:
+            if condition.op != "in" or condition.column not in ("src_port", "dst_port", "protocol"):
+                continue
+            members = condition.resolve(values)
+            if condition.column == "protocol":
+                numbers = sorted(_protocol(member) for member in members)
+                names = [
+                    PROTOCOL_NAMES[number].lower() if number in BPF_PROTOCOLS
+                    else f"ip proto {number}"
+                    for number in numbers
+                ]
+            else:
+                direction = condition.column.split("_")[0]
+                names = [f"{direction} port {port}" for port in sorted(int(p) for p in members)]
+            terms.append(" or ".join(names))
+        if len(terms) > 1:
+            return " and ".join(f"({term})" for term in terms)
+        return terms[0] if terms else None
+
+
+def _plain(value):
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 2)
+    return int(value)
+
+
+# -----------------------------
+# Compiling and loading
+# -----------------------------
+
+def _names(definition: Dict, field_name: str) -> List[str]:
+    value = definition.get(field_name, [])
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError(f"{field_name!r} must be a list")
+    return value
+
+
+def compile_rule(name: str, definition: Dict) -> DeclaredRule:
+    """
+    Compile one rule definition and register it (replacing any rule
+    of the same name).
+    """
+    try:
+        unknown = set(definition) - {
+            "type", "severity", "summary", "description", "group_by",
+            "where", "aggregate", "when", "params", "details",
+        }
+        if unknown:
+            raise ValueError(f"unknown field(s): {', '.join(sorted(unknown))}")
+        if not definition.get("type"):
+            raise ValueError("'type' is required")
+
+        keys = tuple(_names(definition, "group_by"))
+        if not keys or any(key not in KEYS for key in keys) or len(set(keys)) != len(keys):
+            raise ValueError(f"'group_by' must list distinct keys from: {', '.join(KEYS)}")
+
+        params = dict(definition.get("params", {}))
+        for param, value in params.items():
+            if not isinstance(value, (int, float, str, list)) or isinstance(value, bool):
+                raise ValueError(f"param {param!r} must be a number, string or list")
+
+        expressions = dict(definition.get("aggregate", {}))
+        for alias, expression in expressions.items():
+            match = EXPRESSION.match(expression) if isinstance(expression, str) else None
+            if not match:
+                raise ValueError(
+                    f"bad aggregate {alias} = {expression!r} (use count, duration, "
+                    "sum / min / max / rate(column) or distinct(column))"
+                )
+            function, column = match.group(2), match.group(3)
+            allowed = KEYS if function == "distinct" else NUMERIC
+            if function and column not in allowed:
+                raise ValueError(
+                    f"{function}() takes one of: {', '.join(allowed)} (got {column!r})"
+                )
+            expressions[alias] = f"{function}({column})" if function else match.group(1)
+
+        row_filters, group_filters = [], []
+        for text in _names(definition, "where"):
+            condition = _condition(text, params, FILTERABLE)
+            if condition.param and condition.column not in keys:
+                raise ValueError(
+                    f"{text!r}: a filter on a column not in group_by takes a literal, not a param"
+                )
+            if condition.column == "protocol":
+                value = condition.resolve(params)
+                for member in value if isinstance(value, list) else [value]:
+                    _protocol(member)
+            (group_filters if condition.param else row_filters).append(condition)
+
+        when = [_condition(text, params, list(expressions)) for text in _names(definition, "when")]
+
+        details = dict(definition.get("details", {}))
+        for alias, source in details.items():
+            if source not in params and source not in expressions:
+                raise ValueError(f"detail {alias!r} names no param or aggregate: {source!r}")
+
+        # Rules grouping the same way share the grouping and its aggregates
+        aggregate = ",".join(keys)
+        if row_filters:
+            aggregate += "[" + " and ".join(str(condition) for condition in row_filters) + "]"
+        if aggregate not in AGGREGATES:
+            AGGREGATES[aggregate] = _grouping(aggregate, keys, row_filters)
+        shared = _GROUP_EXPRESSIONS.setdefault(aggregate, [])
+        wanted = list(expressions.values()) + [FIRST_SEEN]
+        shared.extend(e for e in dict.fromkeys(wanted) if e not in shared)
+    except ValueError as e:
+        raise ValueError(f"Rule {name}: {e}")
+
+    rule = DeclaredRule(
+        name=name,
+        alert_type=str(definition["type"]).upper(),
+        severity=str(definition.get("severity", "WARNING")).upper(),
+        group_by=keys,
+        aggregate=aggregate,
+        params=params,
+        expressions=expressions,
+        row_filters=row_filters,
+        group_filters=group_filters,
+        when=when,
+        details=details,
+        description=definition.get("description", ""),
+    )
+
+    # Signatures list the params, so `ids tune` can find numeric thresholds
+    signature = inspect.Signature(
+        [inspect.Parameter("aggregates", inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+        + [
+            inspect.Parameter(param, inspect.Parameter.KEYWORD_ONLY, default=value)
+            for param, value in params.items()
+        ]
+    )
+
+    def func(aggregates: FlowAggregates, **values) -> List[Tuple[Dict, float]]:
+        return rule.alerts(aggregates, **values)
+
+    def sweep(aggregates: FlowAggregates, **values) -> np.ndarray:
+        return rule.hits(aggregates, **values)
+
+    func.__signature__ = sweep.__signature__ = signature
+    capture = rule.capture if rule.capture() is not None else None
+
+    register_rule(
+        name,
+        needs=(aggregate,),
+        description=definition.get("summary", ""),
+        capture=capture,
+        sweep=sweep,
+        alert_type=rule.alert_type,
+    )(func)
+    DECLARED[name] = rule
+    return rule
+
+
+def load_rule_file(path: str) -> List[DeclaredRule]:
+    """
+    Compile and register every rule in a TOML or YAML file.
+    """
+    if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"{path}: YAML rule files need PyYAML (pip install pyyaml)")
+        with open(path, encoding="utf-8") as f:
+            try:
+                definitions = yaml.safe_load(f) or {}
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: {e}")
+    else:
+        with open(path, "rb") as f:
+            try:
+                definitions = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"{path}: {e}")
+
+    if not isinstance(definitions, dict):
+        raise ValueError(f"{path}: expected one table / mapping per rule")
+    compiled = []
+    for name, definition in definitions.items():
+        if not isinstance(definition, dict):
+            raise ValueError(f"{path}: rule {name!r} is not a table / mapping")
+        try:
+            compiled.append(compile_rule(name, definition))
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}")
+    return compiled
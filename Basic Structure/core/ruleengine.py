@@ -0,0 +1,204 @@
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.flowtable import FlowTable
+
+
+# =====================================================
+# FUSED RULE ENGINE
+# =====================================================
+#
+# Flows are grouped once into shared aggregates (e.g. per src, per
+# src→dst, per src→dst:port). Rules are plugins that declare which
+# aggregates they read; each aggregate is computed at most once per run
+# no matter how many rules use it, so adding a rule costs only its own
+# threshold test. The built-in rules are declarative (core.ruledefs),
+# which registers one aggregate per distinct grouping.
+
+AggregateFunc = Callable[["FlowAggregates"], Dict[str, np.ndarray]]
+RuleFunc = Callable[..., List[Tuple[Dict, float]]]
+SweepFunc = Callable[..., np.ndarray]
+
+AGGREGATES: Dict[str, AggregateFunc] = {}
+
+
+@dataclass
+class Rule:
+    name: str
+    func: RuleFunc
+    needs: Tuple[str, ...]
+    description: str = ""
+    capture: Optional[Callable[..., str]] = None
+    sweep: Optional[SweepFunc] = None
+    alert_type: str = ""
+
+
+RULES: Dict[str, Rule] = {}
+
+
+def register_aggregate(name: str):
+    """
+    Register a group-by aggregate that rules can request by name.
+    """
+    def decorator(func: AggregateFunc) -> AggregateFunc:
+        AGGREGATES[name] = func
+        return func
+    return decorator
+
+
+def register_rule(
+    name: str,
+    needs: Iterable[str],
+    description: str = "",
+    capture: Optional[Callable[..., str]] = None,
+    sweep: Optional[SweepFunc] = None,
+    alert_type: str = ""
+):
+    """
+    Register a detection rule. ``needs`` lists the aggregates it reads.
+    The rule is called as func(aggregates, **params) and returns
+    (alert, first_seen) pairs, first_seen being the start time of the
+    earliest flow behind the alert.
+
+    ``capture``, called with the same params, returns a BPF expression for
+    the only packets the rule can use (see core.capture); rules without
+    one need all decodable traffic.
+
+    ``sweep``, called as sweep(aggregates, **params), returns which groups
+    of the first aggregate in ``needs`` raise an ``alert_type`` alert. Its
+    numeric params may be arrays of shape (configs, 1), giving one row per
+    config (see core.tuning).
+    """
+    def decorator(func: RuleFunc) -> RuleFunc:
+        RULES[name] = Rule(
+            name=name,
+            func=func,
+            needs=tuple(needs),
+            description=description or (func.__doc__ or "").strip(),
+            capture=capture,
+            sweep=sweep,
+            alert_type=alert_type,
+        )
+        return func
+    return decorator
+
+
+# -----------------------------
+# Group-by helpers
+# -----------------------------
+
+def group_by(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Group rows by key. Groups are numbered in order of first appearance.
+    Returns (group index per row, first row of each group).
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.ravel()], first[order]
+
+
+def group_sum(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    out = np.zeros(size, dtype=values.dtype)
+    np.add.at(out, groups, values)
+    return out
+
+
+class FlowAggregates:
+    """
+    Lazily computed, shared group-by aggregates over one set of flows.
+    """
+
+    def __init__(self, flows: Dict):
+        self.table = FlowTable.from_flows(flows)
+        self.timings: Dict[str, float] = {}
+        self._cache: Dict[str, Dict[str, np.ndarray]] = {}
+        self._address_ids: Dict[str, np.ndarray] = {}
+
+    def __getitem__(self, name: str) -> Dict[str, np.ndarray]:
+        result = self._cache.get(name)
+        if result is None:
+            started = time.perf_counter()
+            result = self._cache[name] = AGGREGATES[name](self)
+            self.timings[name] = time.perf_counter() - started
+        return result
+
+    def column(self, name: str) -> np.ndarray:
+        return self.table.column(name)
+
+    def address_ids(self, which: str) -> np.ndarray:
+        """
+        Dense integer id per row for the "src_ip" or "dst_ip" address,
+        covering both IPv4 and IPv6 rows.
+        """
+        ids = self._address_ids.get(which)
+        if ids is None:
+            family = self.column("family")
+            addresses = self.column(which)
+
+            if len(family) and (family == 6).any():
+                halves = self.column(which + "6")
+                keys = np.rec.fromarrays([family, addresses, halves[:, 0], halves[:, 1]])
+            else:
+                keys = addresses
+
+            if len(keys):
+                ids = np.unique(keys, return_inverse=True)[1].ravel().astype(np.int64)
+            else:
+                ids = np.zeros(0, dtype=np.int64)
+            self._address_ids[which] = ids
+        return ids
+
+
+# -----------------------------
+# Engine
+# -----------------------------
+
+@dataclass
+class RuleReport:
+    alerts: List[Dict] = field(default_factory=list)
+    # When the traffic behind each alert started, in step with alerts
+    first_seen: List[float] = field(default_factory=list)
+    aggregate_times: Dict[str, float] = field(default_factory=dict)
+    rule_times: Dict[str, float] = field(default_factory=dict)
+
+
+def run_rules(
+    flows: Dict,
+    rules: Optional[Iterable[str]] = None,
+    params: Optional[Dict[str, Dict]] = None
+) -> RuleReport:
+    """
+    Run registered rules over the flows in one fused pass.
+
+    :param rules: rule names to run (default: all registered, in order)
+    :param params: per-rule keyword overrides, e.g. {"port_scan": {"port_threshold": 20}}
+    """
+    report = RuleReport()
+    if not flows:
+        return report
+
+    params = params or {}
+    selected = [RULES[name] for name in (rules or RULES)]
+    aggregates = FlowAggregates(flows)
+
+    # Each aggregate is built once, up front, and shared by every rule
+    for name in dict.fromkeys(need for rule in selected for need in rule.needs):
+        aggregates[name]
+    report.aggregate_times = dict(aggregates.timings)
+
+    for rule in selected:
+        started = time.perf_counter()
+        for alert, first_seen in rule.func(aggregates, **params.get(rule.name, {})):
+            report.alerts.append(alert)
+            report.first_seen.append(first_seen)
+        report.rule_times[rule.name] = time.perf_counter() - started
+
+    return report
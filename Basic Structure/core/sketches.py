@@ -0,0 +1,479 @@
+import heapq
+import math
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from core.flowtable import ip_to_string, unpack_key
+from core.metrics import MetricsRegistry
+from core.sliding import RULE_SAMPLE_EVERY, enabled_rules, rule_params, rule_stages
+
+
+# =====================================================
+# HASHING
+# =====================================================
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    """
+    splitmix64 finaliser: spreads Python's int / tuple hashes over 64 bits.
+    """
+    value &= _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+# =====================================================
+# SKETCHES
+# =====================================================
+
+class HyperLogLog:
+    """
+    Approximate distinct count in at most 2^precision one-byte registers.
+
+    Up to SPARSE_LIMIT values are kept exactly (so counts around the rule
+    thresholds are exact), then the set is folded into registers. Dense
+    estimates have a relative standard error of 1.04 / sqrt(2^precision):
+    6.5% at the default precision of 8 (256 bytes). Linear counting is
+    used below 2.5 * 2^precision.
+    """
+    __slots__ = ("precision", "_values", "_registers")
+
+    SPARSE_LIMIT = 16
+
+    def __init__(self, precision: int = 8):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self._values: Optional[set] = set()
+        self._registers: Optional[bytearray] = None
+
+    @property
+    def nbytes(self) -> int:
+        return 1 << self.precision
+
+    def add(self, value: Hashable) -> bool:
+        """
+        Record ``value``. True if it (probably) was not seen before.
+        """
+        values = self._values
+        if values is not None:
+            if value in values:
+                return False
+            values.add(value)
+            if len(values) > self.SPARSE_LIMIT:
+                self._registers = bytearray(1 << self.precision)
+                self._values = None
+                for seen in values:
+                    self._add_hash(_mix64(hash(seen)))
+            return True
+
+        return self._add_hash(_mix64(hash(value)))
+
+    def _add_hash(self, h: int) -> bool:
+        p = self.precision
+        register = h & ((1 << p) - 1)
+        rank = (64 - p) - (h >> p).bit_length() + 1
+        if rank > self._registers[register]:
+            self._registers[register] = rank
+            return True
+        return False
+
+    def count(self) -> float:
+        if self._values is not None:
+            return float(len(self._values))
+
+        registers = self._registers
+        m = len(registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -rank for rank in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+
+class _Counter:
+    __slots__ = ("count", "error", "first_seen", "last_seen", "distinct", "alerted")
+
+    def __init__(self, count: int, timestamp: float, distinct=None):
+        self.count = count
+        self.error = count
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.distinct = distinct
+        # Set while the key is above its detector's threshold
+        self.alerted = False
+
+    @property
+    def guaranteed(self) -> int:
+        """
+        Increments since this key took the counter (exact).
+        """
+        return self.count - self.error
+
+
+class SpaceSaving:
+    """
+    Top-K heavy hitters (Metwally et al.) in ``k`` counters.
+
+    Every key with more than N / k of the N increments is guaranteed to be
+    tracked. A tracked count overestimates by at most its ``error``, so
+    ``count - error`` is a guaranteed lower bound; keys tracked since their
+    first increment have error 0 and exact counts and times. A key that
+    takes over an evicted counter starts its first_seen (and ``distinct``
+    sketch, when a factory is given) at the takeover.
+    """
+
+    def __init__(
+        self,
+        k: int = 1024,
+        distinct: Optional[Callable[[], HyperLogLog]] = None
+    ):
+        if k < 1:
+            raise ValueError("Space-Saving needs at least one counter")
+        self.k = k
+        self._distinct = distinct
+        self._entries: Dict[Hashable, _Counter] = {}
+        # (count, seq, key) lower bounds of live counts; stale ones are
+        # refreshed lazily when popped
+        self._heap: List[Tuple[int, int, Hashable]] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Upper bound of the distinct sketches' register memory.
+        """
+        if self._distinct is None:
+            return 0
+        return self.k * self._distinct().nbytes
+
+    def add(self, key: Hashable, timestamp: float, count: int = 1) -> _Counter:
+        """
+        Count ``key`` (``count`` may be 0 to only start tracking it).
+        """
+        entries = self._entries
+        entry = entries.get(key)
+
+        if entry is None:
+            floor = self._evict_min() if len(entries) >= self.k else 0
+            distinct = self._distinct() if self._distinct is not None else None
+            entry = entries[key] = _Counter(floor, timestamp, distinct)
+            self._push(floor, key)
+
+        entry.count += count
+        if timestamp > entry.last_seen:
+            entry.last_seen = timestamp
+        return entry
+
+    def _push(self, count: int, key: Hashable) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (count, self._seq, key))
+
+    def _evict_min(self) -> int:
+        entries, heap = self._entries, self._heap
+        while True:
+            count, _, key = heapq.heappop(heap)
+            entry = entries.get(key)
+            if entry is None:
+                continue
+            if entry.count != count:
+                self._push(entry.count, key)
+                continue
+            del entries[key]
+            return count
+
+    def get(self, key: Hashable) -> Optional[_Counter]:
+        return self._entries.get(key)
+
+    def items(self) -> Iterable[Tuple[Hashable, _Counter]]:
+        return self._entries.items()
+
+    def top(self, n: int = 10) -> List[Tuple[Hashable, _Counter]]:
+        return sorted(
+            self._entries.items(), key=lambda item: item[1].count, reverse=True
+        )[:n]
+
+
+# =====================================================
+# SKETCH DETECTORS
+# =====================================================
+
+class SketchDetectors:
+    """
+    Fixed-memory port scan, flood and brute-force detection.
+
+      - port scan  : Space-Saving over (src, dst) pairs, counting NEW
+                     ports only, with a HyperLogLog of ports per pair
+      - flood      : Space-Saving over sources (packets, timing and a
+                     HyperLogLog of targets)
+      - brute force: Space-Saving over (src, dst, port) on monitored ports
+
+    Memory is fixed by the counter budgets, whatever the number of sources,
+    pairs or ports. A key is guaranteed a counter once it has more than 1/k
+    of the increments (new ports for pairs, packets otherwise); below that,
+    heavy churn can evict it and hide a slow scan. Thresholds are checked
+    against what was counted since a key took its counter, so estimates
+    err low: sketch mode does not raise alerts exact mode would not,
+    short of HyperLogLog error on large port counts.
+
+    update() feeds one packet and returns alerts the moment a threshold is
+    crossed (live). report() evaluates the whole stream the way the
+    offline rules do. With a ``horizon``, all state is reset every
+    ``horizon`` seconds of capture time (tumbling epochs). ``rules``
+    limits detection to some of the three, and thresholds left as None
+    are the rules' declared params (see rule_params). One update in
+    RULE_SAMPLE_EVERY is timed rule by rule into ``metrics``.
+    """
+
+    def __init__(
+        self,
+        horizon: Optional[float] = None,
+        port_threshold: Optional[int] = None,
+        pps_threshold: Optional[float] = None,
+        min_packets: Optional[int] = None,
+        min_duration: Optional[float] = None,
+        attempt_threshold: Optional[int] = None,
+        max_duration: Optional[float] = None,
+        monitored_ports: Optional[Iterable[int]] = None,
+        pair_counters: int = 8192,
+        heavy_hitters: int = 1024,
+        rules: Optional[Iterable[str]] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        params = rule_params(
+            port_threshold=port_threshold,
+            pps_threshold=pps_threshold,
+            min_packets=min_packets,
+            min_duration=min_duration,
+            attempt_threshold=attempt_threshold,
+            max_duration=max_duration,
+            monitored_ports=monitored_ports,
+        )
+        self.horizon = horizon
+        self.port_threshold = params["port_threshold"]
+        self.pps_threshold = params["pps_threshold"]
+        self.min_packets = params["min_packets"]
+        self.min_duration = params["min_duration"]
+        self.attempt_threshold = params["attempt_threshold"]
+        self.max_duration = params["max_duration"]
+        self.monitored_ports = set(params["monitored_ports"])
+        self.rules = enabled_rules(rules)
+        self._port_scan = "port_scan" in self.rules
+        self._flood = "flood" in self.rules
+        if "bruteforce" not in self.rules:
+            self.monitored_ports = set()
+        self.pair_counters = pair_counters
+        self.heavy_hitters = heavy_hitters
+        self._epoch: Optional[int] = None
+        self._stages = rule_stages(self.rules, metrics)
+        self._countdown = RULE_SAMPLE_EVERY
+        self.reset()
+
+    def reset(self) -> None:
+        self._pairs = SpaceSaving(self.pair_counters, distinct=HyperLogLog)
+        self._sources = SpaceSaving(self.heavy_hitters, distinct=HyperLogLog)
+        self._attempts = SpaceSaving(self.heavy_hitters)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the fixed sketch arrays and registers.
+        """
+        return self._pairs.nbytes + self._sources.nbytes
+
+    @property
+    def tracked_keys(self) -> int:
+        return len(self._pairs) + len(self._sources) + len(self._attempts)
+
+    def top_sources(self, n: int = 10) -> List[Tuple[str, int]]:
+        """
+        Heaviest sources as (address, packets upper bound).
+        """
+        return [
+            (ip_to_string(src, family), entry.count)
+            for (family, src), entry in self._sources.top(n)
+        ]
+
+    @staticmethod
+    def _crossed(entry: _Counter, above: bool) -> bool:
+        """
+        True exactly once each time a key goes above its threshold. The
+        flag lives in the key's counter, so it goes when the counter is
+        evicted or the epoch resets.
+        """
+        if not above:
+            entry.alerted = False
+            return False
+        if entry.alerted:
+            return False
+        entry.alerted = True
+        return True
+
+    # -----------------------------
+    # Streaming
+    # -----------------------------
+
+    def update(self, key: int, timestamp: float, packets: int = 1) -> List[dict]:
+        """
+        Account one packet (packed flow key), or ``packets`` of the same
+        key up to ``timestamp``, and return any new alerts.
+        """
+        if self.horizon:
+            epoch = int(timestamp // self.horizon)
+            if epoch != self._epoch:
+                if self._epoch is not None:
+                    self.reset()
+                self._epoch = epoch
+
+        family, src, dst, _, dst_port, _ = unpack_key(key)
+        alerts: List[dict] = []
+
+        self._countdown -= 1
+        timed = not self._countdown
+        if timed:
+            self._countdown = RULE_SAMPLE_EVERY
+            started = time.perf_counter()
+
+        # PORT SCAN
+        if self._port_scan and dst_port > 0:
+            pair = (family, src, dst)
+            entry = self._pairs.add(pair, timestamp, 0)
+            if entry.distinct.add(dst_port):
+                entry.count += 1
+                if self._crossed(entry, self._is_port_scan(entry)):
+                    alerts.append(self._port_scan_alert(pair, entry))
+        if timed and self._port_scan:
+            started = self._observe("port_scan", started)
+
+        # FLOOD
+        if self._flood:
+            source = (family, src)
+            entry = self._sources.add(source, timestamp, packets)
+            entry.distinct.add(dst)
+            if self._crossed(entry, self._is_flood(entry)):
+                alerts.append(self._flood_alert(source, entry))
+        if timed and self._flood:
+            started = self._observe("flood", started)
+
+        # BRUTE FORCE
+        if dst_port in self.monitored_ports:
+            target = (family, src, dst, dst_port)
+            attempts = self._attempts.add(target, timestamp, packets)
+            if self._crossed(attempts, self._is_bruteforce(attempts)):
+                alerts.append(self._bruteforce_alert(target, attempts))
+        if timed and self.monitored_ports:
+            self._observe("bruteforce", started)
+
+        return alerts
+
+    def _observe(self, rule: str, started: float) -> float:
+        now = time.perf_counter()
+        self._stages[rule].observe(now - started)
+        return now
+
+    # -----------------------------
+    # Whole-stream evaluation
+    # -----------------------------
+
+    def report(self) -> List[dict]:
+        """
+        Alerts for everything seen so far, in rule order
+        (port scan, brute force, flood).
+        """
+        alerts = [
+            self._port_scan_alert(pair, entry)
+            for pair, entry in self._pairs.items()
+            if self._is_port_scan(entry)
+        ]
+
+        for target, attempts in self._attempts.items():
+            if self._is_bruteforce(attempts):
+                alerts.append(self._bruteforce_alert(target, attempts))
+
+        for source, entry in self._sources.items():
+            if self._is_flood(entry):
+                alerts.append(self._flood_alert(source, entry))
+
+        return alerts
+
+    # -----------------------------
+    # Thresholds and alert records
+    # -----------------------------
+
+    @staticmethod
+    def _duration(entry: _Counter) -> float:
+        return max(entry.last_seen - entry.first_seen, 0.001)
+
+    def _is_port_scan(self, entry: _Counter) -> bool:
+        return entry.distinct.count() >= self.port_threshold
+
+    def _is_flood(self, entry: _Counter) -> bool:
+        packets, duration = entry.guaranteed, self._duration(entry)
+        return (
+            packets >= self.min_packets
+            and duration >= self.min_duration
+            and packets / duration >= self.pps_threshold
+        )
+
+    def _is_bruteforce(self, attempts: _Counter) -> bool:
+        return (
+            attempts.guaranteed >= self.attempt_threshold
+            and self._duration(attempts) <= self.max_duration
+        )
+
+    def _port_scan_alert(self, pair: tuple, entry: _Counter) -> dict:
+        family, src, dst = pair
+        return {
+            "type": "PORT_SCAN",
+            "severity": "CRITICAL",
+            "src_ip": ip_to_string(src, family),
+            "dst_ip": ip_to_string(dst, family),
+            "details": {
+                "unique_ports_attempted": int(round(entry.distinct.count())),
+                "threshold": self.port_threshold,
+                "estimated": True,
+                "description": "Multiple ports probed on same host"
+            }
+        }
+
+    def _flood_alert(self, source: tuple, entry: _Counter) -> dict:
+        family, src = source
+        packets, duration = entry.guaranteed, self._duration(entry)
+        return {
+            "type": "FLOOD",
+            "severity": "CRITICAL",
+            "src_ip": ip_to_string(src, family),
+            "details": {
+                "packets_per_sec": round(packets / duration, 2),
+                "total_packets": packets,
+                "duration_sec": round(duration, 2),
+                "unique_targets": int(round(entry.distinct.count())),
+                "threshold": self.pps_threshold,
+                "estimated": True,
+                "description": "Sustained high-rate traffic from single source"
+            }
+        }
+
+    def _bruteforce_alert(self, target: tuple, attempts: _Counter) -> dict:
+        family, src, dst, dst_port = target
+        return {
+            "type": "BRUTE_FORCE",
+            "severity": "CRITICAL",
+            "src_ip": ip_to_string(src, family),
+            "dst_ip": ip_to_string(dst, family),
+            "dst_port": dst_port,
+            "details": {
+                "attempts": attempts.guaranteed,
+                "duration_sec": round(self._duration(attempts), 2),
+                "threshold": self.attempt_threshold,
+                "estimated": True,
+                "description": "Multiple login attempts in short time window"
+            }
+        }
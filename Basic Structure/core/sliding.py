@@ -0,0 +1,392 @@
+import math
+import time
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Optional
+
+import core.rules  # noqa: F401  (registers the built-in rules)
+from core.flowtable import ip_to_string, unpack_key
+from core.metrics import METRICS, Histogram, MetricsRegistry
+from core.ruledefs import DECLARED
+
+# Rules the live detectors implement (names as in core.rules)
+DETECTOR_RULES = ("port_scan", "bruteforce", "flood")
+
+# Detector thresholds and the rule whose params they mirror
+RULE_PARAMS = {
+    "port_threshold": "port_scan",
+    "attempt_threshold": "bruteforce",
+    "max_duration": "bruteforce",
+    "monitored_ports": "bruteforce",
+    "pps_threshold": "flood",
+    "min_packets": "flood",
+    "min_duration": "flood",
+}
+
+# One update in RULE_SAMPLE_EVERY is timed rule by rule
+RULE_SAMPLE_EVERY = 64
+
+
+def enabled_rules(rules: Optional[Iterable[str]] = None) -> set:
+    """
+    Validate a rule selection (default: all detector rules).
+    """
+    selected = set(DETECTOR_RULES if rules is None else rules)
+    unknown = selected - set(DETECTOR_RULES)
+    if unknown:
+        raise ValueError(
+            f"Unknown rule(s): {', '.join(sorted(unknown))} "
+            f"(available: {', '.join(DETECTOR_RULES)})"
+        )
+    return selected
+
+
+def rule_params(**params) -> Dict:
+    """
+    Detector thresholds, with those left as None taken from the declared
+    rules (core/rules.toml, or a rule file loaded over it).
+    """
+    resolved = {}
+    for name, value in params.items():
+        if value is None:
+            declared = DECLARED.get(RULE_PARAMS[name])
+            if declared is None or name not in declared.params:
+                raise ValueError(f"Rule {RULE_PARAMS[name]} declares no {name!r} param")
+            value = declared.params[name]
+        resolved[name] = value
+    return resolved
+
+
+def rule_stages(
+    rules: Iterable[str],
+    metrics: Optional[MetricsRegistry] = None
+) -> Dict[str, Histogram]:
+    """
+    Sampled per-rule update time, as ids_stage_seconds{stage="rule_<name>"}.
+    """
+    metrics = metrics or METRICS
+    return {
+        rule: metrics.histogram(
+            "ids_stage_seconds", "Sampled per-packet / per-window stage time",
+            stage=f"rule_{rule}")
+        for rule in rules
+    }
+
+
+# =====================================================
+# SLIDING-WINDOW AGGREGATES
+# =====================================================
+
+class _KeyState:
+    """
+    Per-key aggregate over the live buckets of a SlidingWindow.
+    """
+    __slots__ = ("total", "last_seen", "buckets", "refcounts", "alerted")
+
+    def __init__(self):
+        self.total = 0
+        self.last_seen = 0.0
+        # Set while the key is above its detector's threshold
+        self.alerted = False
+        # [bucket_id, packets, first_timestamp, distinct_values | None]
+        self.buckets = deque()
+        # distinct value -> number of live buckets containing it
+        self.refcounts: Dict[Hashable, int] = {}
+
+    @property
+    def first_seen(self) -> float:
+        return self.buckets[0][2]
+
+    @property
+    def duration(self) -> float:
+        return max(self.last_seen - self.first_seen, 0.001)
+
+    @property
+    def distinct(self) -> int:
+        return len(self.refcounts)
+
+
+class SlidingWindow:
+    """
+    Time-bucketed per-key packet counts (and optionally distinct values)
+    over a sliding horizon.
+
+    add() is O(1). When time moves past a bucket, only the keys touched in
+    the expiring bucket are visited, so idle keys are dropped as well and
+    the cost is amortised over the updates that created them.
+    """
+
+    def __init__(self, horizon: float, bucket: float, distinct: bool = False):
+        if horizon <= 0 or bucket <= 0:
+            raise ValueError("Horizon and bucket width must be positive")
+
+        self.horizon = horizon
+        self.bucket = bucket
+        self.distinct = distinct
+        self._span = max(int(math.ceil(horizon / bucket)), 1)
+        self._current: Optional[int] = None
+        self._keys: Dict[Hashable, _KeyState] = {}
+        # bucket_id -> keys touched in that bucket, in time order
+        self._touched: Dict[int, set] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, key: Hashable) -> Optional[_KeyState]:
+        return self._keys.get(key)
+
+    def advance(self, timestamp: float) -> int:
+        """
+        Move the window forward to ``timestamp`` and expire old buckets.
+        Late packets are counted in the current bucket.
+        """
+        bucket_id = int(timestamp // self.bucket)
+
+        if self._current is None or bucket_id > self._current:
+            self._current = bucket_id
+            self._expire(bucket_id - self._span)
+
+        return self._current
+
+    def add(
+        self,
+        key: Hashable,
+        timestamp: float,
+        packets: int = 1,
+        value: Hashable = None
+    ) -> _KeyState:
+        bucket_id = self.advance(timestamp)
+
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState()
+
+        buckets = state.buckets
+        if not buckets or buckets[-1][0] != bucket_id:
+            buckets.append([bucket_id, 0, timestamp, set() if self.distinct else None])
+            self._touched.setdefault(bucket_id, set()).add(key)
+
+        entry = buckets[-1]
+        entry[1] += packets
+        state.total += packets
+        if timestamp > state.last_seen:
+            state.last_seen = timestamp
+
+        if value is not None and value not in entry[3]:
+            entry[3].add(value)
+            state.refcounts[value] = state.refcounts.get(value, 0) + 1
+
+        return state
+
+    def _expire(self, cutoff: int) -> None:
+        touched = self._touched
+
+        while touched:
+            oldest = next(iter(touched))
+            if oldest > cutoff:
+                break
+
+            for key in touched.pop(oldest):
+                state = self._keys.get(key)
+                if state is None:
+                    continue
+
+                buckets = state.buckets
+                while buckets and buckets[0][0] <= cutoff:
+                    _, packets, _, values = buckets.popleft()
+                    state.total -= packets
+                    for value in values or ():
+                        remaining = state.refcounts[value] - 1
+                        if remaining:
+                            state.refcounts[value] = remaining
+                        else:
+                            del state.refcounts[value]
+
+                if not buckets:
+                    del self._keys[key]
+
+
+# =====================================================
+# INCREMENTAL DETECTORS
+# =====================================================
+
+class SlidingDetectors:
+    """
+    Incremental versions of the port scan, flood and brute-force rules.
+
+    Packets are fed one at a time; each update is O(1) and an alert is
+    returned the moment a threshold is crossed. State carries across live
+    windows, so slow scans and brute force spread over many windows are
+    still caught:
+
+      - port scan  : distinct ports per (src, dst) over ``horizon``
+      - flood      : packets per src over ``horizon``
+      - brute force: packets per (src, dst, port) over ``max_duration``
+
+    An alert fires once per key and re-arms when the key drops back
+    below its threshold or its window state expires (the alerted flag
+    lives in that state, so quiet keys leave nothing behind). ``rules``
+    limits detection to some of them; thresholds left as None are the
+    rules' declared params (see rule_params).
+
+    One update in RULE_SAMPLE_EVERY is timed rule by rule into
+    ``metrics`` (see rule_stages).
+    """
+
+    def __init__(
+        self,
+        horizon: float = 600.0,
+        bucket: float = 5.0,
+        port_threshold: Optional[int] = None,
+        pps_threshold: Optional[float] = None,
+        min_packets: Optional[int] = None,
+        min_duration: Optional[float] = None,
+        attempt_threshold: Optional[int] = None,
+        max_duration: Optional[float] = None,
+        monitored_ports: Optional[Iterable[int]] = None,
+        rules: Optional[Iterable[str]] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        params = rule_params(
+            port_threshold=port_threshold,
+            pps_threshold=pps_threshold,
+            min_packets=min_packets,
+            min_duration=min_duration,
+            attempt_threshold=attempt_threshold,
+            max_duration=max_duration,
+            monitored_ports=monitored_ports,
+        )
+        self.horizon = horizon
+        self.port_threshold = params["port_threshold"]
+        self.pps_threshold = params["pps_threshold"]
+        self.min_packets = params["min_packets"]
+        self.min_duration = params["min_duration"]
+        self.attempt_threshold = params["attempt_threshold"]
+        self.max_duration = params["max_duration"]
+        self.monitored_ports = set(params["monitored_ports"])
+        self.rules = enabled_rules(rules)
+        self._port_scan = "port_scan" in self.rules
+        self._flood = "flood" in self.rules
+        if "bruteforce" not in self.rules:
+            self.monitored_ports = set()
+
+        self._ports_by_pair = SlidingWindow(horizon, bucket, distinct=True)
+        self._traffic_by_src = SlidingWindow(horizon, bucket, distinct=True)
+        self._attempts = SlidingWindow(self.max_duration, bucket)
+        self._stages = rule_stages(self.rules, metrics)
+        self._countdown = RULE_SAMPLE_EVERY
+
+    @staticmethod
+    def _crossed(state: _KeyState, above: bool) -> bool:
+        """
+        True exactly once each time a key goes above its threshold.
+        """
+        if not above:
+            state.alerted = False
+            return False
+        if state.alerted:
+            return False
+        state.alerted = True
+        return True
+
+    def update(self, key: int, timestamp: float, packets: int = 1) -> List[dict]:
+        """
+        Account one packet (packed flow key), or ``packets`` of the same
+        key up to ``timestamp``, and return any new alerts.
+        """
+        family, src, dst, _, dst_port, _ = unpack_key(key)
+        alerts: List[dict] = []
+
+        self._countdown -= 1
+        timed = not self._countdown
+        if timed:
+            self._countdown = RULE_SAMPLE_EVERY
+            started = time.perf_counter()
+
+        # PORT SCAN
+        if self._port_scan and dst_port > 0:
+            pair = self._ports_by_pair.add((src, dst), timestamp, packets, value=dst_port)
+            if self._crossed(
+                pair,
+                pair.distinct >= self.port_threshold
+            ):
+                alerts.append({
+                    "type": "PORT_SCAN",
+                    "severity": "CRITICAL",
+                    "src_ip": ip_to_string(src, family),
+                    "dst_ip": ip_to_string(dst, family),
+                    "details": {
+                        "unique_ports_attempted": pair.distinct,
+                        "threshold": self.port_threshold,
+                        "window_sec": self.horizon,
+                        "description": "Multiple ports probed on same host"
+                    }
+                })
+        if timed and self._port_scan:
+            started = self._observe("port_scan", started)
+
+        # FLOOD
+        if self._flood:
+            traffic = self._traffic_by_src.add(src, timestamp, packets, value=dst)
+            duration = traffic.duration
+            pps = traffic.total / duration
+            if self._crossed(
+                traffic,
+                traffic.total >= self.min_packets
+                and duration >= self.min_duration
+                and pps >= self.pps_threshold
+            ):
+                alerts.append({
+                    "type": "FLOOD",
+                    "severity": "CRITICAL",
+                    "src_ip": ip_to_string(src, family),
+                    "details": {
+                        "packets_per_sec": round(pps, 2),
+                        "total_packets": traffic.total,
+                        "duration_sec": round(duration, 2),
+                        "unique_targets": traffic.distinct,
+                        "threshold": self.pps_threshold,
+                        "window_sec": self.horizon,
+                        "description": "Sustained high-rate traffic from single source"
+                    }
+                })
+        if timed and self._flood:
+            started = self._observe("flood", started)
+
+        # BRUTE FORCE
+        if dst_port in self.monitored_ports:
+            attempts = self._attempts.add((src, dst, dst_port), timestamp, packets)
+            if self._crossed(
+                attempts,
+                attempts.total >= self.attempt_threshold
+                and attempts.duration <= self.max_duration
+            ):
+                alerts.append({
+                    "type": "BRUTE_FORCE",
+                    "severity": "CRITICAL",
+                    "src_ip": ip_to_string(src, family),
+                    "dst_ip": ip_to_string(dst, family),
+                    "dst_port": dst_port,
+                    "details": {
+                        "attempts": attempts.total,
+                        "duration_sec": round(attempts.duration, 2),
+                        "threshold": self.attempt_threshold,
+                        "description": "Multiple login attempts in short time window"
+                    }
+                })
+        if timed and self.monitored_ports:
+            self._observe("bruteforce", started)
+
+        return alerts
+
+    def _observe(self, rule: str, started: float) -> float:
+        now = time.perf_counter()
+        self._stages[rule].observe(now - started)
+        return now
+
+    @property
+    def tracked_keys(self) -> int:
+        return (
+            len(self._ports_by_pair)
+            + len(self._traffic_by_src)
+            + len(self._attempts)
+        )
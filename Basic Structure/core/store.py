@@ -0,0 +1,502 @@
+import calendar
+import json
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from rich.console import Console
+
+from core.flowtable import PROTOCOL_NAMES, PROTOCOL_NUMBERS, FlowTable, ip_to_string
+from core.metrics import METRICS
+
+console = Console()
+
+
+# =====================================================
+# FLOW / ALERT STORE
+# =====================================================
+#
+# Flows and alerts are appended to SQLite files partitioned by UTC day
+# (YYYY-MM-DD.sqlite under the store directory). A query opens only the
+# partitions its time range touches, and each partition is indexed on
+# time and on the fields incident response filters by:
+#
+#   flows : start, (src_ip, start), (dst_ip, start), (dst_port, start)
+#   alerts: time, (type, time), (src_ip, time), (dst_ip, time),
+#           (dst_port, time)
+#
+# so "all flows from 10.1.2.3 last Tuesday" is an index range scan in
+# one or two files, however many weeks are stored. Old data is dropped
+# by deleting whole partitions.
+#
+# Writes go through a FlowStore: put() only enqueues; a background
+# thread converts each FlowTable to rows in bulk and commits one
+# transaction per batch, so the live loop never waits on disk.
+
+STORE_VERSION = 1
+DEFAULT_STORE_DIR = os.environ.get(
+    "IDS_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "ids", "store")
+)
+
+DAY = 86400
+# Partition files kept open by the writer
+OPEN_PARTITIONS = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flows (
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    src_ip TEXT NOT NULL,
+    dst_ip TEXT NOT NULL,
+    src_port INTEGER NOT NULL,
+    dst_port INTEGER NOT NULL,
+    protocol TEXT NOT NULL,
+    packets INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS flows_start ON flows (start);
+CREATE INDEX IF NOT EXISTS flows_src ON flows (src_ip, start);
+CREATE INDEX IF NOT EXISTS flows_dst ON flows (dst_ip, start);
+CREATE INDEX IF NOT EXISTS flows_port ON flows (dst_port, start);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    time REAL NOT NULL,
+    type TEXT NOT NULL,
+    severity TEXT,
+    src_ip TEXT,
+    dst_ip TEXT,
+    dst_port INTEGER,
+    source TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_time ON alerts (time);
+CREATE INDEX IF NOT EXISTS alerts_type ON alerts (type, time);
+CREATE INDEX IF NOT EXISTS alerts_src ON alerts (src_ip, time);
+CREATE INDEX IF NOT EXISTS alerts_dst ON alerts (dst_ip, time);
+CREATE INDEX IF NOT EXISTS alerts_port ON alerts (dst_port, time);
+"""
+
+_PARTITION = re.compile(r"^(\d{4}-\d{2}-\d{2})\.sqlite$")
+
+
+def _partition_name(day: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(day * DAY)) + ".sqlite"
+
+
+def _open(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+        conn.executescript(_SCHEMA)
+        conn.execute(f"PRAGMA user_version={STORE_VERSION}")
+    return conn
+
+
+# -----------------------------
+# Rows
+# -----------------------------
+
+def flow_rows(table: FlowTable, source: str) -> Iterator[Tuple[int, List[tuple]]]:
+    """
+    (day, rows) per UTC day of flow start, built column-wise: each
+    distinct address and protocol is converted to text once.
+    """
+    if not len(table):
+        return
+
+    def column(name: str) -> np.ndarray:
+        return table.column(name)
+
+    start = column("start_time")
+    family = column("family")
+
+    addresses = {}
+    for which in ("src_ip", "dst_ip"):
+        values = column(which)
+        unique, inverse = np.unique(values, return_inverse=True)
+        text = np.array([ip_to_string(int(value)) for value in unique], dtype=object)
+        strings = text[inverse.ravel()]
+        # IPv6 rows hold their address in separate columns
+        for row in np.flatnonzero(family == 6):
+            strings[row] = table.address_at(int(row), which)
+        addresses[which] = strings
+
+    protocol = column("protocol")
+    names = np.array(
+        [PROTOCOL_NAMES.get(int(number), str(number)) for number in range(256)],
+        dtype=object
+    )[protocol]
+
+    columns = (
+        start.tolist(),
+        column("end_time").tolist(),
+        addresses["src_ip"].tolist(),
+        addresses["dst_ip"].tolist(),
+        column("src_port").tolist(),
+        column("dst_port").tolist(),
+        names.tolist(),
+        column("packet_count").tolist(),
+        column("byte_count").tolist(),
+    )
+
+    days = (start // DAY).astype(np.int64)
+    for day in np.unique(days):
+        rows = np.flatnonzero(days == day).tolist()
+        yield int(day), [
+            tuple(values[row] for values in columns) + (source,)
+            for row in rows
+        ]
+
+
+def alert_row(alert: Dict, timestamp: float, source: str) -> tuple:
+    """
+    The alert's fields as columns; its details, and any other fields,
+    as JSON.
+    """
+    extra = dict(alert.get("details") or {})
+    extra.update(
+        (key, value) for key, value in alert.items()
+        if key not in ("type", "severity", "src_ip", "dst_ip", "dst_port", "details")
+    )
+    port = alert.get("dst_port")
+    return (
+        timestamp,
+        str(alert.get("type", "UNKNOWN")),
+        alert.get("severity"),
+        alert.get("src_ip"),
+        alert.get("dst_ip"),
+        int(port) if port is not None else None,
+        source,
+        json.dumps(extra, default=str),
+    )
+
+
+# -----------------------------
+# Writer
+# -----------------------------
+
+class FlowStore:
+    """
+    Appends flows and alerts to the partitioned store from a background
+    thread. put_flows() / put_alerts() never block: when more than
+    ``max_queue`` batches are waiting, new ones are dropped and counted.
+    close() writes everything queued.
+    """
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIR, max_queue: int = 64):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(max_queue)
+        self._connections: "OrderedDict[int, sqlite3.Connection]" = OrderedDict()
+
+        self._metrics = {
+            "flows": METRICS.counter("ids_store_flows_total", "Flows written to the store"),
+            "alerts": METRICS.counter("ids_store_alerts_total", "Alerts written to the store"),
+            "dropped": METRICS.counter(
+                "ids_store_dropped_total", "Store batches dropped because the writer fell behind"),
+            "write": METRICS.histogram("ids_stage_seconds", stage="store"),
+        }
+
+        self._thread = threading.Thread(target=self._run, name="store-writer", daemon=True)
+        self._thread.start()
+
+    def _put(self, item: tuple) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            self._metrics["dropped"].inc()
+            return False
+        return True
+
+    def put_flows(self, table: FlowTable, source: str) -> bool:
+        """
+        Queue a finished (no longer mutated) flow table. False if dropped.
+        """
+        return self._put(("flows", table, source))
+
+    def put_alerts(self, alerts: List[Tuple[Dict, float]], source: str) -> bool:
+        """
+        Queue (alert, capture timestamp) pairs. False if dropped.
+        """
+        if not alerts:
+            return True
+        return self._put(("alerts", list(alerts), source))
+
+    def _connection(self, day: int) -> sqlite3.Connection:
+        conn = self._connections.pop(day, None)
+        if conn is None:
+            conn = _open(os.path.join(self.directory, _partition_name(day)))
+            if len(self._connections) >= OPEN_PARTITIONS:
+                self._connections.popitem(last=False)[1].close()
+        self._connections[day] = conn
+        return conn
+
+    def _write(self, item: tuple) -> None:
+        started = time.perf_counter()
+        if item[0] == "flows":
+            _, table, source = item
+            for day, rows in flow_rows(table, source):
+                with self._connection(day) as conn:
+                    conn.executemany(
+                        "INSERT INTO flows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                self._metrics["flows"].inc(len(rows))
+        else:
+            _, alerts, source = item
+            by_day: Dict[int, List[tuple]] = {}
+            for alert, timestamp in alerts:
+                by_day.setdefault(int(timestamp // DAY), []).append(
+                    alert_row(alert, timestamp, source)
+                )
+            for day, rows in by_day.items():
+                with self._connection(day) as conn:
+                    conn.executemany(
+                        "INSERT INTO alerts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                self._metrics["alerts"].inc(len(rows))
+        self._metrics["write"].observe(time.perf_counter() - started)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(item)
+            except sqlite3.Error as e:
+                console.print(f"[WARN] Store write failed: {e}", style="yellow")
+
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            console.print(
+                f"[WARN] {self.dropped} store batch(es) dropped: writer fell behind",
+                style="yellow"
+            )
+
+    def __enter__(self) -> "FlowStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# -----------------------------
+# Queries
+# -----------------------------
+
+def partitions(directory: str, since: float, until: float) -> List[str]:
+    """
+    Partition files that may hold rows in [since, until), oldest first.
+    The day before ``since`` is included for flows that started earlier.
+    """
+    if not os.path.isdir(directory):
+        return []
+
+    first, last = int(since // DAY) - 1, math.ceil(until / DAY) - 1
+    found = []
+    for name in os.listdir(directory):
+        match = _PARTITION.match(name)
+        if not match:
+            continue
+        day = calendar.timegm(time.strptime(match.group(1), "%Y-%m-%d")) // DAY
+        if first <= day <= last:
+            found.append((day, os.path.join(directory, name)))
+    return [path for _, path in sorted(found)]
+
+
+def _query(
+    directory: str,
+    table: str,
+    time_column: str,
+    since: float,
+    until: float,
+    where: List[str],
+    params: List,
+    limit: int,
+    overlap: bool = False
+) -> Tuple[List[Dict], int]:
+    """
+    Run one query over the partitions of [since, until) in time order.
+    Returns (rows, partitions searched).
+    """
+    if overlap:
+        conditions = [f"{time_column} < ?", "end >= ?"]
+    else:
+        conditions = [f"{time_column} >= ?", f"{time_column} < ?"]
+    bounds = [until, since] if overlap else [since, until]
+
+    sql = (
+        f"SELECT * FROM {table} WHERE "
+        + " AND ".join(conditions + where)
+        + f" ORDER BY {time_column} LIMIT ?"
+    )
+
+    rows: List[Dict] = []
+    searched = partitions(directory, since, until)
+    for path in searched:
+        remaining = limit - len(rows) if limit > 0 else -1
+        if remaining == 0:
+            break
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows.extend(
+                dict(row) for row in conn.execute(sql, bounds + params + [remaining])
+            )
+        except sqlite3.OperationalError:
+            pass  # a partition still being created
+        finally:
+            conn.close()
+    return rows, len(searched)
+
+
+def _address_filters(src: Optional[str], dst: Optional[str], ip: Optional[str]):
+    where, params = [], []
+    if src:
+        where.append("src_ip = ?")
+        params.append(src)
+    if dst:
+        where.append("dst_ip = ?")
+        params.append(dst)
+    if ip:
+        where.append("(src_ip = ? OR dst_ip = ?)")
+        params.extend([ip, ip])
+    return where, params
+
+
+def query_flows(
+    since: float,
+    until: float,
+    src: Optional[str] = None,
+    dst: Optional[str] = None,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    protocol: Optional[str] = None,
+    limit: int = 1000,
+    directory: str = DEFAULT_STORE_DIR
+) -> Tuple[List[Dict], int]:
+    """
+    Flows active during [since, until), oldest first.
+    Returns (flows, partitions searched).
+    """
+    where, params = _address_filters(src, dst, ip)
+    if port is not None:
+        where.append("dst_port = ?")
+        params.append(port)
+    if protocol:
+        if protocol.upper() not in PROTOCOL_NUMBERS:
+            raise ValueError(f"Unknown protocol: {protocol}")
+        where.append("protocol = ?")
+        params.append(protocol.upper())
+    return _query(directory, "flows", "start", since, until, where, params, limit, overlap=True)
+
+
+def query_alerts(
+    since: float,
+    until: float,
+    alert_type: Optional[str] = None,
+    src: Optional[str] = None,
+    dst: Optional[str] = None,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    limit: int = 1000,
+    directory: str = DEFAULT_STORE_DIR
+) -> Tuple[List[Dict], int]:
+    """
+    Alerts raised during [since, until), oldest first.
+    Returns (alerts, partitions searched).
+    """
+    where, params = _address_filters(src, dst, ip)
+    if alert_type:
+        where.append("type = ?")
+        params.append(alert_type.upper())
+    if port is not None:
+        where.append("dst_port = ?")
+        params.append(port)
+
+    alerts, searched = _query(directory, "alerts", "time", since, until, where, params, limit)
+    for alert in alerts:
+        alert["details"] = json.loads(alert["details"] or "{}")
+    return alerts, searched
+
+
+# -----------------------------
+# Time expressions
+# -----------------------------
+
+_RELATIVE = re.compile(r"^-?(\d+(?:\.\d+)?)\s*([smhdw])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": DAY, "w": 7 * DAY}
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def parse_time(text: str, now: Optional[float] = None) -> float:
+    """
+    Epoch seconds for a time expression: "now", a duration ago ("90m",
+    "24h", "7d"), "today" / "yesterday" / a weekday ("last tuesday")
+    meaning local midnight of that day, an ISO date or datetime (local
+    time unless it has an offset), or epoch seconds.
+    """
+    now = time.time() if now is None else now
+    value = text.strip().lower()
+
+    if value == "now":
+        return now
+
+    relative = _RELATIVE.match(value)
+    if relative:
+        return now - float(relative.group(1)) * _UNITS[relative.group(2)]
+
+    midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    if value == "today":
+        return midnight.timestamp()
+    if value == "yesterday":
+        return (midnight - timedelta(days=1)).timestamp()
+
+    weekday = value[5:].strip() if value.startswith("last ") else value
+    for index, name in enumerate(_WEEKDAYS):
+        if weekday in (name, name[:3]):
+            # The most recent such day before today
+            back = (midnight.weekday() - index) % 7 or 7
+            return (midnight - timedelta(days=back)).timestamp()
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    try:
+        return datetime.fromisoformat(text.strip()).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Unrecognised time: {text!r} (try 24h, yesterday, tuesday, "
+            f"2024-05-14 or 2024-05-14T09:30)"
+        )
+
+
+def day_range(text: str, now: Optional[float] = None) -> Tuple[float, float]:
+    """
+    [start, end) of the local calendar day a time expression falls on.
+    """
+    day = datetime.fromtimestamp(parse_time(text, now)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return day.timestamp(), (day + timedelta(days=1)).timestamp()
@@ -0,0 +1,366 @@
+import csv
+import inspect
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.ruleengine import RULES, FlowAggregates, Rule
+from core import rules  # noqa: F401  (registers the built-in rules)
+
+
+# =====================================================
+# THRESHOLD SWEEPS (`ids tune`)
+# =====================================================
+#
+# The shared aggregates are built once; every rule's threshold test is
+# then evaluated for a whole block of configs at a time as one broadcast
+# comparison, giving a (configs, groups) mask. Rules are independent, so
+# a sweep over several rules is the cartesian product of the per-rule
+# sweeps, and its alert / true-positive counts are sums of per-rule
+# counts.
+#
+# Labels are known attacks: {"type", "src_ip"[, "dst_ip"][, "dst_port"]}
+# per JSON line (an --alerts-jsonl file works). A group is a true
+# positive when it matches a label on every field its alerts carry;
+# recall is the share of labels matched by at least one alert.
+
+# Most cells in one (configs, groups) mask
+BLOCK_CELLS = 1 << 24
+MAX_CONFIGS = 10_000_000
+
+Grid = Dict[str, Dict[str, np.ndarray]]
+
+
+# -----------------------------
+# Grids
+# -----------------------------
+
+def sweep_params(rule: Rule) -> Dict[str, float]:
+    """
+    Numeric threshold params of a rule's sweep, with their defaults.
+    """
+    return {
+        name: param.default
+        for name, param in list(inspect.signature(rule.sweep).parameters.items())[1:]
+        if isinstance(param.default, (int, float)) and not isinstance(param.default, bool)
+    }
+
+
+def _values(text: str) -> np.ndarray:
+    """
+    "5:50:5" (inclusive) or "100,200,500" -> sorted unique values.
+    """
+    try:
+        if ":" in text:
+            start, stop, step = (float(part) for part in text.split(":"))
+            if step <= 0:
+                raise ValueError
+            values = np.arange(start, stop + step / 2, step)
+        else:
+            values = np.array([float(part) for part in text.split(",")])
+    except ValueError:
+        raise ValueError(f"Bad values: {text!r} (use start:stop:step or a,b,c)")
+    if not len(values):
+        raise ValueError(f"No values in {text!r}")
+    values = np.unique(values)
+    if np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    return values
+
+
+def parse_grid(specs: Sequence[str]) -> Grid:
+    """
+    ["port_threshold=5:50:5", "flood.pps_threshold=100,500"] ->
+    {rule: {param: values}}. Bare param names are looked up in every rule.
+    """
+    grid: Grid = {}
+    for spec in specs:
+        name, sep, text = spec.partition("=")
+        if not sep:
+            raise ValueError(f"Bad sweep: {spec!r} (use param=start:stop:step)")
+
+        rule_name, _, param = name.strip().rpartition(".")
+        owners = [
+            rule.name for rule in RULES.values()
+            if rule.sweep is not None
+            and (not rule_name or rule.name == rule_name)
+            and param in sweep_params(rule)
+        ]
+        if not owners:
+            raise ValueError(f"No rule has a tunable threshold {name.strip()!r}")
+        if len(owners) > 1:
+            raise ValueError(f"{param!r} is ambiguous, use one of: "
+                             + ", ".join(f"{owner}.{param}" for owner in owners))
+        grid.setdefault(owners[0], {})[param] = _values(text)
+    return grid
+
+
+def load_labels(path: str) -> List[Dict]:
+    """
+    Known attacks from a JSON array or JSON-lines file. Roll-ups and other
+    entries without a type and src_ip are skipped.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        entries = json.loads(stripped)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    labels = []
+    for entry in entries:
+        if entry.get("type") in (None, "ROLLUP") or not entry.get("src_ip"):
+            continue
+        labels.append({
+            "type": str(entry["type"]).upper(),
+            "src_ip": str(entry["src_ip"]),
+            "dst_ip": entry.get("dst_ip"),
+            "dst_port": int(entry["dst_port"]) if entry.get("dst_port") is not None else None,
+        })
+    return labels
+
+
+# -----------------------------
+# Sweeps
+# -----------------------------
+
+@dataclass
+class RuleSweep:
+    rule: str
+    params: Dict[str, np.ndarray]
+    alerts: np.ndarray
+    true_positives: np.ndarray
+    labels_found: np.ndarray
+
+
+def _label_matrix(
+    aggregates: FlowAggregates,
+    rule: Rule,
+    labels: List[Dict]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (groups matching any label, bool matrix of those groups x labels).
+    """
+    groups = aggregates[rule.needs[0]]
+    rows = groups["row"]
+    typed = [label for label in labels if label["type"] == rule.alert_type]
+    if not typed or not len(rows):
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(typed)), dtype=bool)
+
+    # One address string per distinct source, then only candidates' details
+    table = aggregates.table
+    src_ids = aggregates.address_ids("src_ip")[rows]
+    unique, first = np.unique(src_ids, return_index=True)
+    wanted = {label["src_ip"] for label in typed}
+    src_text = {
+        int(address_id): table.address_at(int(rows[group]), "src_ip")
+        for address_id, group in zip(unique, first)
+    }
+    candidates = np.flatnonzero([src_text[int(address_id)] in wanted for address_id in src_ids])
+
+    has_dst = "dst_ip" in groups
+    ports = groups.get("dst_port")
+    matrix = np.zeros((len(candidates), len(typed)), dtype=bool)
+    for i, group in enumerate(candidates):
+        src = src_text[int(src_ids[group])]
+        dst = table.address_at(int(rows[group]), "dst_ip") if has_dst else None
+        for j, label in enumerate(typed):
+            matrix[i, j] = (
+                label["src_ip"] == src
+                and (not has_dst or label["dst_ip"] in (None, dst))
+                and (ports is None or label["dst_port"] in (None, int(ports[group])))
+            )
+
+    keep = matrix.any(axis=1)
+    return candidates[keep], matrix[keep]
+
+
+def sweep_rule(
+    aggregates: FlowAggregates,
+    rule: Rule,
+    values: Dict[str, np.ndarray],
+    labels: Optional[List[Dict]] = None
+) -> RuleSweep:
+    """
+    Alert and label counts of ``rule`` for every combination of ``values``;
+    params not swept keep their defaults.
+    """
+    names = list(values)
+    mesh = np.meshgrid(*values.values(), indexing="ij") if names else []
+    params = {name: grid.ravel() for name, grid in zip(names, mesh)}
+    configs = len(params[names[0]]) if names else 1
+
+    size = len(aggregates[rule.needs[0]]["row"])
+    true_groups, matrix = _label_matrix(aggregates, rule, labels or [])
+
+    alerts = np.zeros(configs, dtype=np.int64)
+    true_positives = np.zeros(configs, dtype=np.int64)
+    labels_found = np.zeros(configs, dtype=np.int64)
+
+    block = max(BLOCK_CELLS // max(size, 1), 1)
+    for start in range(0, configs, block):
+        part = slice(start, min(start + block, configs))
+        mask = rule.sweep(
+            aggregates, **{name: column[part, None] for name, column in params.items()}
+        )
+        mask = np.broadcast_to(mask, (part.stop - part.start, size))
+        alerts[part] = mask.sum(axis=1)
+        if len(true_groups):
+            hit = mask[:, true_groups]
+            true_positives[part] = hit.sum(axis=1)
+            labels_found[part] = (hit @ matrix).sum(axis=1)
+
+    return RuleSweep(rule.name, params, alerts, true_positives, labels_found)
+
+
+@dataclass
+class TuneResult:
+    params: Dict[str, np.ndarray]
+    alerts: np.ndarray
+    alerts_by_type: Dict[str, np.ndarray]
+    true_positives: np.ndarray
+    labels_found: np.ndarray
+    labels: int
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    @property
+    def precision(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.alerts > 0, self.true_positives / self.alerts, np.nan)
+
+    @property
+    def recall(self) -> np.ndarray:
+        return self.labels_found / max(self.labels, 1)
+
+    @property
+    def f1(self) -> np.ndarray:
+        precision = np.nan_to_num(self.precision)
+        recall = self.recall
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score = 2 * precision * recall / (precision + recall)
+        return np.nan_to_num(score)
+
+    def ranking(self) -> np.ndarray:
+        """
+        Config indexes, best first: by F1 with labels, else in grid order.
+        """
+        if not self.labels:
+            return np.arange(len(self))
+        return np.lexsort((self.alerts, -self.f1))
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        One array per output column, each with a value per config.
+        """
+        columns = dict(self.params)
+        columns["alerts"] = self.alerts
+        columns.update(self.alerts_by_type)
+        if self.labels:
+            columns["true_positives"] = self.true_positives
+            columns["precision"] = self.precision
+            columns["recall"] = self.recall
+            columns["f1"] = self.f1
+        return columns
+
+    def headings(self) -> List[str]:
+        """
+        Column names for display: params drop their rule prefix unless
+        another swept rule has a param of the same name.
+        """
+        names = list(self.columns())
+        short = [name.rpartition(".")[2] for name in names]
+        counts = Counter(short)
+        return [brief if counts[brief] == 1 else name for name, brief in zip(names, short)]
+
+    def rows(self, indexes: Sequence[int]) -> List[Dict]:
+        columns = self.columns()
+        return [
+            {name: values[index].item() for name, values in columns.items()}
+            for index in indexes
+        ]
+
+    def write_csv(self, path: str) -> None:
+        columns = self.columns()
+        order = self.ranking()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*(values[order].tolist() for values in columns.values())))
+
+
+def tune(
+    aggregates: FlowAggregates,
+    grid: Grid,
+    labels: Optional[List[Dict]] = None,
+    rule_names: Optional[Sequence[str]] = None
+) -> TuneResult:
+    """
+    Evaluate every combination of the ``grid`` thresholds over the rules
+    in ``rule_names`` (default: every rule with a sweep).
+    """
+    names = list(rule_names or [name for name, rule in RULES.items() if rule.sweep])
+    for name in grid:
+        if name not in names:
+            raise ValueError(f"Thresholds given for {name}, which is not being run")
+    missing = [name for name in names if RULES[name].sweep is None]
+    if missing:
+        raise ValueError(f"Rules without a sweep: {', '.join(missing)}")
+
+    total = int(np.prod([
+        np.prod([len(values) for values in grid.get(name, {}).values()])
+        for name in names
+    ]))
+    if total > MAX_CONFIGS:
+        raise ValueError(f"{total:,} configs is more than {MAX_CONFIGS:,}; coarsen the grid")
+
+    labels = labels or []
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    for name in dict.fromkeys(RULES[name].needs[0] for name in names):
+        aggregates[name]
+    timings["aggregate"] = time.perf_counter() - started
+
+    sweeps = []
+    for name in names:
+        started = time.perf_counter()
+        sweeps.append(sweep_rule(aggregates, RULES[name], grid.get(name, {}), labels))
+        timings[name] = time.perf_counter() - started
+
+    # Config i of the product picks entry index[k][i] of rule k's sweep
+    index = [
+        part.ravel()
+        for part in np.meshgrid(*[np.arange(len(s.alerts)) for s in sweeps], indexing="ij")
+    ]
+
+    params: Dict[str, np.ndarray] = {}
+    alerts_by_type: Dict[str, np.ndarray] = {}
+    alerts = np.zeros(total, dtype=np.int64)
+    true_positives = np.zeros(total, dtype=np.int64)
+    labels_found = np.zeros(total, dtype=np.int64)
+    for picks, sweep in zip(index, sweeps):
+        for param, values in sweep.params.items():
+            params[f"{sweep.rule}.{param}"] = values[picks]
+        counts = sweep.alerts[picks]
+        alert_type = RULES[sweep.rule].alert_type
+        alerts_by_type[alert_type] = alerts_by_type.get(alert_type, 0) + counts
+        alerts += counts
+        true_positives += sweep.true_positives[picks]
+        labels_found += sweep.labels_found[picks]
+
+    return TuneResult(
+        params=params,
+        alerts=alerts,
+        alerts_by_type=alerts_by_type,
+        true_positives=true_positives,
+        labels_found=labels_found,
+        labels=len(labels),
+        timings=timings,
+    )
@@ -1,11 +1,24 @@
+import json
+import math
 import os
+import time
+from typing import List, Optional
 import typer
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
 
-from core.capture import capture_traffic
-from core.engine import run_detection, run_live
-from ui.console import print_header, print_alert
+from core.alerts import DEFAULT_RATE, AlertDispatcher, build_sinks
+from core.capture import build_capture_filter, capture_traffic
+from core.anomaly import DEFAULT_MAX_ALERTS, DEFAULT_MODEL_PATH, train_model
+from core.engine import load_flows, run_detection, run_live
+from core.features import CHUNK_SIZE, FEATURE_NAMES, save_features, stream_features
+from core.flows import expand_inputs
+from core.ruledefs import DECLARED, load_rule_file
+from core.ruleengine import RULES, FlowAggregates
+from core.store import day_range, parse_time, query_alerts, query_flows
+from core.tuning import load_labels, parse_grid, tune as tune_thresholds
+from ui.console import print_alert, print_header
 
 app = typer.Typer(
     help="User-Friendly Intrusion Detection System (CLI-based)"
@@ -17,6 +30,21 @@ console = Console()
 # CAPTURE COMMAND
 # =====================================================
 
+def parse_rules(rules: Optional[str]) -> Optional[List[str]]:
+    if rules is None:
+        return None
+    return [name.strip() for name in rules.split(",") if name.strip()]
+
+
+def load_rule_files(paths: List[str]) -> None:
+    try:
+        for path in paths:
+            load_rule_file(path)
+    except (OSError, ValueError) as e:
+        console.print(Panel(str(e), title="Rule Error", style="red"))
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def capture(
     iface: str = typer.Option(..., help="Network interface name or number"),
@@ -24,12 +52,32 @@ def capture(
     duration: int = typer.Option(
         0, help="Capture duration in seconds (0 = until stopped)"
     ),
+    rules: Optional[str] = typer.Option(
+        None, help="Comma-separated rules the capture is for (default: all)"
+    ),
+    include: List[str] = typer.Option(
+        [], help="Only capture traffic matching this BPF expression (repeatable)"
+    ),
+    exclude: List[str] = typer.Option(
+        [], help="Never capture traffic matching this BPF expression (repeatable)"
+    ),
+    rule_filter: bool = typer.Option(
+        True, "--rule-filter/--no-rule-filter",
+        help="Capture only traffic the rules can use"
+    ),
+    rule_file: List[str] = typer.Option(
+        [], help="Also load declarative rules from this TOML / YAML file (repeatable)"
+    ),
 ):
     """
     Capture network traffic and save it to a PCAP file.
     """
+    load_rule_files(rule_file)
     try:
-        capture_traffic(iface, output, duration)
+        capture_filter = build_capture_filter(
+            parse_rules(rules), include=include, exclude=exclude, derive=rule_filter
+        )
+        capture_traffic(iface, output, duration, capture_filter)
     except Exception as e:
         console.print(
             Panel(str(e), title="Capture Failed", style="red")
@@ -42,28 +90,89 @@ def capture(
 
 @app.command()
 def detect(
-    pcap: str = typer.Argument(..., help="PCAP file to analyze"),
+    pcap: str = typer.Argument(
+        ..., help="PCAP file, directory of captures, or quoted glob to analyze"
+    ),
     debug: bool = typer.Option(
         False, help="Enable debug output (advanced users)"
     ),
+    workers: int = typer.Option(
+        1, help="Worker processes used to parse a single PCAP"
+    ),
+    jobs: int = typer.Option(
+        1, help="Captures parsed at a time when given a directory or glob"
+    ),
+    max_flows: Optional[int] = typer.Option(
+        None, help="Cap on flows kept per worker (oldest are rolled up; changes src_port features)"
+    ),
+    idle_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows idle for this many seconds"
+    ),
+    active_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows active for longer than this many seconds"
+    ),
+    sketch: bool = typer.Option(
+        False, help="Use fixed-memory sketches instead of exact flows"
+    ),
+    model: Optional[str] = typer.Option(
+        None, help="Trained anomaly model (from `ids train`) to score flows"
+    ),
+    max_anomaly_alerts: int = typer.Option(
+        DEFAULT_MAX_ALERTS, help="Most ANOMALY alerts reported per run, highest score first (0 = all)"
+    ),
+    cache: bool = typer.Option(
+        True, "--cache/--no-cache", help="Reuse flows parsed by earlier runs"
+    ),
+    alerts_jsonl: Optional[str] = typer.Option(
+        None, help="Also append every alert to this JSONL file"
+    ),
+    syslog_port: Optional[int] = typer.Option(
+        None, help="Also send alerts to syslog on 127.0.0.1 at this UDP port"
+    ),
+    alert_rate: float = typer.Option(
+        DEFAULT_RATE, help="Console / syslog alerts per second per type (0 = unlimited)"
+    ),
+    store: bool = typer.Option(
+        False, "--store/--no-store", help="Append flows and alerts to the store (IDS_STORE_DIR)"
+    ),
+    rule_file: List[str] = typer.Option(
+        [], help="Also load declarative rules from this TOML / YAML file (repeatable)"
+    ),
 ):
     """
-    Analyze a PCAP file for possible intrusions.
+    Analyze a PCAP file, or a set of rotated captures, for possible
+    intrusions.
     """
-    if not os.path.exists(pcap):
+    load_rule_files(rule_file)
+    if not expand_inputs(pcap):
         console.print(
             Panel(
-                f"PCAP file not found:\n{pcap}",
+                f"No PCAP files found:\n{pcap}",
                 title="Input Error",
                 style="red"
             )
         )
         raise typer.Exit(code=1)
 
-    print_header()
+    print_header(
+        engine="Rules + Anomaly Model" if model else "Rule-Based Detection"
+    )
 
     try:
-        alerts = run_detection(pcap, debug=debug)
+        alerts = run_detection(
+            pcap,
+            debug=debug,
+            workers=workers,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout,
+            active_timeout=active_timeout,
+            sketch=sketch,
+            model_path=model,
+            max_anomaly_alerts=max_anomaly_alerts,
+            use_cache=cache,
+            jobs=jobs,
+            store=store
+        )
     except Exception as e:
         console.print(
             Panel(str(e), title="Analysis Failed", style="red")
@@ -74,8 +183,10 @@ def detect(
         console.print("\n✅ No threats detected", style="bold green")
         return
 
-    for alert in alerts:
-        print_alert(alert)
+    sinks = build_sinks(jsonl_path=alerts_jsonl, syslog_port=syslog_port)
+    with AlertDispatcher(sinks, rate=alert_rate) as dispatcher:
+        for alert in alerts:
+            dispatcher.submit(alert)
 
 
 # =====================================================
@@ -84,22 +195,90 @@ def detect(
 
 @app.command()
 def live(
-    iface: str = typer.Option(..., help="Network interface name or number"),
+    iface: List[str] = typer.Option(
+        ..., help="Network interface name or number (repeat, or comma-separate, for several)"
+    ),
     window: int = typer.Option(
         5, help="Capture window size in seconds"
     ),
+    horizon: float = typer.Option(
+        600.0, help="How far back detectors remember traffic, in seconds"
+    ),
+    max_flows: Optional[int] = typer.Option(
+        None, help="Cap on flows held per window (oldest are evicted)"
+    ),
+    idle_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows idle for this many seconds"
+    ),
+    sketch: bool = typer.Option(
+        False, help="Use fixed-memory sketch detectors"
+    ),
+    model: Optional[str] = typer.Option(
+        None, help="Trained anomaly model (from `ids train`) to score flows"
+    ),
+    budget_ms: float = typer.Option(
+        50.0, help="Anomaly scoring time budget per window, in milliseconds"
+    ),
+    max_anomaly_alerts: int = typer.Option(
+        DEFAULT_MAX_ALERTS, help="Most ANOMALY alerts reported per window, highest score first (0 = all)"
+    ),
+    metrics_port: Optional[int] = typer.Option(
+        None, help="Serve Prometheus metrics on this local port (/metrics)"
+    ),
+    metrics_json: Optional[str] = typer.Option(
+        None, help="Rewrite a JSON metrics snapshot to this file every window"
+    ),
+    alerts_jsonl: Optional[str] = typer.Option(
+        None, help="Also append every alert to this JSONL file"
+    ),
+    syslog_port: Optional[int] = typer.Option(
+        None, help="Also send alerts to syslog on 127.0.0.1 at this UDP port"
+    ),
+    alert_rate: float = typer.Option(
+        DEFAULT_RATE, help="Console / syslog alerts per second per type (0 = unlimited)"
+    ),
+    dedup_ttl: float = typer.Option(
+        3600.0, help="Report a repeated alert again after this many quiet seconds"
+    ),
+    dedup_max: int = typer.Option(
+        100_000, help="Most alert keys remembered for deduplication"
+    ),
+    dedup_state: Optional[str] = typer.Option(
+        None, help="File keeping deduplication state across restarts"
+    ),
+    ws_port: Optional[int] = typer.Option(
+        None, help="Publish flow rates and alerts over WebSocket on this local port (frontend: 8181)"
+    ),
+    rules: Optional[str] = typer.Option(
+        None, help="Comma-separated rules to run: port_scan, bruteforce, flood (default: all)"
+    ),
+    include: List[str] = typer.Option(
+        [], help="Only capture traffic matching this BPF expression (repeatable)"
+    ),
+    exclude: List[str] = typer.Option(
+        [], help="Never capture traffic matching this BPF expression (repeatable)"
+    ),
+    rule_filter: bool = typer.Option(
+        True, "--rule-filter/--no-rule-filter",
+        help="Capture only traffic the enabled rules can use"
+    ),
+    store: bool = typer.Option(
+        False, "--store/--no-store", help="Append flows and alerts to the store (IDS_STORE_DIR)"
+    ),
     debug: bool = typer.Option(
         False, help="Enable debug output"
     ),
 ):
     """
-    Run LIVE intrusion detection (window-based).
+    Run LIVE intrusion detection (streaming, sliding-window rules).
     """
+    interfaces = [name.strip() for value in iface for name in value.split(",") if name.strip()]
     console.print(
         Panel(
             f"Starting LIVE IDS\n\n"
-            f"Interface : {iface}\n"
-            f"Window    : {window} seconds\n\n"
+            f"Interface : {', '.join(interfaces)}\n"
+            f"Window    : {window} seconds\n"
+            f"Horizon   : {horizon:g} seconds\n\n"
             f"Press Ctrl+C to stop",
             title="Live IDS",
             style="cyan"
@@ -107,7 +286,32 @@ def live(
     )
 
     try:
-        run_live(iface, window=window, debug=debug)
+        run_live(
+            interfaces,
+            window=window,
+            debug=debug,
+            horizon=horizon,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout,
+            sketch=sketch,
+            model_path=model,
+            budget_ms=budget_ms,
+            max_anomaly_alerts=max_anomaly_alerts,
+            metrics_port=metrics_port,
+            metrics_json=metrics_json,
+            alerts_jsonl=alerts_jsonl,
+            syslog_port=syslog_port,
+            alert_rate=alert_rate,
+            dedup_ttl=dedup_ttl,
+            dedup_max=dedup_max,
+            dedup_state=dedup_state,
+            ws_port=ws_port,
+            rule_names=parse_rules(rules),
+            include=include,
+            exclude=exclude,
+            rule_filter=rule_filter,
+            store=store
+        )
     except Exception as e:
         console.print(
             Panel(str(e), title="Live IDS Failed", style="red")
@@ -115,25 +319,490 @@ def live(
 
 
 # =====================================================
-# TRAIN PLACEHOLDER
+# FEATURE EXPORT COMMAND
+# =====================================================
+
+@app.command()
+def features(
+    pcap: str = typer.Argument(..., help="PCAP file to extract features from"),
+    output: str = typer.Option("features.npy", help="Output .npy file"),
+    chunk_size: int = typer.Option(
+        CHUNK_SIZE, help="Flows processed per chunk"
+    ),
+):
+    """
+    Write per-flow feature vectors to a .npy file for offline training.
+    """
+    if not os.path.exists(pcap):
+        console.print(
+            Panel(
+                f"PCAP file not found:\n{pcap}",
+                title="Input Error",
+                style="red"
+            )
+        )
+        raise typer.Exit(code=1)
+
+    try:
+        matrix = save_features(stream_features(pcap, chunk_size), output)
+    except Exception as e:
+        console.print(
+            Panel(str(e), title="Feature Export Failed", style="red")
+        )
+        raise typer.Exit(code=1)
+
+    console.print(
+        f"[INFO] Wrote {matrix.shape[0]} x {matrix.shape[1]} features "
+        f"({', '.join(FEATURE_NAMES)}) to {output}",
+        style="green"
+    )
+
+
+# =====================================================
+# TRAIN COMMAND
 # =====================================================
 
 @app.command()
 def train(
     pcap: str = typer.Argument(..., help="PCAP file containing normal traffic"),
+    output: str = typer.Option(DEFAULT_MODEL_PATH, help="Output model file"),
+    chunk_size: int = typer.Option(
+        CHUNK_SIZE, help="Flows per training mini-batch"
+    ),
+    quantile: float = typer.Option(
+        0.999, help="Share of baseline flows scored as normal"
+    ),
+    max_flows: Optional[int] = typer.Option(
+        None, help="Cap the training flow table (saved with the model, applied by detect)"
+    ),
+    idle_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows idle for this many seconds (saved with the model)"
+    ),
+    active_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows active for longer than this many seconds (saved with the model)"
+    ),
 ):
     """
-    Train anomaly detection model (not implemented yet).
+    Train the anomaly detection model on a baseline capture.
     """
+    if not os.path.exists(pcap):
+        console.print(
+            Panel(
+                f"PCAP file not found:\n{pcap}",
+                title="Input Error",
+                style="red"
+            )
+        )
+        raise typer.Exit(code=1)
+
+    try:
+        report = train_model(
+            pcap,
+            output=output,
+            chunk_size=chunk_size,
+            quantile=quantile,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout,
+            active_timeout=active_timeout
+        )
+    except Exception as e:
+        console.print(
+            Panel(str(e), title="Training Failed", style="red")
+        )
+        raise typer.Exit(code=1)
+
+    peak = (
+        f"{report.peak_memory_mb:.1f} MB"
+        if report.peak_memory_mb is not None else "n/a"
+    )
     console.print(
         Panel(
-            "Training is not implemented yet.\n\n"
-            "Current version supports rule-based detection only.",
-            title="Not Implemented",
-            style="yellow"
+            f"Flows     : {report.flows}\n"
+            f"Time      : {report.seconds:.2f} s\n"
+            f"Peak RSS  : {peak}\n"
+            f"Threshold : {report.threshold:.3f}\n"
+            f"Model     : {report.model_path} ({report.model_bytes} bytes)",
+            title="Training Complete",
+            style="green"
         )
     )
 
 
+# =====================================================
+# DAEMON MODE
+# =====================================================
+
+@app.command()
+def serve(
+    socket_path: Optional[str] = typer.Option(
+        None, "--socket", help="Unix socket to listen on (default: $IDS_SOCKET or a per-user path)"
+    ),
+    workers: int = typer.Option(
+        2, help="Analysis jobs run at the same time"
+    ),
+    model: Optional[str] = typer.Option(
+        None, help="Anomaly model kept loaded for every job"
+    ),
+    iface: Optional[str] = typer.Option(
+        None, help="Also capture live on this interface and keep its alerts"
+    ),
+    window: int = typer.Option(
+        5, help="Live window size in seconds (with --iface)"
+    ),
+):
+    """
+    Run a warm daemon that accepts analysis jobs over a Unix socket.
+    """
+    from core.client import DaemonError, require_unix_sockets
+
+    try:
+        require_unix_sockets()
+    except DaemonError as e:
+        console.print(Panel(str(e), title="Daemon Unavailable", style="red"))
+        raise typer.Exit(code=1)
+
+    from core.daemon import serve as run_daemon
+
+    try:
+        run_daemon(
+            socket_path,
+            workers=workers,
+            model_path=model,
+            iface=iface,
+            window=window
+        )
+    except Exception as e:
+        console.print(
+            Panel(str(e), title="Daemon Failed", style="red")
+        )
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def client(
+    op: str = typer.Argument(..., help="analyze | alerts | status"),
+    pcap: Optional[str] = typer.Argument(None, help="PCAP to analyze (analyze only)"),
+    socket_path: Optional[str] = typer.Option(
+        None, "--socket", help="Daemon socket (default: $IDS_SOCKET or a per-user path)"
+    ),
+    sketch: bool = typer.Option(
+        False, help="Use fixed-memory sketches instead of exact flows"
+    ),
+    model: Optional[str] = typer.Option(
+        None, help="Anomaly model to use instead of the daemon's"
+    ),
+    since: float = typer.Option(
+        0.0, help="Only alerts received after this Unix time (alerts only)"
+    ),
+    limit: int = typer.Option(
+        100, help="Most recent alerts to return (alerts only)"
+    ),
+    json_output: bool = typer.Option(
+        False, "--json", help="Print the raw JSON reply"
+    ),
+):
+    """
+    Send a job to a running `ids serve` daemon.
+    """
+    from core.client import DaemonError, request
+
+    params = {}
+    if op == "analyze":
+        if not pcap:
+            console.print(
+                Panel("analyze needs a PCAP path", title="Input Error", style="red")
+            )
+            raise typer.Exit(code=1)
+        # The daemon resolves paths from its own working directory
+        params = {
+            "pcap": os.path.abspath(pcap),
+            "sketch": sketch,
+            "model": os.path.abspath(model) if model else None,
+        }
+    elif op == "alerts":
+        params = {"since": since, "limit": limit}
+
+    try:
+        reply = request(op, socket_path, **params)
+    except DaemonError as e:
+        console.print(Panel(str(e), title="Daemon Error", style="red"))
+        raise typer.Exit(code=1)
+
+    if json_output:
+        print(json.dumps(reply, indent=2, default=str))
+        return
+
+    if op == "status":
+        console.print(
+            Panel(
+                "\n".join(f"{key:<12}: {value}" for key, value in reply.items() if key != "ok"),
+                title="IDS Daemon",
+                style="cyan"
+            )
+        )
+        return
+
+    alerts = reply.get("alerts", [])
+    if op == "analyze":
+        console.print(
+            f"[INFO] {reply['pcap']} analyzed in {reply['seconds'] * 1000:.0f} ms",
+            style="cyan"
+        )
+    if not alerts:
+        console.print("\n✅ No threats detected", style="bold green")
+    for alert in alerts:
+        print_alert(alert)
+
+
+# =====================================================
+# STORE QUERY COMMAND
+# =====================================================
+
+@app.command()
+def query(
+    what: str = typer.Argument(..., help="flows | alerts"),
+    since: str = typer.Option(
+        "24h", help="Start: 24h, 7d, yesterday, tuesday, 2024-05-14, epoch seconds"
+    ),
+    until: str = typer.Option("now", help="End, in the same forms as --since"),
+    day: Optional[str] = typer.Option(
+        None, help="A whole local day instead of --since/--until (e.g. 'last tuesday')"
+    ),
+    src: Optional[str] = typer.Option(None, help="Source IP"),
+    dst: Optional[str] = typer.Option(None, help="Destination IP"),
+    ip: Optional[str] = typer.Option(None, help="Source or destination IP"),
+    port: Optional[int] = typer.Option(None, help="Destination port"),
+    protocol: Optional[str] = typer.Option(None, help="TCP, UDP or ICMP (flows only)"),
+    alert_type: Optional[str] = typer.Option(
+        None, "--type", help="Alert type, e.g. PORT_SCAN (alerts only)"
+    ),
+    limit: int = typer.Option(100, help="Most rows to return, oldest first (0 = all)"),
+    json_output: bool = typer.Option(
+        False, "--json", help="Print rows as JSON lines"
+    ),
+):
+    """
+    Search flows and alerts recorded with --store.
+    """
+    started = time.perf_counter()
+    try:
+        if what not in ("flows", "alerts"):
+            raise ValueError(f"Unknown record type: {what} (use flows or alerts)")
+        if day:
+            start, end = day_range(day)
+        else:
+            start, end = parse_time(since), parse_time(until)
+
+        if what == "flows":
+            rows, searched = query_flows(
+                start, end, src=src, dst=dst, ip=ip, port=port,
+                protocol=protocol, limit=limit
+            )
+        else:
+            rows, searched = query_alerts(
+                start, end, alert_type=alert_type, src=src, dst=dst, ip=ip,
+                port=port, limit=limit
+            )
+    except ValueError as e:
+        console.print(Panel(str(e), title="Input Error", style="red"))
+        raise typer.Exit(code=1)
+    seconds = time.perf_counter() - started
+
+    if json_output:
+        for row in rows:
+            print(json.dumps(row, default=str))
+        return
+
+    def stamp(value: float) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+
+    if what == "flows":
+        table = Table(title=f"Flows {stamp(start)} → {stamp(end)}")
+        for column in ("Start", "Duration", "Source", "Destination", "Proto", "Packets", "Bytes"):
+            table.add_column(column)
+        for row in rows:
+            table.add_row(
+                stamp(row["start"]),
+                f"{row['end'] - row['start']:.1f}s",
+                f"{row['src_ip']}:{row['src_port']}",
+                f"{row['dst_ip']}:{row['dst_port']}",
+                row["protocol"],
+                str(row["packets"]),
+                str(row["bytes"]),
+            )
+    else:
+        table = Table(title=f"Alerts {stamp(start)} → {stamp(end)}")
+        for column in ("Time", "Type", "Severity", "Source", "Destination", "Port", "From"):
+            table.add_column(column)
+        for row in rows:
+            table.add_row(
+                stamp(row["time"]),
+                row["type"],
+                row["severity"] or "-",
+                row["src_ip"] or "-",
+                row["dst_ip"] or "-",
+                str(row["dst_port"]) if row["dst_port"] is not None else "-",
+                row["source"] or "-",
+            )
+
+    if rows:
+        console.print(table)
+    console.print(
+        f"[INFO] {len(rows)} {what} in {seconds * 1000:.1f} ms "
+        f"({searched} partition(s) searched)",
+        style="cyan"
+    )
+
+
+# =====================================================
+# RULES COMMAND
+# =====================================================
+
+@app.command("rules")
+def list_rules(
+    rule_file: List[str] = typer.Argument(
+        None, help="Declarative rule files (TOML / YAML) to check and list"
+    ),
+):
+    """
+    List the detection rules, after compiling any given rule files.
+    """
+    load_rule_files(rule_file or [])
+
+    table = Table(title=f"{len(RULES)} detection rules")
+    for column in ("Rule", "Alert", "Group by", "Where", "When", "Params"):
+        table.add_column(column)
+    for name, rule in RULES.items():
+        declared = DECLARED.get(name)
+        if declared is None:
+            table.add_row(name, rule.alert_type or "-", "-", "-", rule.description, "-")
+            continue
+        filters = declared.row_filters + declared.group_filters
+        table.add_row(
+            name,
+            f"{declared.alert_type} ({declared.severity})",
+            ", ".join(declared.group_by),
+            "\n".join(str(condition) for condition in filters) or "-",
+            "\n".join(
+                f"{condition} ({declared.expressions[condition.column]})"
+                for condition in declared.when
+            ) or "-",
+            "\n".join(f"{param} = {value}" for param, value in declared.params.items()) or "-",
+        )
+    console.print(table)
+
+
+# =====================================================
+# THRESHOLD TUNING COMMAND
+# =====================================================
+
+@app.command()
+def tune(
+    pcap: str = typer.Argument(
+        ..., help="PCAP file, directory of captures, or quoted glob to sweep over"
+    ),
+    sweep: List[str] = typer.Option(
+        [], help="Threshold values, e.g. port_threshold=5:50:5 or flood.pps_threshold=100,500 (repeatable)"
+    ),
+    labels: Optional[str] = typer.Option(
+        None, help="JSONL of known attacks (type, src_ip[, dst_ip, dst_port]) for precision / recall"
+    ),
+    rules: Optional[str] = typer.Option(
+        None, help="Comma-separated rules to evaluate (default: all)"
+    ),
+    rule_file: List[str] = typer.Option(
+        [], help="Also load declarative rules from this TOML / YAML file (repeatable)"
+    ),
+    top: int = typer.Option(20, help="Configs to show (best F1 first with --labels)"),
+    csv_path: Optional[str] = typer.Option(
+        None, "--csv", help="Write every config's results to this CSV file"
+    ),
+    workers: int = typer.Option(
+        1, help="Worker processes used to parse a single PCAP"
+    ),
+    jobs: int = typer.Option(
+        1, help="Captures parsed at a time when given a directory or glob"
+    ),
+    max_flows: Optional[int] = typer.Option(
+        None, help="Cap on flows kept per worker (oldest are rolled up; changes src_port features)"
+    ),
+    idle_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows idle for this many seconds"
+    ),
+    active_timeout: Optional[float] = typer.Option(
+        None, help="Expire flows active for longer than this many seconds"
+    ),
+    cache: bool = typer.Option(
+        True, "--cache/--no-cache", help="Reuse flows parsed by earlier runs"
+    ),
+):
+    """
+    Sweep rule thresholds over a capture, parsing and grouping it once.
+    """
+    load_rule_files(rule_file)
+    pcap_files = expand_inputs(pcap)
+    try:
+        if not pcap_files:
+            raise ValueError(f"No PCAP files found:\n{pcap}")
+        grid = parse_grid(sweep)
+        known = load_labels(labels) if labels else []
+        rule_names = parse_rules(rules)
+    except (OSError, ValueError) as e:
+        console.print(Panel(str(e), title="Input Error", style="red"))
+        raise typer.Exit(code=1)
+
+    try:
+        flows = load_flows(
+            pcap_files,
+            workers=workers,
+            max_flows=max_flows,
+            idle_timeout=idle_timeout,
+            active_timeout=active_timeout,
+            use_cache=cache,
+            jobs=jobs
+        )
+        aggregates = FlowAggregates(flows)
+        current = tune_thresholds(aggregates, {}, known, rule_names)
+        result = tune_thresholds(aggregates, grid, known, rule_names)
+    except Exception as e:
+        console.print(Panel(str(e), title="Tuning Failed", style="red"))
+        raise typer.Exit(code=1)
+
+    def cell(value) -> str:
+        if isinstance(value, float):
+            return "-" if math.isnan(value) else f"{value:.3g}"
+        return str(value)
+
+    summary = f"[INFO] Current thresholds: {int(current.alerts[0])} alert(s)"
+    if known:
+        row = current.rows([0])[0]
+        summary += f", precision {cell(row['precision'])}, recall {cell(row['recall'])}"
+    console.print(summary, style="cyan")
+
+    table = Table(title=f"{len(result):,} threshold configs")
+    order = result.ranking()[:top] if top > 0 else result.ranking()
+    # The CSV keeps every param's rule prefix
+    for heading in result.headings():
+        table.add_column(heading, justify="right")
+    for row in result.rows(order):
+        table.add_row(*(cell(value) for value in row.values()))
+    console.print(table)
+
+    if csv_path:
+        result.write_csv(csv_path)
+        console.print(f"[INFO] Wrote {len(result):,} configs to {csv_path}", style="cyan")
+
+    # The first evaluation built the shared aggregates
+    sweep_seconds = sum(
+        seconds for name, seconds in result.timings.items() if name != "aggregate"
+    )
+    console.print(
+        f"[INFO] {len(flows):,} flows, {len(result):,} configs: aggregates "
+        f"{current.timings['aggregate']:.2f}s, sweep {sweep_seconds:.2f}s "
+        f"({len(result) / max(sweep_seconds, 1e-9):,.0f} configs/s)",
+        style="cyan"
+    )
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The package is run from the "Basic Structure" directory (see ids.py)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.synthetic import generate_capture  # noqa: E402
+
+# Large enough for every injected attack to alert, small enough to parse fast
+SYNTHETIC_PACKETS = 20_000
+
+
+@pytest.fixture(scope="session")
+def synthetic_pcap(tmp_path_factory) -> str:
+    """
+    Deterministic capture with two port scans, two brute forces and a flood.
+    """
+    path = tmp_path_factory.mktemp("pcap") / "synthetic.pcap"
+    return generate_capture(str(path), SYNTHETIC_PACKETS, seed=0)
+
+
+@pytest.fixture(scope="session")
+def synthetic_flows(synthetic_pcap):
+    from core.flows import generate_flows
+
+    return generate_flows(synthetic_pcap, backend="native")
@@ -0,0 +1,123 @@
+"""
+Alert delivery: per-type rate limiting, roll-ups of what it suppressed,
+and the dispatcher's sinks.
+"""
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+from core.alerts import AlertDispatcher, AlertSink, JsonlSink, RateLimiter
+
+
+class RecordingSink(AlertSink):
+    def __init__(self, rate_limited: bool = True):
+        self.rate_limited = rate_limited
+        self.alerts = []
+        self.rollups = []
+
+    def write(self, alerts, rollups):
+        self.alerts.extend(alerts)
+        self.rollups.extend(rollups)
+
+
+def _burst():
+    return (
+        [{"type": "PORT_SCAN", "src_ip": f"10.0.0.{i % 2}", "n": i} for i in range(100)]
+        + [{"type": "FLOOD", "src_ip": "10.0.0.9", "n": i} for i in range(20)]
+    )
+
+
+def _suppressed(rollups) -> Counter:
+    totals = Counter()
+    for rollup in rollups:
+        totals[rollup["alert_type"]] += rollup["suppressed"]
+    return totals
+
+
+# -----------------------------
+# Rate limiter
+# -----------------------------
+
+def test_burst_is_limited_per_type_and_rolled_up_per_source():
+    limiter = RateLimiter(rate=5)
+    passed = Counter(alert["type"] for alert in _burst() if limiter.allow(alert, now=100.0))
+    assert passed == {"PORT_SCAN": 10, "FLOOD": 10}  # burst is twice the rate
+
+    rollups = limiter.drain()
+    assert {(r["alert_type"], r["src_ip"]): r["suppressed"] for r in rollups} == {
+        ("PORT_SCAN", "10.0.0.0"): 45,
+        ("PORT_SCAN", "10.0.0.1"): 45,
+        ("FLOOD", "10.0.0.9"): 10,
+    }
+    assert limiter.drain() == []
+
+    # Tokens refill at ``rate`` per second
+    alert = {"type": "FLOOD", "src_ip": "10.0.0.9"}
+    assert sum(limiter.allow(alert, now=101.0) for _ in range(10)) == 5
+
+
+def test_per_type_rates_and_unlimited_types():
+    limiter = RateLimiter(rate=5, rates={"FLOOD": 0, "PORT_SCAN": 1})
+    passed = Counter(alert["type"] for alert in _burst() if limiter.allow(alert, now=0.0))
+    assert passed == {"PORT_SCAN": 2, "FLOOD": 20}
+    assert _suppressed(limiter.drain()) == {"PORT_SCAN": 98}
+
+
+# -----------------------------
+# Dispatcher
+# -----------------------------
+
+def test_dispatcher_delivers_a_burst(tmp_path):
+    limited, complete = RecordingSink(), RecordingSink(rate_limited=False)
+    path = tmp_path / "alerts.jsonl"
+    alerts = _burst()
+
+    with AlertDispatcher([limited, complete, JsonlSink(str(path))], rate=5, rollup_interval=60) as dispatcher:
+        for alert in alerts:
+            assert dispatcher.submit(alert)
+
+    # Rate-limited sinks see each type's burst, plus whatever refilled
+    # while the batch was delivered; the rest is rolled up on close
+    delivered = Counter(alert["type"] for alert in limited.alerts)
+    suppressed = _suppressed(limited.rollups)
+    assert delivered + suppressed == {"PORT_SCAN": 100, "FLOOD": 20}
+    assert 10 <= delivered["PORT_SCAN"] < 20
+    assert 10 <= delivered["FLOOD"] < 20
+
+    # The others get every alert, in order, and the same roll-ups
+    assert complete.alerts == alerts
+    assert complete.rollups == limited.rollups
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["n"] for record in records if record["type"] != "ROLLUP"] == [alert["n"] for alert in alerts]
+    assert len([record for record in records if record["type"] == "ROLLUP"]) == len(limited.rollups)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    class Stuck(RecordingSink):
+        def __init__(self):
+            super().__init__()
+            self.release = threading.Event()
+
+        def write(self, alerts, rollups):
+            self.release.wait()
+            super().write(alerts, rollups)
+
+    sink = Stuck()
+    dispatcher = AlertDispatcher([sink], rate=0, batch_size=1, max_queue=5)
+    results = [dispatcher.submit({"type": "FLOOD", "n": i}) for i in range(50)]
+    sink.release.set()
+    dispatcher.close()
+
+    assert results.count(False) == dispatcher.dropped > 0
+    assert len(sink.alerts) == results.count(True)
+
+
+def test_sink_without_write_cannot_be_built():
+    class Incomplete(AlertSink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,51 @@
+"""
+Anomaly scoring: the alert cap and the anomalies it suppresses, and the
+flow limits shared by training and scoring.
+"""
+import pytest
+
+from core import engine
+from core.anomaly import AnomalyModel, AnomalyScorer, load_model, train_model
+from core.flows import generate_flows
+
+
+@pytest.fixture(scope="module")
+def model(synthetic_pcap, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("model") / "model.npz")
+    train_model(synthetic_pcap, output=path, quantile=0.9)
+    return load_model(path)
+
+
+def test_capped_anomalies_are_counted(model, synthetic_flows):
+    result = AnomalyScorer(model, max_alerts=3).score_flows(synthetic_flows)
+    assert len(result.alerts) == 3
+    assert result.suppressed == result.anomalies - 3 > 0
+
+    scores = [alert["details"]["score"] for alert in result.alerts]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_zero_cap_reports_every_anomaly(model, synthetic_flows):
+    result = AnomalyScorer(model, max_alerts=0).score_flows(synthetic_flows)
+    assert len(result.alerts) == result.anomalies > 0
+    assert result.suppressed == 0
+
+
+def test_training_flow_limits_apply_when_scoring(synthetic_pcap, tmp_path, monkeypatch):
+    path = str(tmp_path / "bounded.npz")
+    report = train_model(synthetic_pcap, output=path, quantile=0.9, max_flows=2000, idle_timeout=30.0)
+
+    limits = {"max_flows": 2000, "idle_timeout": 30.0, "active_timeout": None}
+    assert AnomalyModel.load(path).flow_limits == limits
+    assert report.flows == len(generate_flows(synthetic_pcap, **limits))
+
+    calls = []
+
+    def recording(*args, **kwargs):
+        calls.append({name: kwargs[name] for name in limits})
+        return generate_flows(*args, **kwargs)
+
+    monkeypatch.setattr(engine, "generate_flows", recording)
+    engine.run_detection(synthetic_pcap, model_path=path, use_cache=False)
+    engine.run_detection(synthetic_pcap, model_path=path, max_flows=5000, use_cache=False)
+    assert calls == [limits, dict(limits, max_flows=5000)]
@@ -0,0 +1,93 @@
+"""
+Alert deduplication: TTL expiry, size bound and persistence.
+"""
+import json
+
+import pytest
+
+from core.dedup import DedupStore, alert_key
+
+KEY = ("PORT_SCAN", "10.0.0.1", "10.0.0.2", None)
+
+
+def test_repeat_within_ttl_is_suppressed():
+    store = DedupStore(ttl=60)
+    assert not store.seen(KEY, now=1000.0)
+    assert store.seen(KEY, now=1030.0)
+
+
+def test_key_is_reported_again_after_ttl():
+    store = DedupStore(ttl=60)
+    store.seen(KEY, now=1000.0)
+    assert not store.seen(KEY, now=1061.0)
+
+
+def test_sighting_restarts_ttl():
+    store = DedupStore(ttl=60)
+    store.seen(KEY, now=1000.0)
+    store.seen(KEY, now=1050.0)
+    assert store.seen(KEY, now=1100.0)
+
+
+def test_sweep_drops_expired_keys_in_batches():
+    store = DedupStore(ttl=10)
+    store.SWEEP_BATCH = 3
+    for i in range(5):
+        store.seen(("FLOOD", f"10.0.0.{i}", None, None), now=100.0 + i)
+    store.seen(KEY, now=200.0)
+
+    assert store.sweep(now=150.0) == 3
+    assert store.sweep(now=150.0) == 2
+    assert store.sweep(now=150.0) == 0
+    assert len(store) == 1
+
+
+def test_oldest_key_is_evicted_at_max_size():
+    store = DedupStore(ttl=60, max_size=2)
+    store.seen("a", now=1.0)
+    store.seen("b", now=2.0)
+    store.seen("a", now=3.0)
+    store.seen("c", now=4.0)
+
+    assert len(store) == 2
+    assert not store.seen("b", now=5.0)
+
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / "dedup.json")
+    store = DedupStore(ttl=3600, path=path)
+    store.seen(KEY)
+    assert store.save(force=True)
+
+    restored = DedupStore(ttl=3600, path=path)
+    assert KEY in restored
+
+
+def test_expired_state_is_not_restored(tmp_path):
+    path = tmp_path / "dedup.json"
+    path.write_text(json.dumps({"version": 1, "entries": [[list(KEY), 1.0]]}))
+    assert len(DedupStore(path=str(path))) == 0
+
+
+def test_missing_state_directory_is_rejected():
+    with pytest.raises(ValueError):
+        DedupStore(path="/nonexistent/dir/state.json")
+
+
+def test_failed_save_is_retried(tmp_path):
+    path = tmp_path / "dedup.json"
+    store = DedupStore(path=str(path))
+    store.seen(KEY)
+
+    path.mkdir()
+    assert not store.save(force=True)
+    assert list(tmp_path.iterdir()) == [path]
+
+    path.rmdir()
+    assert store.save(force=True)
+    assert KEY in DedupStore(path=str(path))
+
+
+def test_alert_key():
+    alert = {"type": "BRUTE_FORCE", "src_ip": "a", "dst_ip": "b", "dst_port": 22, "details": {}}
+    assert alert_key(alert) == ("BRUTE_FORCE", "a", "b", 22)
@@ -0,0 +1,202 @@
+"""
+Flow generation: flow keys, the native reader against a pyshark-style
+dissection and the tshark backend, sharded and bounded parsing, and the
+flow cache.
+"""
+import shutil
+import struct
+
+import numpy as np
+import pytest
+
+from core.cache import FlowCache
+from core.flows import _tshark_key, generate_flows
+from core.flowtable import FlowTable, encode_key
+
+
+def _as_dict(flows) -> dict:
+    return {
+        key: (flow.start_time, flow.end_time, flow.packet_count, flow.byte_count)
+        for key, flow in flows.items()
+    }
+
+
+def _assert_same_table(left, right) -> None:
+    ours, theirs = left.to_columns(), right.to_columns()
+    assert ours.keys() == theirs.keys()
+    for name in ours:
+        np.testing.assert_array_equal(ours[name], theirs[name], err_msg=name)
+
+
+# -----------------------------
+# Flow keys
+# -----------------------------
+
+@pytest.mark.parametrize("protocol", ["ICMP", "TCP", "UDP", "DCCP", "SCTP"])
+def test_transport_protocols_round_trip(protocol):
+    table = FlowTable()
+    key = ("10.0.0.1", "10.0.0.2", "5000", "80", protocol)
+    table.add_packet(encode_key(key), 1.0, 60)
+    assert list(table) == [key]
+
+
+def test_unknown_transport_protocol_is_rejected():
+    with pytest.raises(ValueError):
+        encode_key(("10.0.0.1", "10.0.0.2", "5000", "80", "QUIC"))
+
+
+# -----------------------------
+# Native reader vs. dissection
+# -----------------------------
+
+def _dissect(pcap_file: str) -> dict:
+    """
+    Flows keyed the way _flows_pyshark keys them (ip.src, ip.dst, srcport,
+    dstport, transport layer, frame length), from a plain struct walk of
+    an Ethernet / IPv4 capture.
+    """
+    flows: dict = {}
+    with open(pcap_file, "rb") as capture:
+        data = capture.read()
+
+    offset = 24
+    while offset < len(data):
+        ts_sec, ts_usec, incl_len, orig_len = struct.unpack_from("<IIII", data, offset)
+        frame = data[offset + 16:offset + 16 + incl_len]
+        offset += 16 + incl_len
+
+        if struct.unpack_from(">H", frame, 12)[0] != 0x0800:
+            continue
+        ip = frame[14:]
+        protocol = {6: "TCP", 17: "UDP"}.get(ip[9])
+        if protocol is None:
+            continue
+        header = (ip[0] & 0x0F) * 4
+        src_port, dst_port = struct.unpack_from(">HH", ip, header)
+        key = (
+            ".".join(str(octet) for octet in ip[12:16]),
+            ".".join(str(octet) for octet in ip[16:20]),
+            str(src_port),
+            str(dst_port),
+            protocol,
+        )
+        timestamp = ts_sec + ts_usec / 1e6
+        start, _, packets, size = flows.get(key, (timestamp, timestamp, 0, 0))
+        flows[key] = (start, timestamp, packets + 1, size + orig_len)
+    return flows
+
+
+def test_native_matches_dissection(synthetic_pcap, synthetic_flows):
+    assert _as_dict(synthetic_flows) == _dissect(synthetic_pcap)
+
+
+@pytest.mark.parametrize("fields, key", [
+    (b"10.0.0.1\t10.0.0.2\t5000\t80\t\t", ("10.0.0.1", "10.0.0.2", "5000", "80", "TCP")),
+    (b"10.0.0.1\t10.0.0.2\t\t\t53000\t53", ("10.0.0.1", "10.0.0.2", "53000", "53", "UDP")),
+    (b"10.0.0.1\t10.0.0.2\t\t\t\t", None),
+    (b"\t\t\t\t\t", None),
+])
+def test_tshark_fields_map_to_flow_keys(fields, key):
+    assert _tshark_key(fields) == (encode_key(key) if key else -1)
+
+
+@pytest.mark.skipif(shutil.which("tshark") is None, reason="tshark is not installed")
+def test_native_matches_tshark(synthetic_pcap, synthetic_flows):
+    flows = generate_flows(synthetic_pcap, backend="tshark")
+    assert _as_dict(flows) == _as_dict(synthetic_flows)
+
+
+@pytest.mark.skipif(shutil.which("tshark") is None, reason="tshark is not installed")
+def test_native_matches_pyshark(synthetic_pcap, synthetic_flows):
+    pytest.importorskip("pyshark")
+    flows = generate_flows(synthetic_pcap, backend="pyshark")
+    assert _as_dict(flows) == _as_dict(synthetic_flows)
+
+
+# -----------------------------
+# Sharded and bounded parsing
+# -----------------------------
+
+@pytest.mark.parametrize("workers", [2, 4])
+def test_workers_match_single_process(synthetic_pcap, synthetic_flows, workers):
+    flows = generate_flows(synthetic_pcap, backend="native", workers=workers)
+    assert list(flows) == list(synthetic_flows)
+    assert _as_dict(flows) == _as_dict(synthetic_flows)
+
+
+def test_bounded_table_stays_within_limit(synthetic_pcap):
+    flows = generate_flows(synthetic_pcap, backend="native", max_flows=500)
+    # Active flows, rolled-up flows and per-source overflow, 500 each at most
+    assert len(flows) <= 3 * 500
+    assert flows.evictions["capacity"] > 0
+    assert flows.evictions["rolled_up"] > 0
+
+
+def test_generous_limit_changes_nothing(synthetic_pcap, synthetic_flows):
+    flows = generate_flows(synthetic_pcap, backend="native", max_flows=len(synthetic_flows) * 2)
+    assert list(flows) == list(synthetic_flows)
+    assert _as_dict(flows) == _as_dict(synthetic_flows)
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+
+OPTIONS = {"max_flows": None, "idle_timeout": None, "active_timeout": None, "backend": "native"}
+
+
+def test_cache_miss_then_hit(synthetic_pcap, synthetic_flows, tmp_path):
+    cache = FlowCache(directory=str(tmp_path))
+    assert cache.load(synthetic_pcap, OPTIONS) is None
+
+    flows = generate_flows(synthetic_pcap, backend="native", cache=cache)
+    _assert_same_table(flows, synthetic_flows)
+
+    cached, packets = cache.load(synthetic_pcap, OPTIONS)
+    assert packets == sum(flow.packet_count for flow in synthetic_flows.values())
+    _assert_same_table(cached, synthetic_flows)
+    _assert_same_table(generate_flows(synthetic_pcap, backend="native", cache=cache), synthetic_flows)
+
+
+def test_cache_options_are_separate_entries(synthetic_pcap, tmp_path):
+    cache = FlowCache(directory=str(tmp_path))
+    generate_flows(synthetic_pcap, backend="native", cache=cache)
+
+    bounded = dict(OPTIONS, max_flows=500)
+    assert cache.load(synthetic_pcap, bounded) is None
+    generate_flows(synthetic_pcap, backend="native", max_flows=500, cache=cache)
+    assert cache.load(synthetic_pcap, bounded) is not None
+
+
+@pytest.mark.parametrize("damage", ["truncate", "garbage"])
+def test_corrupt_cache_entry_is_discarded(synthetic_pcap, synthetic_flows, tmp_path, damage):
+    cache = FlowCache(directory=str(tmp_path))
+    generate_flows(synthetic_pcap, backend="native", cache=cache)
+
+    entry = cache.entry_path(synthetic_pcap, OPTIONS)
+    with open(entry, "r+b") as out:
+        if damage == "truncate":
+            out.truncate(out.seek(0, 2) // 2)
+        else:
+            out.write(b"not a zip file")
+
+    assert cache.load(synthetic_pcap, OPTIONS) is None
+    assert not (tmp_path / entry).exists()
+
+    _assert_same_table(generate_flows(synthetic_pcap, backend="native", cache=cache), synthetic_flows)
+    assert cache.load(synthetic_pcap, OPTIONS) is not None
+
+
+def test_cache_follows_capture_changes(synthetic_pcap, tmp_path):
+    copy = tmp_path / "copy.pcap"
+    shutil.copyfile(synthetic_pcap, copy)
+    cache = FlowCache(directory=str(tmp_path / "cache"))
+
+    generate_flows(str(copy), backend="native", cache=cache)
+    with open(copy, "r+b") as out:
+        out.truncate(out.seek(0, 2) - 70)
+
+    assert cache.load(str(copy), OPTIONS) is None
+    flows = generate_flows(str(copy), backend="native", cache=cache)
+    _, packets = cache.load(str(copy), OPTIONS)
+    assert packets == sum(flow.packet_count for flow in flows.values())
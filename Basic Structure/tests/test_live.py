@@ -0,0 +1,134 @@
+"""
+Live-mode building blocks: merging per-interface windows and the
+incremental detectors, exact and sketched.
+"""
+from collections import Counter
+
+import pytest
+
+from bench.synthetic import EXPECTED_ALERTS
+from core.engine import analyze_with_sketches
+from core.flowtable import FlowTable, encode_key
+from core.live import merge_windows
+from core.pcap import iter_packets
+from core.ruleengine import run_rules
+from core.sketches import SketchDetectors
+from core.sliding import SlidingDetectors
+
+
+def _as_dict(table) -> dict:
+    return {
+        key: (flow.start_time, flow.end_time, flow.packet_count, flow.byte_count)
+        for key, flow in table.items()
+    }
+
+
+# -----------------------------
+# merge_windows
+# -----------------------------
+
+def test_merge_windows_matches_one_table(synthetic_pcap, synthetic_flows):
+    # Packets split over three "interfaces", as a mirrored port would see them
+    tables = [FlowTable() for _ in range(3)]
+    for index, (timestamp, length, key) in enumerate(iter_packets(synthetic_pcap)):
+        if key is not None:
+            tables[index % 3].add_packet(key, timestamp, length)
+
+    assert _as_dict(merge_windows(tables)) == _as_dict(synthetic_flows)
+
+
+def test_merge_windows_keeps_distinct_flows_apart():
+    first, second = FlowTable(), FlowTable()
+    first.add_packet(encode_key(("10.0.0.1", "10.0.0.2", "1000", "80", "TCP")), 1.0, 60)
+    second.add_packet(encode_key(("10.0.0.1", "10.0.0.2", "1000", "443", "TCP")), 2.0, 60)
+    second.add_packet(encode_key(("2001:db8::1", "2001:db8::2", "1000", "80", "TCP")), 3.0, 80)
+
+    merged = merge_windows([first, second])
+    assert len(merged) == 3
+    assert _as_dict(merged) == {**_as_dict(first), **_as_dict(second)}
+
+
+def test_merge_windows_sums_evictions():
+    first, second = FlowTable(), FlowTable()
+    first.evictions["idle"] = 2
+    second.evictions["idle"] = 3
+    second.evictions["rolled_up"] = 1
+
+    merged = merge_windows([first, second, FlowTable()])
+    assert len(merged) == 0
+    assert merged.evictions["idle"] == 5
+    assert merged.evictions["rolled_up"] == 1
+
+
+# -----------------------------
+# Incremental detectors
+# -----------------------------
+
+SCAN = [encode_key(("10.0.0.5", "10.0.0.9", "40000", str(port), "TCP")) for port in range(1, 21)]
+
+
+@pytest.mark.parametrize("detectors", [
+    lambda: SlidingDetectors(horizon=60, bucket=5),
+    lambda: SketchDetectors(horizon=60),
+], ids=["sliding", "sketch"])
+def test_scan_alerts_once_and_rearms_after_going_quiet(detectors):
+    detectors = detectors()
+
+    alerts = [alert for i, key in enumerate(SCAN) for alert in detectors.update(key, 10.0 + i)]
+    assert [alert["type"] for alert in alerts] == ["PORT_SCAN"]
+
+    # Well past the horizon the key's state is gone, and so is its alert
+    alerts = [alert for i, key in enumerate(SCAN) for alert in detectors.update(key, 1000.0 + i)]
+    assert [alert["type"] for alert in alerts] == ["PORT_SCAN"]
+
+
+@pytest.mark.parametrize("detectors", [
+    lambda: SlidingDetectors(horizon=60, bucket=5),
+    lambda: SketchDetectors(horizon=60),
+], ids=["sliding", "sketch"])
+def test_batched_updates_weigh_as_many_packets(detectors):
+    flood = encode_key(("10.0.0.5", "10.0.0.9", "40000", "80", "UDP"))
+    ssh = encode_key(("10.0.0.6", "10.0.0.9", "40000", "22", "TCP"))
+
+    # 1000 flood packets and 15 login attempts over two seconds
+    batches = []
+    for step in range(40):
+        batches.append((flood, 10.0 + step * 0.05, 25))
+        if step < 5:
+            batches.append((ssh, 10.0 + step * 0.05, 3))
+
+    single, batched = detectors(), detectors()
+    expected = [
+        alert["type"]
+        for key, timestamp, count in batches
+        for _ in range(count)
+        for alert in single.update(key, timestamp)
+    ]
+    alerts = [
+        alert["type"]
+        for key, timestamp, count in batches
+        for alert in batched.update(key, timestamp, packets=count)
+    ]
+    assert sorted(expected) == sorted(alerts) == ["BRUTE_FORCE", "FLOOD"]
+
+
+def test_sliding_state_is_released_for_quiet_keys():
+    detectors = SlidingDetectors(horizon=60, bucket=5)
+    for i, key in enumerate(SCAN):
+        detectors.update(key, 10.0 + i)
+    assert detectors.tracked_keys > 0
+
+    other = encode_key(("10.0.0.7", "10.0.0.8", "40000", "80", "TCP"))
+    detectors.update(other, 1000.0)
+    assert detectors.tracked_keys == 2  # the new pair and its source
+
+
+def _identity(alert: dict) -> tuple:
+    return alert["type"], alert["src_ip"], alert.get("dst_ip"), alert.get("dst_port")
+
+
+def test_sketch_mode_matches_exact_rules(synthetic_pcap, synthetic_flows):
+    sketched = analyze_with_sketches(synthetic_pcap)
+    exact = run_rules(synthetic_flows).alerts
+    assert Counter(alert["type"] for alert in exact) == EXPECTED_ALERTS
+    assert sorted(map(_identity, sketched)) == sorted(map(_identity, exact))
@@ -0,0 +1,239 @@
+"""
+The compiled rules (core/rules.toml) against the per-flow loops they
+replaced, on a synthetic capture, and the declared params the other
+detectors follow.
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+import pytest
+
+from bench.synthetic import EXPECTED_ALERTS
+from core import rules
+from core.ruledefs import DECLARED, compile_rule
+from core.ruleengine import RULES, run_rules
+from core.sketches import SketchDetectors
+from core.sliding import SlidingDetectors
+
+
+# -----------------------------
+# Reference loop implementations
+# -----------------------------
+
+def loop_port_scan(flows, port_threshold: int = 10) -> List[Dict]:
+    ports_by_pair = defaultdict(set)
+    for flow in flows.values():
+        if 0 < int(flow.dst_port) <= 65535:
+            ports_by_pair[(flow.src_ip, flow.dst_ip)].add(flow.dst_port)
+
+    return [
+        {
+            "type": "PORT_SCAN",
+            "severity": "CRITICAL",
+            "src_ip": src_ip,
+            "dst_ip": dst_ip,
+            "details": {
+                "unique_ports_attempted": len(ports),
+                "threshold": port_threshold,
+                "description": "Multiple ports probed on same host",
+            },
+        }
+        for (src_ip, dst_ip), ports in ports_by_pair.items()
+        if len(ports) >= port_threshold
+    ]
+
+
+def loop_bruteforce(
+    flows,
+    attempt_threshold: int = 10,
+    max_duration: float = 60.0,
+    monitored_ports=(22, 21, 3389)
+) -> List[Dict]:
+    attempts = {}
+    for flow in flows.values():
+        dst_port = int(flow.dst_port)
+        if dst_port not in monitored_ports:
+            continue
+        data = attempts.setdefault(
+            (flow.src_ip, flow.dst_ip, dst_port),
+            {"packets": 0, "start": flow.start_time, "end": flow.end_time}
+        )
+        data["packets"] += flow.packet_count
+        data["start"] = min(data["start"], flow.start_time)
+        data["end"] = max(data["end"], flow.end_time)
+
+    alerts = []
+    for (src_ip, dst_ip, port), data in attempts.items():
+        duration = max(data["end"] - data["start"], 0.001)
+        if data["packets"] >= attempt_threshold and duration <= max_duration:
+            alerts.append({
+                "type": "BRUTE_FORCE",
+                "severity": "CRITICAL",
+                "src_ip": src_ip,
+                "dst_ip": dst_ip,
+                "dst_port": port,
+                "details": {
+                    "attempts": data["packets"],
+                    "duration_sec": round(duration, 2),
+                    "threshold": attempt_threshold,
+                    "description": "Multiple login attempts in short time window",
+                },
+            })
+    return alerts
+
+
+def loop_flood(
+    flows,
+    pps_threshold: float = 500.0,
+    min_packets: int = 500,
+    min_duration: float = 1.0
+) -> List[Dict]:
+    traffic = {}
+    for flow in flows.values():
+        data = traffic.setdefault(flow.src_ip, {
+            "packets": 0, "first": flow.start_time, "last": flow.end_time, "targets": set()
+        })
+        data["packets"] += flow.packet_count
+        data["first"] = min(data["first"], flow.start_time)
+        data["last"] = max(data["last"], flow.end_time)
+        data["targets"].add(flow.dst_ip)
+
+    alerts = []
+    for src_ip, data in traffic.items():
+        duration = max(data["last"] - data["first"], 0.001)
+        pps = data["packets"] / duration
+        if data["packets"] >= min_packets and duration >= min_duration and pps >= pps_threshold:
+            alerts.append({
+                "type": "FLOOD",
+                "severity": "CRITICAL",
+                "src_ip": src_ip,
+                "details": {
+                    "packets_per_sec": round(pps, 2),
+                    "total_packets": data["packets"],
+                    "duration_sec": round(duration, 2),
+                    "unique_targets": len(data["targets"]),
+                    "threshold": pps_threshold,
+                    "description": "Sustained high-rate traffic from single source",
+                },
+            })
+    return alerts
+
+
+LOOPS = {"port_scan": loop_port_scan, "bruteforce": loop_bruteforce, "flood": loop_flood}
+
+
+def _loop_alerts(flows, params: Dict[str, Dict]) -> List[Dict]:
+    alerts = []
+    for name, loop in LOOPS.items():
+        alerts.extend(loop(flows, **params.get(name, {})))
+    return alerts
+
+
+OVERRIDES = {
+    "defaults": {},
+    "lowered": {
+        "port_scan": {"port_threshold": 3},
+        "bruteforce": {"attempt_threshold": 2, "monitored_ports": [22, 80, 443]},
+        "flood": {"pps_threshold": 50.0, "min_packets": 20, "min_duration": 0.5},
+    },
+    "raised": {
+        "port_scan": {"port_threshold": 50},
+        "bruteforce": {"attempt_threshold": 60, "max_duration": 5.0},
+        "flood": {"pps_threshold": 5000.0},
+    },
+}
+
+
+@pytest.mark.parametrize("params", OVERRIDES.values(), ids=list(OVERRIDES))
+def test_compiled_rules_match_loops(synthetic_flows, params):
+    assert run_rules(synthetic_flows, params=params).alerts == _loop_alerts(synthetic_flows, params)
+
+
+def test_default_rules_find_injected_attacks(synthetic_flows):
+    alerts = run_rules(synthetic_flows).alerts
+    counts = defaultdict(int)
+    for alert in alerts:
+        counts[alert["type"]] += 1
+    assert dict(counts) == EXPECTED_ALERTS
+
+
+def _loop_first_seen(flows, alerts: List[Dict]) -> List[float]:
+    """
+    Start of the earliest flow in each alert's group, grouped as the
+    loops group.
+    """
+    first: Dict[tuple, float] = {}
+
+    def see(key: tuple, start: float) -> None:
+        first[key] = min(first.get(key, start), start)
+
+    for flow in flows.values():
+        port = int(flow.dst_port)
+        see(("FLOOD", flow.src_ip), flow.start_time)
+        see(("BRUTE_FORCE", flow.src_ip, flow.dst_ip, port), flow.start_time)
+        if 0 < port <= 65535:
+            see(("PORT_SCAN", flow.src_ip, flow.dst_ip), flow.start_time)
+
+    keys = {
+        "FLOOD": lambda alert: ("FLOOD", alert["src_ip"]),
+        "BRUTE_FORCE": lambda alert: ("BRUTE_FORCE", alert["src_ip"], alert["dst_ip"], alert["dst_port"]),
+        "PORT_SCAN": lambda alert: ("PORT_SCAN", alert["src_ip"], alert["dst_ip"]),
+    }
+    return [first[keys[alert["type"]](alert)] for alert in alerts]
+
+
+def test_first_seen_is_each_groups_first_flow(synthetic_flows):
+    report = run_rules(synthetic_flows, params=OVERRIDES["lowered"])
+    assert len(report.first_seen) == len(report.alerts) > len(EXPECTED_ALERTS)
+    assert report.first_seen == _loop_first_seen(synthetic_flows, report.alerts)
+
+
+# -----------------------------
+# Declared params elsewhere
+# -----------------------------
+
+def test_single_rule_entry_points_keep_declared_defaults(synthetic_flows):
+    assert rules.detect_port_scan(synthetic_flows) == loop_port_scan(synthetic_flows)
+    assert rules.detect_bruteforce(synthetic_flows, max_duration=5.0) == loop_bruteforce(
+        synthetic_flows, max_duration=5.0
+    )
+    assert rules.detect_flood(synthetic_flows, min_packets=20) == loop_flood(synthetic_flows, min_packets=20)
+    with pytest.raises(TypeError):
+        rules.detect_flood(synthetic_flows, port_threshold=3)
+
+
+@pytest.mark.parametrize("detectors", [SlidingDetectors, SketchDetectors], ids=["sliding", "sketch"])
+def test_detectors_take_declared_params(monkeypatch, detectors):
+    monkeypatch.setitem(DECLARED["port_scan"].params, "port_threshold", 25)
+    monkeypatch.setitem(DECLARED["bruteforce"].params, "monitored_ports", [2222])
+
+    built = detectors(pps_threshold=50.0)
+    assert built.port_threshold == 25
+    assert built.monitored_ports == {2222}
+    assert built.pps_threshold == 50.0
+    assert built.min_packets == DECLARED["flood"].params["min_packets"]
+
+
+@pytest.fixture
+def scratch_rules():
+    """
+    Compile rules for one test only.
+    """
+    saved_rules, saved_declared = dict(RULES), dict(DECLARED)
+    yield compile_rule
+    RULES.clear()
+    RULES.update(saved_rules)
+    DECLARED.clear()
+    DECLARED.update(saved_declared)
+
+
+def test_capture_filter_names_only_bpf_protocols(scratch_rules):
+    rule = scratch_rules("transport_mix", {
+        "type": "TRANSPORT_MIX",
+        "group_by": ["src_ip", "protocol"],
+        "where": ["protocol in protocols"],
+        "aggregate": {"flows": "count"},
+        "when": ["flows >= 1"],
+        "params": {"protocols": ["DCCP", "TCP", "SCTP", "UDP"]},
+    })
+    assert rule.capture() == "tcp or udp or ip proto 33 or sctp"
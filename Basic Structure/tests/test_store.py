@@ -0,0 +1,199 @@
+"""
+The flow / alert store: flow tables and alerts written through FlowStore
+and read back, day partitions, and the time expressions `ids query` takes.
+"""
+import calendar
+import os
+import time
+
+import pytest
+
+from core import rules  # noqa: F401  (registers the built-in rules)
+from core.flowtable import FlowTable, encode_key
+from core.ruleengine import run_rules
+from core.store import DAY, FlowStore, day_range, parse_time, partitions, query_alerts, query_flows
+
+# 2024-05-14 is a Tuesday
+TUESDAY = calendar.timegm((2024, 5, 14, 0, 0, 0))
+
+
+@pytest.fixture
+def local_time(monkeypatch):
+    """
+    Local time five hours behind UTC, with no daylight saving.
+    """
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available")
+    monkeypatch.setenv("TZ", "EST+05")
+    time.tzset()
+    yield 5 * 3600
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _partition_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".sqlite"))
+
+
+def _table(flows) -> FlowTable:
+    """
+    A FlowTable with one flow per (key, start, end, packets): packets are
+    spread over [start, end] at 100 bytes each.
+    """
+    table = FlowTable()
+    for key, start, end, packets in flows:
+        for i in range(packets):
+            table.add_packet(encode_key(key), start + (end - start) * i / max(packets - 1, 1), 100)
+    return table
+
+
+# -----------------------------
+# Round trip
+# -----------------------------
+
+FLOWS = [
+    (("10.0.0.1", "10.0.0.2", "40000", "22", "TCP"), TUESDAY + 3600, TUESDAY + 3660, 12),
+    (("10.0.0.1", "10.0.0.3", "53000", "53", "UDP"), TUESDAY + 7200, TUESDAY + 7200, 1),
+    (("2001:db8::1", "2001:db8::2", "40001", "443", "TCP"), TUESDAY + 10800, TUESDAY + 10810, 3),
+    # The next UTC day, in its own partition
+    (("10.0.0.4", "10.0.0.2", "40002", "80", "TCP"), TUESDAY + DAY + 60, TUESDAY + DAY + 61, 2),
+]
+
+
+def test_flow_table_round_trips(tmp_path):
+    table = _table(FLOWS)
+    with FlowStore(directory=str(tmp_path)) as store:
+        assert store.put_flows(table, "test.pcap")
+
+    assert _partition_files(tmp_path) == ["2024-05-14.sqlite", "2024-05-15.sqlite"]
+    assert partitions(str(tmp_path), TUESDAY, TUESDAY + 2 * DAY) == [
+        str(tmp_path / "2024-05-14.sqlite"), str(tmp_path / "2024-05-15.sqlite")
+    ]
+
+    flows, searched = query_flows(TUESDAY, TUESDAY + 2 * DAY, directory=str(tmp_path))
+    assert searched == 2
+    assert [
+        (
+            (row["src_ip"], row["dst_ip"], str(row["src_port"]), str(row["dst_port"]), row["protocol"]),
+            row["start"], row["end"], row["packets"], row["bytes"], row["source"]
+        )
+        for row in flows
+    ] == [
+        (key, start, end, packets, 100 * packets, "test.pcap")
+        for key, start, end, packets in FLOWS
+    ]
+
+    # Filters
+    def keys(**filters):
+        found, _ = query_flows(TUESDAY, TUESDAY + 2 * DAY, directory=str(tmp_path), **filters)
+        return [(row["src_ip"], row["dst_port"]) for row in found]
+
+    assert keys(src="10.0.0.1") == [("10.0.0.1", 22), ("10.0.0.1", 53)]
+    assert keys(ip="10.0.0.2") == [("10.0.0.1", 22), ("10.0.0.4", 80)]
+    assert keys(port=443) == [("2001:db8::1", 443)]
+    assert keys(protocol="udp") == [("10.0.0.1", 53)]
+    with pytest.raises(ValueError):
+        keys(protocol="quic")
+
+
+def test_only_touched_partitions_are_searched(tmp_path):
+    with FlowStore(directory=str(tmp_path)) as store:
+        store.put_flows(_table(FLOWS), "test.pcap")
+
+    flows, searched = query_flows(TUESDAY + DAY + 3600, TUESDAY + DAY + 7200, directory=str(tmp_path))
+    assert flows == []
+    assert searched == 2  # that day and the one before it
+
+    assert query_flows(TUESDAY + 5 * DAY, TUESDAY + 6 * DAY, directory=str(tmp_path)) == ([], 0)
+
+
+def test_flows_from_the_previous_partition_overlap(tmp_path):
+    # Starts a minute before midnight UTC, so it is stored in the day before
+    key = ("10.0.0.5", "10.0.0.6", "40000", "22", "TCP")
+    with FlowStore(directory=str(tmp_path)) as store:
+        store.put_flows(_table([(key, TUESDAY + DAY - 60, TUESDAY + DAY + 60, 5)]), "test.pcap")
+
+    assert _partition_files(tmp_path) == ["2024-05-14.sqlite"]
+    flows, searched = query_flows(TUESDAY + DAY, TUESDAY + 2 * DAY, directory=str(tmp_path))
+    assert [row["src_ip"] for row in flows] == ["10.0.0.5"]
+    assert searched == 1
+
+    # Already over by the range's start
+    flows, _ = query_flows(TUESDAY + DAY + 120, TUESDAY + 2 * DAY, directory=str(tmp_path))
+    assert flows == []
+
+
+def test_alerts_are_stored_at_their_own_flow_times(tmp_path, synthetic_flows):
+    report = run_rules(synthetic_flows)
+    with FlowStore(directory=str(tmp_path)) as store:
+        store.put_alerts(list(zip(report.alerts, report.first_seen)), "synthetic.pcap")
+
+    starts = synthetic_flows.column("start_time")
+    alerts, _ = query_alerts(starts.min(), starts.max() + 1, limit=0, directory=str(tmp_path))
+    assert sorted(alert["time"] for alert in alerts) == sorted(report.first_seen)
+    assert len(set(report.first_seen)) > 1
+
+    # Alert fields come back as columns, and their details as details
+    stored = {(alert["type"], alert["src_ip"], alert["dst_ip"]): alert for alert in alerts}
+    for original in report.alerts:
+        alert = stored[original["type"], original["src_ip"], original.get("dst_ip")]
+        assert alert["severity"] == original["severity"]
+        assert alert["details"] == original["details"]
+
+    flood, _ = query_alerts(starts.min(), starts.max() + 1, alert_type="flood", directory=str(tmp_path))
+    assert {alert["type"] for alert in flood} == {"FLOOD"}
+
+
+# -----------------------------
+# Time expressions
+# -----------------------------
+
+def test_relative_times():
+    now = TUESDAY + 12 * 3600
+    assert parse_time("now", now) == now
+    assert parse_time("90m", now) == now - 90 * 60
+    assert parse_time("24h", now) == now - DAY
+    assert parse_time("-7d", now) == now - 7 * DAY
+    assert parse_time("2w", now) == now - 14 * DAY
+    assert parse_time("1.5h", now) == now - 5400
+    assert parse_time(str(TUESDAY), now) == TUESDAY
+    assert parse_time("2024-05-14T09:30+00:00", now) == TUESDAY + 9.5 * 3600
+
+    with pytest.raises(ValueError):
+        parse_time("last blursday", now)
+
+
+def test_weekdays_are_local_midnights(local_time):
+    # Wednesday 2024-05-15, 01:00 local time (06:00 UTC)
+    now = TUESDAY + DAY + 6 * 3600
+    tuesday_midnight = TUESDAY + local_time
+
+    assert parse_time("today", now) == tuesday_midnight + DAY
+    assert parse_time("yesterday", now) == tuesday_midnight
+    assert parse_time("last tuesday", now) == tuesday_midnight
+    assert parse_time("Tue", now) == tuesday_midnight
+    assert parse_time("last monday", now) == tuesday_midnight - DAY
+    # Today's weekday means the week before
+    assert parse_time("wednesday", now) == tuesday_midnight - 6 * DAY
+
+    # ISO dates without an offset are local too
+    assert parse_time("2024-05-14", now) == tuesday_midnight
+
+
+def test_local_day_spans_two_utc_partitions(tmp_path, local_time):
+    # 22:00 local on Tuesday is 03:00 UTC on Wednesday
+    late = TUESDAY + DAY + 3 * 3600
+    key = ("10.0.0.7", "10.0.0.8", "40000", "22", "TCP")
+    with FlowStore(directory=str(tmp_path)) as store:
+        store.put_flows(_table([(key, late, late + 1, 2)]), "test.pcap")
+    assert _partition_files(tmp_path) == ["2024-05-15.sqlite"]
+
+    since, until = day_range("last tuesday", now=TUESDAY + 2 * DAY + 12 * 3600)
+    assert (since, until) == (TUESDAY + local_time, TUESDAY + local_time + DAY)
+
+    flows, _ = query_flows(since, until, directory=str(tmp_path))
+    assert [row["src_ip"] for row in flows] == ["10.0.0.7"]
+
+    # The same flow is outside Wednesday, local time
+    flows, _ = query_flows(*day_range("2024-05-15"), directory=str(tmp_path))
+    assert flows == []
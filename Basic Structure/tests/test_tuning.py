@@ -0,0 +1,76 @@
+"""
+`ids tune` sweeps against running the rules once per config.
+"""
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from bench.synthetic import attack_labels
+from core.ruleengine import FlowAggregates, RULES, run_rules
+from core.tuning import TuneResult, parse_grid, tune
+
+SPECS = [
+    "port_threshold=5,40,50,60",
+    "bruteforce.attempt_threshold=10,56,60",
+    "flood.pps_threshold=100,1500",
+]
+
+
+@pytest.fixture(scope="module")
+def result(synthetic_flows):
+    return tune(FlowAggregates(synthetic_flows), parse_grid(SPECS), labels=attack_labels())
+
+
+def _config(result, index: int) -> dict:
+    params: dict = {}
+    for name, values in result.params.items():
+        rule, param = name.split(".")
+        value = values[index]
+        params.setdefault(rule, {})[param] = value.item() if isinstance(value, np.generic) else value
+    return params
+
+
+def test_grid_is_the_full_product(result):
+    assert len(result) == 4 * 3 * 2
+
+
+def test_every_config_matches_run_rules(synthetic_flows, result):
+    for index in range(len(result)):
+        alerts = run_rules(synthetic_flows, params=_config(result, index)).alerts
+        counts = Counter(alert["type"] for alert in alerts)
+
+        assert result.alerts[index] == len(alerts)
+        for rule in RULES.values():
+            assert result.alerts_by_type[rule.alert_type][index] == counts[rule.alert_type]
+
+
+def test_labels_found_follow_thresholds(result):
+    # The flood runs at ~1490 packets/s, so a 1500 threshold misses it
+    missed = next(
+        index for index in range(len(result))
+        if _config(result, index) == {
+            "port_scan": {"port_threshold": 5},
+            "bruteforce": {"attempt_threshold": 10},
+            "flood": {"pps_threshold": 1500},
+        }
+    )
+    assert result.labels_found[missed] == result.labels - 1
+    assert result.labels_found.max() == result.labels == len(attack_labels())
+
+
+def test_headings_keep_the_rule_where_params_share_a_name():
+    values = np.zeros(2)
+    result = TuneResult(
+        params={"scan.threshold": values, "flood.threshold": values, "flood.min_packets": values},
+        alerts=values,
+        alerts_by_type={"FLOOD": values},
+        true_positives=values,
+        labels_found=values,
+        labels=0,
+    )
+    assert result.headings() == ["scan.threshold", "flood.threshold", "min_packets", "alerts", "FLOOD"]
+
+
+def test_default_headings_are_bare_params(result):
+    assert result.headings()[:3] == ["port_threshold", "attempt_threshold", "pps_threshold"]
@@ -4,7 +4,7 @@ from rich.panel import Panel
 console = Console()
 
 
-def print_header():
+def print_header(engine: str = "Rule-Based Detection"):
     """
     Print IDS header for analysis output.
     """
@@ -12,7 +12,7 @@ def print_header():
         Panel(
             "AI-Assisted Intrusion Detection System\n"
             "Mode   : Offline Analysis\n"
-            "Engine : Rule-Based Detection",
+            f"Engine : {engine}",
             title="IDS Report",
             style="bold cyan"
         )
@@ -56,3 +56,14 @@ def print_alert(alert: dict):
             style=style
         )
     )
+
+
+def print_rollup(rollup: dict):
+    """
+    Print a one-line summary of rate-limited alerts.
+    """
+    console.print(
+        f"➕ +{rollup['suppressed']:,} more {rollup['alert_type']} "
+        f"from {rollup['src_ip']} (rate limited)",
+        style="yellow"
+    )